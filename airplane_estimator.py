@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# airplaneの把持点推定の共通部分
+#
+# pico_detect_airplane (imgs/airplanes/detect_airplane も同じ) と rs_detect_airplane は
+# 領域のマスクの作り方だけが異なり，輪郭の選択・角度・把持点の逆変換は共通である．
+# マスクの作成を差し替え可能な段階 (mask stage) とし，残りを AirplaneEstimator にまとめる．
+#
+#   "edge-morphology": pico のカメラ用．グレー画像を2値化し，領域が足りない場合はエッジ画像を
+#                      膨張・収縮・トリミングしてやり直す
+#   "R-plane":         RealSense 用．カラー画像のR平面を閾値処理して収縮・膨張する
+#
+# センサーごとの違い (compare_area の面積の上限，Correspondence の許容範囲など) は
+# SENSOR_PARAMS にまとめており，create_estimator(sensor) で推定器を作る．
+#
+# 途中経過は logging の "airplane_estimator" ロガーに DEBUG で出力する (既定では何も出力しない)．
+# 表示する場合は logging.basicConfig(level=logging.DEBUG) などで設定する．
+
+import collections
+import enum
+import json
+import logging
+import math
+
+import cv2
+import numpy as np
+
+import backprojection
+import contour_stats
+import frame_context
+import morphology
+import profiling
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# 推定失敗時の値
+UNKNOWN_POINT = (999, 999)
+UNKNOWN_ANGLE = 999
+
+
+class Status(enum.Enum):
+    OK = "ok"
+    # 輪郭が min_contours より少ない
+    NO_CONTOURS = "no-contours"
+    # 輪郭が max_contours 以上ある
+    TOO_MANY = "too-many"
+    # 面積の条件を満たす領域が2つ見つからない (尾と頭が同じ領域になる，または面積が0)
+    # 面積が0の場合は重心を求められないため，把持点・角度は推定失敗時の値になる
+    AREA_DEFAULT = "area-default"
+
+
+class GraspResult:
+    # status: Status
+    # point, angle, flag: 従来の estimate_grasppose_airplane の戻り値と同じ (把持点 (int), atan2 * 60, 表裏)
+    # 以下は診断用 (求めていない場合は None)
+    #   num_contours: 輪郭の数
+    #   tail_area, head_area: 尾と頭の領域の面積
+    #   tail, head: 尾と頭の領域の重心 (int に切り捨てたもの)
+    #   region: 尾と頭の領域を囲む矩形 (x, y, w, h)
+    #   depth, point_3d: 把持点の奥行き[m]とカメラ座標系の3次元の点[m] (depth_grasp.attach_depth を参照)
+    __slots__ = ("status", "point", "angle", "flag", "num_contours", "tail_area", "head_area", "tail", "head",
+                 "region", "depth", "point_3d")
+
+    def __init__(self, status=Status.OK, point=UNKNOWN_POINT, angle=UNKNOWN_ANGLE, flag="front"):
+        self.status = status
+        self.point = point
+        self.angle = angle
+        self.flag = flag
+        self.num_contours = None
+        self.tail_area = None
+        self.head_area = None
+        self.tail = None
+        self.head = None
+        self.region = None
+        self.depth = None
+        self.point_3d = None
+
+    @property
+    def ok(self):
+        return self.status is Status.OK
+
+    # 画像平面内の角度[rad] (angle は atan2 の結果を60倍した値)
+    @property
+    def angle_rad(self):
+        if self.angle == UNKNOWN_ANGLE:
+            return None
+        return self.angle / 60.0
+
+    # 従来の (把持点, 角度, 表裏) の形式に変換する
+    # 輪郭の数で失敗した場合と，AREA_DEFAULT で尾か頭の面積が0以下の場合は ((999, 999), 999, "front")．
+    # AREA_DEFAULT で尾と頭が同じ領域 (面積は正) の場合は，従来と同じくそのまま計算した値を返す
+    def to_tuple(self):
+        return self.point, self.angle, self.flag
+
+    # estimate_grasppose_airplane の details と同じ形式の辞書に書き込む
+    def write_details(self, details):
+        if self.num_contours is not None:
+            details["num_contours"] = self.num_contours
+        if self.region is not None:
+            details["tail_area"] = self.tail_area
+            details["head_area"] = self.head_area
+            details["region"] = self.region
+
+    def __repr__(self):
+        return "GraspResult(status={}, point={}, angle={}, flag={!r})".format(
+            self.status.value, self.point, self.angle, self.flag)
+
+
+class EdgeMorphologyMask:
+    name = "edge-morphology"
+
+    # expansion_ksize, contraction_ksize: やり直しのときの膨張・収縮の窓の大きさ
+    # expansion_threshold: やり直しのときの膨張で白にする近傍の白画素数 (この値を超えたら白)
+    def __init__(self, expansion_ksize=5, contraction_ksize=11, expansion_threshold=5):
+        self.expansion_ksize = expansion_ksize
+        self.contraction_ksize = contraction_ksize
+        self.expansion_threshold = expansion_threshold
+
+    # image: 膨張・収縮・トリミング済みのグレー画像, image_edge: エッジ検出したカラー画像
+    # 戻り値: (輪郭のリスト, 把持点を求めるときに回転する画像)
+    def __call__(self, image, image_edge, timer, frame):
+        with timer.stage("threshold"):
+            retval, image_bw = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU,
+                                             dst=frame.like("bw", image))
+
+        # 輪郭の検出
+        with timer.stage("find_contours"):
+            contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        # 裏向きは膨張と収縮のパラメータを変更する
+        if len(contours) <= 2:
+            logger.debug("Retry edge")
+
+            with timer.stage("morphology"):
+                image_con = cv2.cvtColor(image_edge, cv2.COLOR_BGR2GRAY,
+                                         dst=frame.buffer("retry_gray", image_edge.shape[:2]))
+                image_con = morphology.expansion(image_con, ksize=self.expansion_ksize,
+                                                 threshold=self.expansion_threshold,
+                                                 dst=frame.like("retry_expansion", image_con), frame=frame)
+                image_con = morphology.contraction(image_con, ksize=self.contraction_ksize,
+                                                   dst=frame.like("retry_contraction", image_con), frame=frame)
+                image_con = morphology.trim(image_con, dst=image_con)
+
+            image = image_con
+            with timer.stage("threshold"):
+                retval, image_bw = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU,
+                                                 dst=image_bw)
+            with timer.stage("find_contours"):
+                contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        return contours, image
+
+
+class RPlaneMask:
+    name = "R-plane"
+
+    # threshold_r: R平面の閾値
+    # ksize, iterations: 収縮・膨張の窓の大きさと膨張の回数
+    def __init__(self, threshold_r=40, ksize=5, iterations=6):
+        self.threshold_r = threshold_r
+        self.ksize = ksize
+        self.iterations = iterations
+
+    # image: カラー画像 (BGR), image_edge: 使わない
+    # 戻り値: (輪郭のリスト, 把持点を求めるときに回転する画像 (R平面))
+    def __call__(self, image, image_edge, timer, frame):
+        # 色領域の抜き出し（R平面を用いる）
+        with timer.stage("mask"):
+            shape = image.shape[:2]
+            image_mask, image_r = morphology.r_plane_mask(image, self.threshold_r, ksize=self.ksize,
+                                                          iterations=self.iterations,
+                                                          dst=frame.buffer("r_mask", shape),
+                                                          plane=frame.buffer("r_plane", shape))
+
+        # 輪郭の検出
+        with timer.stage("find_contours"):
+            contours, hierarchy = cv2.findContours(image_mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        return contours, image_r
+
+
+MASK_STAGES = {
+    EdgeMorphologyMask.name: EdgeMorphologyMask,
+    RPlaneMask.name: RPlaneMask,
+}
+
+# センサーごとの設定
+#   mask: マスクの段階の名前
+#   area_max: compare_area で無視する面積の下限 (画像全体を領域と認識してしまうため)
+#   min_area: 複数のairplaneを推定する場合に，これより小さい領域をノイズとして無視する
+#   window: Correspondence の許容範囲 (backprojection を参照)
+#   min_contours: 輪郭がこの数より少ない場合は unknown とする
+#   back_area: 2番目の領域の面積がこの値以上の場合は裏向きとする (None の場合は判定しない)
+SENSOR_PARAMS = {
+    "pico": dict(mask=EdgeMorphologyMask.name, area_max=3000, min_area=100, window=backprojection.PICO_WINDOW,
+                 min_contours=3, back_area=800),
+    "rs": dict(mask=RPlaneMask.name, area_max=30000, min_area=1000, window=backprojection.RS_WINDOW,
+               min_contours=2, back_area=None),
+}
+
+
+# センサー名から推定器を作る
+# mask_params: マスクの段階に渡す引数 (rs の threshold_r など)
+def create_estimator(sensor, **mask_params):
+    params = dict(SENSOR_PARAMS[sensor])
+    params["mask"] = MASK_STAGES[params["mask"]](**mask_params)
+
+    return AirplaneEstimator(**params)
+
+
+# 設定ファイル (tune_airplane.py が出力する JSON) から sensor の設定を読み込む
+# 設定ファイルの形式: {"rs": {"mask": {"threshold_r": 40, ...}}, "pico": {"mask": {...}, "preprocess": {...}}}
+#   mask: マスクの段階に渡す引数 (create_estimator の mask_params)
+#   preprocess: pico の前処理 (pico_detect_airplane.preprocess) の引数
+# それ以外のキー (探索の結果など) は無視する．sensor の設定がない場合は空の辞書を返す
+def load_config(path, sensor):
+    with open(path) as f:
+        config = json.load(f)
+
+    return config.get(sensor, {})
+
+
+def get_center(contours, id, stats=None):
+    if stats is None:
+        return contour_stats.center(contour_stats.compute([contours[id]]), 0)
+
+    contour_stats.fill(stats, contours, (id,))
+    return contour_stats.center(stats, id)
+
+
+# stats: contoursに対応する contour_stats の1行
+def get_rightedge(image, contours, frontback_flag, stats=None):
+    if stats is None:
+        stats = contour_stats.compute([contours])[0]
+
+    # 輪郭上で最も右にある点 (x が0以下の場合は見つからなかったものとして(0, 0))
+    pt = (0, 0)
+    if stats["right_x"] > 0:
+        pt = (stats["right_x"] - 8, stats["right_y"] - 10)
+
+    return pt
+
+
+# 尾 (pt1) から頭 (pt2) への角度
+# 角度は右向きが0度で時計回り (yの差分がマイナスのときは処理を変える)
+# 従来の実装に合わせて，atan2 の結果 [rad] を60倍した値を返す
+def grasp_angle(pt1, pt2):
+    if (pt2[1] - pt1[1]) >= 0:
+        angle = math.atan2(pt2[1] - pt1[1], pt2[0] - pt1[0])
+    else:
+        angle = math.atan2(pt1[1] - pt2[1], pt2[0] - pt1[0])
+        angle = -angle
+
+    return angle * 60
+
+
+# 領域を尾と頭の組にまとめる
+# ids: 候補の領域のid (stats の重心が計算済みであること)
+# 面積の大きい領域から順に尾とし，まだ使われていない領域のうち次の条件を満たす最も面積の大きい領域を頭とする
+# (1つの物体の場合に，面積が1番目と2番目の領域を組にする estimate と同じ考え方)
+#   - 面積が尾以下で，尾に対する面積比が min_ratio 以上
+#   - 重心間の距離が尾の面積の平方根の max_distance 倍以下
+# 戻り値: (尾のid, 頭のid) のリスト (尾の面積の大きい順)
+def pair_regions(stats, ids, max_distance=3.0, min_ratio=0.2):
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) < 2:
+        return []
+
+    # 面積の大きい順 (同じ面積は id の順) に並べる
+    ids = ids[np.argsort(-stats["area"][ids], kind="stable")]
+    area = stats["area"][ids]
+    cx = stats["m10"][ids] / area
+    cy = stats["m01"][ids] / area
+
+    # i を尾，j を頭としたときの正規化した距離と面積比 (i < j の組だけが候補)
+    distance = np.hypot(cx[:, None] - cx[None, :], cy[:, None] - cy[None, :]) / np.sqrt(area)[:, None]
+    ratio = area[None, :] / area[:, None]
+    valid = (ratio >= min_ratio) & (distance <= max_distance)
+    valid &= np.arange(len(ids))[:, None] < np.arange(len(ids))[None, :]
+
+    used = np.zeros(len(ids), dtype=np.bool_)
+    pairs = []
+    for tail in range(len(ids)):
+        if used[tail]:
+            continue
+        heads = np.flatnonzero(valid[tail] & ~used)
+        if len(heads) == 0:
+            continue
+        head = heads[0]
+        used[tail] = used[head] = True
+        pairs.append((int(ids[tail]), int(ids[head])))
+
+    return pairs
+
+
+# 小数の精度の推定結果
+#   point: 把持点 (x, y)
+#   tail, head: 尾と頭の領域の重心 (x, y)
+#   angle_deg, angle_rad: 尾から頭への角度 (右向きが0で時計回り)
+#   confidence: 頭の領域が3番目の領域とどれだけ区別できているか (0 から 1．pair_confidence を参照)
+#   flag: "front" or "back"
+class PreciseGrasp(collections.namedtuple("PreciseGrasp",
+                                          "point tail head angle_deg angle_rad confidence flag")):
+    __slots__ = ()
+
+    # 従来と同じ型の (把持点 (int), 角度, 表裏) に変換する
+    # 角度は従来と同じく atan2 の結果 [rad] を60倍した値
+    # 値は estimate の結果とは一致しない (estimate_precise を参照)．従来の結果が必要な場合は estimate を用いること
+    def to_tuple(self):
+        pt = (int(round(self.point[0])), int(round(self.point[1])))
+
+        return pt, self.angle_rad * 60, self.flag
+
+
+# 選んだ2つの領域の信頼度
+# 面積が area_max 未満の領域のうち，尾と頭以外で最大の領域 (3番目の領域) の面積を third，
+# 尾と頭の小さい方の面積を second として 1 - third / second (0 から 1 に制限) とする．
+# 3番目の領域が頭と同じくらいの大きさの場合は，どちらを頭とするかがあいまいなので0に近くなる．
+def pair_confidence(areas, tail_id, head_id, area_max):
+    areas = np.asarray(areas, dtype=np.float64)
+    second = min(areas[tail_id], areas[head_id])
+    if second <= 0:
+        return 0.0
+
+    others = np.delete(areas, (tail_id, head_id))
+    others = others[others < area_max]
+    third = others.max() if len(others) else 0.0
+
+    return float(np.clip(1.0 - third / second, 0.0, 1.0))
+
+
+class AirplaneEstimator:
+
+    # mask: マスクの段階 (名前または呼び出し可能なオブジェクト)
+    # 他の引数は SENSOR_PARAMS を参照
+    def __init__(self, mask, area_max, window, min_contours=2, max_contours=9, back_area=None, min_area=0):
+        if isinstance(mask, str):
+            mask = MASK_STAGES[mask]()
+        self.mask = mask
+        self.area_max = area_max
+        self.min_area = min_area
+        self.window = window
+        self.min_contours = min_contours
+        self.max_contours = max_contours
+        self.back_area = back_area
+
+    # 領域すべてを比較し，1番大きい領域と2番目に大きい領域のidを返す
+    # 全体を領域と認識してしまうため、閾値以上の面積を持つ領域は無視する
+    def compare_area(self, contours, stats=None):
+        if stats is None:
+            stats = contour_stats.compute(contours, ids=())
+
+        return contour_stats.select_top_two(stats["area"], self.area_max)
+
+    # 回転後の画素 pt に対応する回転前の画素を求める
+    # inverse: trans の逆行列 (None の場合はここで求める)
+    def correspondence(self, image, pt, trans, inverse=None):
+        if inverse is None:
+            inverse = backprojection.invert_affine(trans)
+
+        # 全画素をアフィン変換する代わりに，逆行列で対応点を求めて近傍だけを探索する
+        corr_pt = backprojection.backproject_pixel(pt, trans, image.shape, window=self.window, inverse=inverse)
+
+        # 許容範囲内に対応する画素がない場合は，逆変換した座標をそのまま用いる
+        if corr_pt is None:
+            corr_pt = backprojection.backproject_pixel(pt, trans, image.shape, inverse=inverse)
+
+        return corr_pt
+
+    # point_mode:
+    #   "warp"   画像全体を回転し，輪郭を抽出し直して右端を求める (従来の方法)
+    #   "points" contours (選択済みの領域の輪郭) の点だけを回転して右端を求める
+    # frame.rotations (backprojection.RotationCache) がある場合は，丸めた角度の回転行列と逆行列を使い回す
+    def get_point(self, image, angle_deg, frontback_flag, contours, timer=None, point_mode="warp", frame=None):
+        if timer is None:
+            timer = profiling.NULL_TIMER
+        if frame is None:
+            frame = frame_context.NULL_FRAME
+
+        height = image.shape[0]
+        width = image.shape[1]
+
+        # 回転の中心を画像の中心とした変換行列
+        rotation = None
+        inverse = None
+        if frame.rotations is not None:
+            rotation = frame.rotations.get(image.shape, angle_deg)
+            trans = rotation.trans
+            inverse = rotation.inverse
+        else:
+            center = (int(width/2), int(height/2))
+            trans = cv2.getRotationMatrix2D(center, angle_deg, 1.0)
+
+        if point_mode == "points":
+            # 画像全体は回転せず，領域の輪郭点だけを回転して右端を抽出
+            with timer.stage("rotate_points"):
+                x, y = contour_stats.rotated_right_point(contours, trans)
+            pt = (0, 0)
+            if x > 0:
+                pt = (x - 8, y - 10)
+        else:
+            # アフィン変換
+            with timer.stage("warp_affine"):
+                if rotation is not None:
+                    new_image_gray = rotation.warp(image, dst=frame.like("warp", image))
+                else:
+                    new_image_gray = cv2.warpAffine(image, trans, (width, height), dst=frame.like("warp", image))
+
+            # 輪郭の検出
+            with timer.stage("rotated_contours"):
+                retval, image_bw = cv2.threshold(new_image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU,
+                                                 dst=frame.like("warp_bw", image))
+                contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+                stats = contour_stats.compute(contours, ids=())
+                max_id, second_id = self.compare_area(contours, stats)
+
+            # 後ろ向きの際はidを入れ替える
+            if frontback_flag == "back":
+                max_id = second_id
+
+            # エッジ領域から右端を抽出
+            contour_stats.fill(stats, contours, (max_id,))
+            pt = get_rightedge(new_image_gray, contours[max_id], frontback_flag, stats[max_id])
+
+        # アフィン変換前の画素と対応付ける
+        with timer.stage("correspondence"):
+            pt_trans = self.correspondence(image, pt, trans, inverse)
+
+        return pt_trans
+
+    # 尾と頭の領域を選ぶ (estimate と estimate_precise で共通)
+    # result: GraspResult (status, num_contours, flag を書き込む)
+    # 戻り値: (輪郭のリスト, 把持点を求めるときに回転する画像, 統計量, 尾のid, 頭のid)
+    #         輪郭の数が範囲外の場合と，尾か頭の面積が0以下で重心を求められない場合は None
+    def select_regions(self, image, image_edge, timer, frame, result):
+        contours, image_point = self.mask(image, image_edge, timer, frame)
+        result.num_contours = len(contours)
+
+        # これでも正常に領域が取れない場合は、unknownと判定する
+        if len(contours) < self.min_contours or len(contours) >= self.max_contours:
+            result.status = Status.NO_CONTOURS if len(contours) < self.min_contours else Status.TOO_MANY
+            logger.debug("Cannot recognize edge. It is not airplane. (%d contours)", len(contours))
+            return None
+
+        # 最大の領域と二番目の領域を推定
+        with timer.stage("compare_area"):
+            stats = contour_stats.compute(contours, ids=())
+            max_id, second_id = self.compare_area(contours, stats)
+
+        if max_id == second_id or stats["area"][max_id] <= 0 or stats["area"][second_id] <= 0:
+            result.status = Status.AREA_DEFAULT
+            logger.debug("Area size default. It is unknown.")
+            # 面積が0の領域は重心が NaN になる (従来は ZeroDivisionError) ため，ここで打ち切る
+            if stats["area"][max_id] <= 0 or stats["area"][second_id] <= 0:
+                return None
+
+        if self.back_area is not None and stats["area"][second_id] >= self.back_area:
+            result.flag = "back"
+            logger.debug("This airplane is backward!!!!")
+            max_id, second_id = second_id, max_id
+
+        # 各領域の重心などを求める
+        with timer.stage("center"):
+            contour_stats.fill(stats, contours, (max_id, second_id))
+
+        return contours, image_point, stats, max_id, second_id
+
+    # 把持点・角度・表裏を推定する
+    # image: マスクの段階に渡す画像 (edge-morphology はグレー画像，R-plane はカラー画像)
+    # image_edge: エッジ検出したカラー画像 (edge-morphology のみ)
+    # timer: profiling.StageTimer を渡すと各段階の処理時間を記録する
+    # point_mode: 把持点の求め方 (get_point を参照)
+    # details: 辞書を渡すと輪郭の数・尾と頭の面積・2つの領域を囲む矩形 (x, y, w, h) を書き込む
+    # frame: frame_context.FrameContext を渡すと画像サイズの作業用配列をフレーム間で使い回す
+    # 戻り値: (把持点, 角度, "front" or "back")．推定できない場合は ((999, 999), 999, "front")
+    #         (estimate_result の結果を従来の形式にしたもの)
+    def estimate(self, image, image_edge=None, timer=None, point_mode="warp", details=None, frame=None):
+        result = self.estimate_result(image, image_edge, timer=timer, point_mode=point_mode, frame=frame)
+        if details is not None:
+            result.write_details(details)
+
+        return result.to_tuple()
+
+    # estimate と同じ推定を行い，GraspResult を返す
+    def estimate_result(self, image, image_edge=None, timer=None, point_mode="warp", frame=None):
+        if timer is None:
+            timer = profiling.NULL_TIMER
+        if frame is None:
+            frame = frame_context.NULL_FRAME
+
+        result = GraspResult()
+        selected = self.select_regions(image, image_edge, timer, frame, result)
+        if selected is None:
+            return result
+        contours, image_point, stats, max_id, second_id = selected
+
+        # 各領域の重心 (int に切り捨て) を求めて、その角度を算出
+        result.tail = contour_stats.center(stats, max_id)
+        result.head = contour_stats.center(stats, second_id)
+        result.angle = grasp_angle(result.tail, result.head)
+        result.point = self.get_point(image_point, result.angle, result.flag, contours[max_id], timer=timer,
+                                      point_mode=point_mode, frame=frame)
+
+        result.tail_area = float(stats["area"][max_id])
+        result.head_area = float(stats["area"][second_id])
+        x0 = min(stats["x"][max_id], stats["x"][second_id])
+        y0 = min(stats["y"][max_id], stats["y"][second_id])
+        x1 = max(stats["x"][max_id] + stats["w"][max_id], stats["x"][second_id] + stats["w"][second_id])
+        y1 = max(stats["y"][max_id] + stats["h"][max_id], stats["y"][second_id] + stats["h"][second_id])
+        result.region = (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+
+        logger.debug("tail_areasize %s head_areasize %s tail_position %s head_position %s angle %s point %s",
+                     result.tail_area, result.head_area, result.tail, result.head, result.angle, result.point)
+
+        return result
+
+    # 把持点・角度を小数の精度で推定する
+    # 重心は切り捨てずにモーメントから求め，角度は度 (atan2 の結果を60倍したものではない) で画像を回転する．
+    # 把持点は輪郭点の回転 (point_mode="points" と同じ) と逆変換で求め，近傍の画素の探索は行わない．
+    # estimate は atan2 の結果を60倍した値を度として回転するため，回転後に右端となる輪郭点が異なり，
+    # 把持点は estimate(point_mode="points") と数十画素異なることがある (imgs/airplanes の frame0024, 0026, 0028)．
+    # point_mode="warp" の結果とはさらに大きく異なる．そのため to_tuple() は estimate の代わりにはならない．
+    # 戻り値: PreciseGrasp．推定できない場合 (輪郭の数が範囲外，尾か頭の面積が0以下) は None
+    def estimate_precise(self, image, image_edge=None, timer=None, frame=None):
+        if timer is None:
+            timer = profiling.NULL_TIMER
+        if frame is None:
+            frame = frame_context.NULL_FRAME
+
+        result = GraspResult()
+        selected = self.select_regions(image, image_edge, timer, frame, result)
+        if selected is None:
+            return None
+        contours, image_point, stats, max_id, second_id = selected
+        frontback_flag = result.flag
+
+        tail = contour_stats.centroid(stats, max_id)
+        head = contour_stats.centroid(stats, second_id)
+        angle_rad = math.atan2(head[1] - tail[1], head[0] - tail[0])
+
+        with timer.stage("rotate_points"):
+            height, width = image_point.shape[:2]
+            trans = cv2.getRotationMatrix2D((int(width/2), int(height/2)), math.degrees(angle_rad), 1.0)
+            x, y = contour_stats.rotated_right_point(contours[max_id], trans, rounding=False)
+            pt = (0.0, 0.0)
+            if x > 0:
+                pt = (x - 8, y - 10)
+
+        with timer.stage("correspondence"):
+            point = backprojection.backproject_point(pt, trans)
+
+        confidence = pair_confidence(stats["area"], max_id, second_id, self.area_max)
+
+        return PreciseGrasp((float(point[0]), float(point[1])), tail, head, math.degrees(angle_rad), angle_rad,
+                            confidence, frontback_flag)
+
+    # 1枚の画像に写っている複数のairplaneの把持点を推定する
+    # マスクの作成と輪郭の抽出は1回だけ行い，領域を pair_regions で尾と頭の組にまとめる．
+    # 物体ごとに画像全体を回転して閾値処理し直さないよう，把持点は常に "points" の方法で求める．
+    # max_distance, min_ratio: pair_regions を参照
+    # 戻り値: (把持点, 角度, "front" or "back") のリスト (尾の面積の大きい順．見つからない場合は空)
+    def estimate_all(self, image, image_edge=None, timer=None, frame=None, max_distance=3.0, min_ratio=0.2):
+        if timer is None:
+            timer = profiling.NULL_TIMER
+        if frame is None:
+            frame = frame_context.NULL_FRAME
+
+        contours, image_point = self.mask(image, image_edge, timer, frame)
+
+        with timer.stage("compare_area"):
+            stats = contour_stats.compute(contours, ids=())
+            areas = stats["area"]
+            ids = np.flatnonzero((areas >= max(self.min_area, 1)) & (areas < self.area_max))
+
+        with timer.stage("center"):
+            contour_stats.fill(stats, contours, ids)
+            pairs = pair_regions(stats, ids, max_distance, min_ratio)
+
+        results = []
+        for tail_id, head_id in pairs:
+            frontback_flag = "front"
+            if self.back_area is not None and stats["area"][head_id] >= self.back_area:
+                frontback_flag = "back"
+                tail_id, head_id = head_id, tail_id
+
+            pt1 = contour_stats.center(stats, tail_id)
+            pt2 = contour_stats.center(stats, head_id)
+            angle_deg = grasp_angle(pt1, pt2)
+            pt = self.get_point(image_point, angle_deg, frontback_flag, contours[tail_id], timer=timer,
+                                point_mode="points", frame=frame)
+
+            logger.debug("tail_areasize %s head_areasize %s tail_position %s head_position %s angle %s point %s",
+                         stats["area"][tail_id], stats["area"][head_id], pt1, pt2, angle_deg, pt)
+            results.append((pt, angle_deg, frontback_flag))
+
+        return results
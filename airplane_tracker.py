@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 連続したフレームでairplaneを追跡しながら把持点を推定する
+#
+# 前のフレームで見つけた領域 (尾と頭を囲む矩形) の周辺だけを処理し，
+# 結果が不正な場合 (輪郭の数・面積の確認に失敗した場合) は画像全体で推定し直す．
+# smoothing を指定した場合は，角度と把持点を指数移動平均で平滑化する．
+#
+# point_mode は "points" を既定とする．"warp" では回転後の画像全体を閾値処理し直すため，
+# 把持点がROIの切り出し方によって変わってしまう．
+#
+# 結果が妥当かどうかは推定器の GraspResult.status (輪郭の数は推定器の min_contours / max_contours，
+# 面積が0以下の場合は AREA_DEFAULT) と，尾と頭の面積が推定器の area_max 未満であることで判定する．
+# 推定器を指定しない場合は rs_detect_airplane の推定器 (読み込んだ設定ファイルと threshold_r を反映したもの) を使う．
+
+import math
+
+import airplane_estimator
+import rs_detect_airplane
+
+
+# 推定失敗時の値
+UNKNOWN = (airplane_estimator.UNKNOWN_POINT, airplane_estimator.UNKNOWN_ANGLE)
+
+# estimate_grasppose_airplane の角度は atan2 の結果 [rad] を60倍したものなので，一周は 2π×60
+ANGLE_PERIOD = 2.0 * math.pi * 60
+
+
+class AirplaneTracker:
+
+    # threshold_r: R平面の閾値 (estimator を指定しない場合に使う．None の場合は設定ファイルの値)
+    # padding: 前のフレームの領域の周囲に加える余白[px]
+    # smoothing: 平滑化の係数 (0の場合は平滑化しない．1に近いほど過去の値を重視する)
+    # estimator: airplane_estimator.AirplaneEstimator (None の場合は rs_detect_airplane の推定器)
+    def __init__(self, threshold_r=None, padding=40, smoothing=0.0, point_mode="points", estimator=None):
+        self.threshold_r = threshold_r
+        self.padding = padding
+        self.smoothing = smoothing
+        self.point_mode = point_mode
+        self.estimator = estimator
+        self.reset()
+
+    # 追跡の状態と統計を初期化する
+    def reset(self):
+        self.lose_track()
+        self.roi_hits = 0
+        self.full_frames = 0
+
+    # 追跡の状態 (前のフレームの領域と平滑化した把持点・角度) を捨てる
+    # 見失った後に見つけた結果を，見失う前の値と平滑化しないようにする
+    def lose_track(self):
+        self.region = None
+        self.pt = None
+        self.angle = None
+        self.flag = None
+
+    # 使う推定器 (rs_detect_airplane.load_config で設定が変わった場合にも追従する)
+    def get_estimator(self):
+        if self.estimator is not None:
+            return self.estimator
+
+        return rs_detect_airplane.get_estimator(self.threshold_r)
+
+    # image (と image_edge) の roi (x0, y0, x1, y1) の範囲を推定し，画像全体の座標にした GraspResult を返す
+    # image_edge: エッジ検出したカラー画像 (pico の推定器のみ)
+    def estimate(self, estimator, image, image_edge=None, roi=None):
+        if roi is None:
+            return estimator.estimate_result(image, image_edge, point_mode=self.point_mode)
+
+        x0, y0, x1, y1 = roi
+        if image_edge is not None:
+            image_edge = image_edge[y0:y1, x0:x1]
+        result = estimator.estimate_result(image[y0:y1, x0:x1], image_edge, point_mode=self.point_mode)
+
+        # ROIの座標を画像全体の座標に戻す
+        if result.angle != airplane_estimator.UNKNOWN_ANGLE:
+            result.point = (result.point[0] + x0, result.point[1] + y0)
+        if result.region is not None:
+            x, y, w, h = result.region
+            result.region = (x + x0, y + y0, w, h)
+
+        return result
+
+    # 推定結果が妥当かどうか (推定器の輪郭の数・面積の確認と，面積の上限)
+    def is_valid(self, estimator, result):
+        if not result.ok or result.region is None:
+            return False
+
+        return result.tail_area < estimator.area_max and result.head_area < estimator.area_max
+
+    # 前のフレームの領域に余白を加えたROI (x0, y0, x1, y1) を返す
+    def padded_roi(self, shape):
+        height, width = shape[:2]
+        x, y, w, h = self.region
+
+        return (max(x - self.padding, 0), max(y - self.padding, 0),
+                min(x + w + self.padding, width), min(y + h + self.padding, height))
+
+    # 領域がROIの境界に接しているか (画像の端と一致する境界は除く)
+    # 接している場合は物体がROIの外にはみ出している可能性がある
+    def touches_roi_border(self, region, roi, shape):
+        height, width = shape[:2]
+        x, y, w, h = region
+        x0, y0, x1, y1 = roi
+
+        return ((x <= x0 and x0 > 0) or (y <= y0 and y0 > 0)
+                or (x + w >= x1 and x1 < width) or (y + h >= y1 and y1 < height))
+
+    # 1フレーム分の推定を行い，(pt, angle_deg, frontback_flag) を返す
+    # image: 推定器に渡す画像 (rs はカラー画像，pico は前処理したグレー画像)
+    # image_edge: エッジ検出したカラー画像 (pico の推定器のみ)
+    def update(self, image, image_edge=None):
+        estimator = self.get_estimator()
+        result = None
+        if self.region is not None:
+            roi = self.padded_roi(image.shape)
+            roi_result = self.estimate(estimator, image, image_edge, roi)
+            if self.is_valid(estimator, roi_result) and not self.touches_roi_border(roi_result.region, roi,
+                                                                                    image.shape):
+                result = roi_result
+                self.roi_hits += 1
+
+        if result is None:
+            result = self.estimate(estimator, image, image_edge)
+            self.full_frames += 1
+            if not self.is_valid(estimator, result):
+                self.lose_track()
+                return UNKNOWN + (result.flag,)
+
+        self.region = result.region
+        self.smooth(result.point, result.angle)
+        self.flag = result.flag
+
+        return (int(round(self.pt[0])), int(round(self.pt[1]))), self.angle, self.flag
+
+    # 角度と把持点を指数移動平均で平滑化する
+    def smooth(self, pt, angle):
+        if self.smoothing <= 0 or self.pt is None:
+            self.pt = (float(pt[0]), float(pt[1]))
+            self.angle = angle
+            return
+
+        a = self.smoothing
+        self.pt = (a * self.pt[0] + (1 - a) * pt[0], a * self.pt[1] + (1 - a) * pt[1])
+
+        # 角度は周期を考慮して差分を求める
+        diff = (angle - self.angle + ANGLE_PERIOD / 2) % ANGLE_PERIOD - ANGLE_PERIOD / 2
+        self.angle = self.angle + (1 - a) * diff
+        self.angle = (self.angle + ANGLE_PERIOD / 2) % ANGLE_PERIOD - ANGLE_PERIOD / 2
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# アフィン変換後の座標から変換前の画素を求める (Correspondence の置き換え)
+#
+# 元の Correspondence は全画素をアフィン変換して目的の座標に対応する画素を探していたが，
+# ここでは cv2.getRotationMatrix2D の行列を一度だけ逆変換して定数時間で対応点を求める．
+# window を指定した場合は，元の実装と同じ許容範囲 (±2, ±20 画素) の探索規則で
+# 対応点をスナップする．探索は逆変換した点の近傍の画素だけに限定する．
+
+import collections
+
+import cv2
+import numpy as np
+
+
+# 許容範囲 (x_lo, x_hi, y_lo, y_hi)
+# 変換後の座標 check が pt[0]+x_lo < check[0] <= pt[0]+x_hi かつ
+# pt[1]+y_lo <= check[1] < pt[1]+y_hi を満たす画素を対応点の候補とする
+PICO_WINDOW = (-2, 0, 0, 2)
+RS_WINDOW = (-20, 20, -20, 20)
+
+
+# アフィン変換行列の逆行列を求める
+def invert_affine(trans):
+    return cv2.invertAffineTransform(np.asarray(trans, dtype=np.float64))
+
+
+# 変換後の座標 pt を変換前の座標 (float) に戻す
+def backproject_point(pt, trans, inverse=None):
+    if inverse is None:
+        inverse = invert_affine(trans)
+    x = inverse[0, 0] * pt[0] + inverse[0, 1] * pt[1] + inverse[0, 2]
+    y = inverse[1, 0] * pt[0] + inverse[1, 1] * pt[1] + inverse[1, 2]
+
+    return x, y
+
+
+# 変換後の座標 pt に対応する変換前の画素 (int) を求める
+# window が None の場合は逆変換した座標を丸めて返す
+# window を指定した場合は元の Correspondence と同じ規則で対応点を選ぶ
+#   - 変換後の座標が pt と一致する画素があれば，ラスタ順で最初の画素
+#   - なければ，許容範囲に入る画素のうちラスタ順で最後の画素
+#   - どちらもなければ None
+def backproject_pixel(pt, trans, image_shape, window=None, inverse=None):
+    if inverse is None:
+        inverse = invert_affine(trans)
+
+    if window is None:
+        x, y = backproject_point(pt, trans, inverse)
+        return int(round(x)), int(round(y))
+
+    height, width = image_shape[:2]
+    x_lo, x_hi, y_lo, y_hi = window
+
+    # int() は0方向への切り捨てなので，許容範囲を1画素広げた領域を逆変換して探索範囲とする
+    corners = np.array([
+        [pt[0] + x_lo - 1, pt[1] + y_lo - 1],
+        [pt[0] + x_hi + 1, pt[1] + y_lo - 1],
+        [pt[0] + x_lo - 1, pt[1] + y_hi + 1],
+        [pt[0] + x_hi + 1, pt[1] + y_hi + 1],
+    ], dtype=np.float64)
+    src = corners @ inverse[:, :2].T + inverse[:, 2]
+    x_min = max(int(np.floor(src[:, 0].min())) - 1, 0)
+    x_max = min(int(np.ceil(src[:, 0].max())) + 1, width - 1)
+    y_min = max(int(np.floor(src[:, 1].min())) - 1, 0)
+    y_max = min(int(np.ceil(src[:, 1].max())) + 1, height - 1)
+    if x_min > x_max or y_min > y_max:
+        return None
+
+    # ラスタ順 (y が外側，x が内側) に候補画素を並べる
+    ys, xs = np.mgrid[y_min:y_max + 1, x_min:x_max + 1]
+    xs = xs.ravel()
+    ys = ys.ravel()
+
+    trans = np.asarray(trans, dtype=np.float64)
+    check_x = (trans[0, 0] * xs + trans[0, 1] * ys + trans[0, 2]).astype(np.int64)
+    check_y = (trans[1, 0] * xs + trans[1, 1] * ys + trans[1, 2]).astype(np.int64)
+
+    matched = ((pt[0] + x_lo < check_x) & (check_x <= pt[0] + x_hi)
+               & (pt[1] + y_lo <= check_y) & (check_y < pt[1] + y_hi))
+    exact = matched & (check_x == pt[0]) & (check_y == pt[1])
+
+    if exact.any():
+        i = int(np.argmax(exact))
+    elif matched.any():
+        i = len(matched) - 1 - int(np.argmax(matched[::-1]))
+    else:
+        return None
+
+    return int(xs[i]), int(ys[i])
+
+
+# 1つの (画像の形状, 角度) に対する回転
+#   angle_deg: 量子化した角度[deg]
+#   trans, inverse: 画像の中心を回転の中心とした変換行列とその逆行列
+#   use_maps: True の場合は warp で warpAffine の代わりに remap を用いる
+#   maps: remap 用のマップ (use_maps が True の場合に，最初に warp したときに作る)
+class Rotation:
+    __slots__ = ("shape", "angle_deg", "trans", "inverse", "use_maps", "maps")
+
+    def __init__(self, shape, angle_deg, use_maps=False):
+        height, width = shape
+        self.shape = shape
+        self.angle_deg = angle_deg
+        self.trans = cv2.getRotationMatrix2D((int(width/2), int(height/2)), angle_deg, 1.0)
+        self.inverse = invert_affine(self.trans)
+        self.use_maps = use_maps
+        self.maps = None
+
+    # 画像を回転する
+    def warp(self, image, dst=None):
+        height, width = self.shape
+        if not self.use_maps:
+            return cv2.warpAffine(image, self.trans, (width, height), dst=dst)
+
+        if self.maps is None:
+            ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+            map_x = self.inverse[0, 0] * xs + self.inverse[0, 1] * ys + self.inverse[0, 2]
+            map_y = self.inverse[1, 0] * xs + self.inverse[1, 1] * ys + self.inverse[1, 2]
+            self.maps = cv2.convertMaps(map_x.astype(np.float32), map_y.astype(np.float32), cv2.CV_16SC2)
+
+        return cv2.remap(image, self.maps[0], self.maps[1], cv2.INTER_LINEAR, dst=dst)
+
+
+# 角度を量子化して回転行列・逆行列 (と remap のマップ) を使い回すキャッシュ
+#
+# frame_context.FrameContext(rotations=RotationCache()) として推定関数に渡すと get_point で使われる
+# (FrameContext の既定では使わない)．
+# 使い回せるのは回転行列と逆行列の計算 (数マイクロ秒) だけで，処理時間の大半は warpAffine なので，
+# imgs/airplanes では p50 の差は測定誤差の範囲で，速くならなかった (bench_rotation_cache.py を参照)．
+#
+# 既定の step_deg=0 では角度を丸めず，同じ角度のときだけ再利用する (結果は使わない場合と一致する)．
+# step_deg を正にすると丸めた角度の回転を再利用してヒット率は上がるが，丸めた角度で回転するため把持点がずれる．
+# 把持点は回転後の輪郭の右端なので，角度のわずかな差でも右端が辺の反対側に移ることがあり，
+# imgs/airplanes では step_deg=0.1 で最大1.4画素，step_deg=1 で数十画素ずれた．
+#
+# step_deg: 角度を丸める幅[deg] (0 の場合は丸めない)
+# maxsize: 保持する回転の数の上限 (超えた場合は最も長く使われていないものを捨てる)
+# maps: True の場合は warpAffine の代わりに remap で回転する．
+#       マップは1画素あたり6バイトを使い，warpAffine とは補間の丸めがわずかに異なる．
+#       640x480 の画像では warpAffine の方が速かったため，既定では使わない
+class RotationCache:
+
+    def __init__(self, step_deg=0.0, maxsize=64, maps=False):
+        self.step_deg = step_deg
+        self.maxsize = maxsize
+        self.maps = maps
+        self.entries = collections.OrderedDict()
+        # キャッシュの大きさを決めるための統計
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize(self, angle_deg):
+        if self.step_deg <= 0:
+            return float(angle_deg)
+        return round(angle_deg / self.step_deg) * self.step_deg
+
+    # shape (高さ, 幅) の画像を angle_deg 回転する Rotation を返す
+    def get(self, shape, angle_deg):
+        key = (tuple(shape[:2]), self.quantize(angle_deg))
+        rotation = self.entries.get(key)
+        if rotation is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return rotation
+
+        self.misses += 1
+        rotation = Rotation(key[0], key[1], self.maps)
+        self.entries[key] = rotation
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+        return rotation
+
+    def __len__(self):
+        return len(self.entries)
+
+    # 保持しているマップの合計サイズ[byte]
+    @property
+    def nbytes(self):
+        return sum(m.nbytes for r in self.entries.values() if r.maps is not None for m in r.maps)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 複数フレームに対してairplaneの把持点推定をまとめて行う
+#
+# 使い方:
+#   python batch_grasp.py "imgs/airplanes/frame*.jpg" -o result.jsonl
+#   python batch_grasp.py imgs/airplanes --sensor pico --workers 4
+#   python batch_grasp.py imgs/airplanes --profile -o result.jsonl && python profiling.py result.jsonl
+#
+# 1フレームごとに1行のJSONを出力する
+#   {"path": ..., "status": "ok" など, "pt": [x, y], "angle": 角度, "flag": "front" or "back", "time": 処理時間[s]}
+# status は airplane_estimator.Status の値 (推定できない場合も pt, angle には従来と同じ 999 を記録する)
+# 画像が読み込めない場合や例外が起きた場合は "error" に内容を記録する
+# --profile を指定した場合は "stages" に各段階の処理時間を記録する
+# -v を指定した場合は推定の途中経過を標準エラー出力に表示する
+# --config を指定した場合は tune_airplane.py が出力した設定ファイルのパラメータで推定する
+
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+import frame_context
+import pico_detect_airplane
+import profiling
+import rs_detect_airplane
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# ディレクトリまたはglobのパターンから画像のパスを列挙する
+def list_frames(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for name in sorted(os.listdir(pattern)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(pattern, name))
+        else:
+            paths.extend(sorted(glob.glob(pattern)))
+
+    return paths
+
+
+# pico: エッジ画像を膨張・収縮・トリミングしてから推定する
+# frame: frame_context.FrameContext を渡すと作業用の配列をフレーム間で使い回す
+# 戻り値: airplane_estimator.GraspResult
+def estimate_pico(image_bgr, timer=None, frame=None):
+    if timer is None:
+        timer = profiling.NULL_TIMER
+    if frame is None:
+        frame = frame_context.NULL_FRAME
+
+    with timer.stage("preprocess"):
+        image_gray = pico_detect_airplane.preprocess(image_bgr, frame=frame)
+
+    return pico_detect_airplane.estimate_grasppose_airplane_result(image_gray, image_bgr, timer=timer, frame=frame)
+
+
+# rs: カラー画像をそのまま入力とする
+def estimate_rs(image_bgr, timer=None, frame=None):
+    return rs_detect_airplane.estimate_grasppose_airplane_result(image_bgr, timer=timer, frame=frame)
+
+
+ESTIMATORS = {"pico": estimate_pico, "rs": estimate_rs}
+
+
+# 設定ファイルを読み込む (ワーカープロセスの初期化でも呼ばれる)
+def load_config(path):
+    if path:
+        pico_detect_airplane.load_config(path)
+        rs_detect_airplane.load_config(path)
+
+# ワーカープロセスごとに1つ持ち，フレーム間で作業用の配列を使い回す
+_frame = None
+
+
+# 1フレーム分の処理 (ワーカープロセスで実行される)
+def process_frame(task):
+    global _frame
+    if _frame is None:
+        _frame = frame_context.FrameContext()
+
+    path, sensor, profile = task
+    record = {"path": path}
+    timer = None
+    if profile:
+        timer = profiling.StageTimer(memory=(profile == "memory"))
+
+    start = time.perf_counter()
+    image_bgr = cv2.imread(path)
+    if image_bgr is None:
+        record["error"] = "cannot read image"
+        return record
+
+    try:
+        result = ESTIMATORS[sensor](image_bgr, timer=timer, frame=_frame)
+    except Exception as e:
+        record["error"] = repr(e)
+    else:
+        pt, angle, flag = result.to_tuple()
+        record["status"] = result.status.value
+        record["pt"] = [int(pt[0]), int(pt[1])]
+        record["angle"] = float(angle)
+        record["flag"] = flag
+    record["time"] = time.perf_counter() - start
+    if timer is not None:
+        record["stages"] = timer.flush()
+
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="estimate airplane grasp poses for many frames")
+    parser.add_argument("frames", nargs="+", help="directories or glob patterns of frames")
+    parser.add_argument("--sensor", choices=sorted(ESTIMATORS), default="rs")
+    parser.add_argument("-o", "--output", default="-", help="output JSON lines file (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=4)
+    parser.add_argument("--profile", action="store_true", help="record per-stage timings")
+    parser.add_argument("--profile-memory", action="store_true", help="also record per-stage allocations (slow)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log estimation details to stderr")
+    parser.add_argument("--config", help="parameter file written by tune_airplane.py")
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG, stream=sys.stderr)
+
+    paths = list_frames(args.frames)
+    if not paths:
+        parser.error("no frames found")
+    profile = None
+    if args.profile_memory:
+        profile = "memory"
+    elif args.profile:
+        profile = "time"
+    tasks = [(path, args.sensor, profile) for path in paths]
+
+    if args.output == "-":
+        out = sys.stdout
+    else:
+        out = open(args.output, "w")
+
+    pool = None
+    if args.workers > 1:
+        pool = multiprocessing.Pool(min(args.workers, len(tasks)), initializer=load_config, initargs=(args.config,))
+        records = pool.imap(process_frame, tasks, chunksize=args.chunksize)
+    else:
+        load_config(args.config)
+        records = map(process_frame, tasks)
+
+    try:
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
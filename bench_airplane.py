@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# imgs/airplanes のフレームで把持点推定の速度と結果を検証するベンチマーク
+#
+# 使い方:
+#   python bench_airplane.py                  # 計測して golden と比較 (差があれば終了コード1)
+#   python bench_airplane.py --update-golden  # 現在の推定結果を golden として保存
+#   python bench_airplane.py --save-baseline  # 現在の処理時間を baseline として保存
+#   python bench_airplane.py --make-pico-frames  # imgs/airplanes/pico のフレームを作り直す
+#
+# rs は imgs/airplanes のカラー画像，pico は imgs/airplanes/pico のエッジ画像で推定する．
+# pico の実機のフレームはないため，pico のフレームは rs のフレームから make_pico_frame で作ったもの
+# (airplane の近傍のエッジだけを残した画像) で，推定に成功するフレームと輪郭が多すぎて失敗するフレームを含む．
+#
+# golden (imgs/airplanes/golden.json) には各フレームの把持点・角度・表裏の結果を保存する．
+# baseline (bench_baseline.json) には計測した環境での処理時間を保存する．
+# 処理時間は環境に依存するため，baseline はリポジトリには含めず各環境で作成する．
+#
+# 判定:
+#   - 把持点が --max-shift 画素より大きく移動した，角度が --max-angle-diff より変化した，
+#     または表裏の判定が変わった場合は失敗
+#     (角度は従来の値 (atan2 の結果[rad] を60倍したもの) のまま比べる．度ではない)
+#   - baseline がある場合，p50 の処理時間が baseline の --max-slowdown 倍を超えたら失敗
+#   - 合成した入力 (check_synthetic を参照) で推定の結果が期待と異なる，または例外が起きた場合は失敗
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import airplane_estimator
+import morphology
+import pico_detect_airplane
+from batch_grasp import ESTIMATORS
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_PATTERN = os.path.join(ROOT_DIR, "imgs", "airplanes", "frame*.jpg")
+PICO_FRAME_DIR = os.path.join(ROOT_DIR, "imgs", "airplanes", "pico")
+FRAME_PATTERNS = {"pico": os.path.join(PICO_FRAME_DIR, "edge*.png"), "rs": FRAME_PATTERN}
+GOLDEN_PATH = os.path.join(ROOT_DIR, "imgs", "airplanes", "golden.json")
+
+
+# rs のカラー画像から pico のカメラの出力に相当するエッジ画像を作る
+# Canny のエッジのうち，R平面のマスク (airplane の領域) の近傍にあるものだけを残す
+def make_pico_frame(image_bgr):
+    image_gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+    mask, _ = morphology.r_plane_mask(image_bgr)
+    edges = cv2.Canny(image_gray, 50, 150)
+    cv2.bitwise_and(edges, cv2.dilate(mask, morphology.rect_kernel(15)), dst=edges)
+
+    return cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+
+
+# imgs/airplanes の frameXXXX.jpg から imgs/airplanes/pico/edgeXXXX.png を作る
+def make_pico_frames():
+    os.makedirs(PICO_FRAME_DIR, exist_ok=True)
+    for path in sorted(glob.glob(FRAME_PATTERN)):
+        name = os.path.splitext(os.path.basename(path))[0].replace("frame", "edge") + ".png"
+        cv2.imwrite(os.path.join(PICO_FRAME_DIR, name), make_pico_frame(cv2.imread(path)))
+
+
+# センサーの (フレーム名, 画像) のリスト
+def load_frames(sensor):
+    return [(os.path.basename(path), cv2.imread(path)) for path in sorted(glob.glob(FRAME_PATTERNS[sensor]))]
+
+
+# GraspResult を golden の形式の辞書にする
+def to_record(result):
+    pt, angle, flag = result.to_tuple()
+
+    return {"pt": [int(pt[0]), int(pt[1])], "angle": float(angle), "flag": flag}
+
+
+def run_estimator(estimate, image_bgr):
+    return to_record(estimate(image_bgr))
+
+
+# 1つの推定器について結果・処理時間・メモリのピークを計測する
+def measure(estimate, frames, repeat):
+    results = {}
+    for name, image in frames:
+        results[name] = run_estimator(estimate, image)
+
+    times = []
+    start_all = time.perf_counter()
+    for _ in range(repeat):
+        for name, image in frames:
+            start = time.perf_counter()
+            run_estimator(estimate, image)
+            times.append(time.perf_counter() - start)
+    total = time.perf_counter() - start_all
+
+    # メモリの計測は処理時間に影響するため別に行う
+    tracemalloc.start()
+    peak = 0
+    for name, image in frames:
+        tracemalloc.reset_peak()
+        run_estimator(estimate, image)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    times = np.array(times) * 1000.0
+    stats = {
+        "fps": len(times) / total,
+        "p50_ms": float(np.percentile(times, 50)),
+        "p99_ms": float(np.percentile(times, 99)),
+        "peak_bytes": int(peak),
+    }
+
+    return results, stats
+
+
+# 1フレームの結果を期待値と比較し，差分のメッセージのリストを返す (一致する場合は空)
+def match_result(actual, expected, max_shift, max_angle_diff):
+    errors = []
+    shift = np.hypot(actual["pt"][0] - expected["pt"][0], actual["pt"][1] - expected["pt"][1])
+    if shift > max_shift:
+        errors.append("pt {} -> {} ({:.1f} px)".format(expected["pt"], actual["pt"], shift))
+    if abs(actual["angle"] - expected["angle"]) > max_angle_diff:
+        errors.append("angle {:.2f} -> {:.2f}".format(expected["angle"], actual["angle"]))
+    if actual["flag"] != expected["flag"]:
+        errors.append("flag {} -> {}".format(expected["flag"], actual["flag"]))
+
+    return errors
+
+
+# golden と結果を比較し，差分のメッセージのリストを返す
+def compare_results(sensor, results, golden, max_shift, max_angle_diff):
+    errors = []
+    for name, expected in golden.items():
+        actual = results.get(name)
+        if actual is None:
+            errors.append("{} {}: missing".format(sensor, name))
+            continue
+        for error in match_result(actual, expected, max_shift, max_angle_diff):
+            errors.append("{} {}: {}".format(sensor, name, error))
+
+    return errors
+
+
+# 面積が0の輪郭だけが見つかる pico のグレー画像 (幅1画素の黒い横線が3本)
+def degenerate_pico_frame():
+    image_gray = np.full((480, 640), 255, np.uint8)
+    for y in (100, 200, 300):
+        image_gray[y, 50:600] = 0
+
+    return image_gray, cv2.cvtColor(image_gray, cv2.COLOR_GRAY2BGR)
+
+
+# 合成した入力で推定結果を確認し，差分のメッセージのリストを返す
+def check_synthetic():
+    errors = []
+    image_gray, image_edge = degenerate_pico_frame()
+    try:
+        result = pico_detect_airplane.estimate_grasppose_airplane_result(image_gray, image_edge)
+        precise = pico_detect_airplane.estimate_grasppose_airplane_precise(image_gray, image_edge)
+    except Exception as e:
+        return ["degenerate pico frame: {!r}".format(e)]
+
+    if result.status is not airplane_estimator.Status.AREA_DEFAULT:
+        errors.append("degenerate pico frame: status {}".format(result.status.value))
+    if result.to_tuple() != (airplane_estimator.UNKNOWN_POINT, airplane_estimator.UNKNOWN_ANGLE, "front"):
+        errors.append("degenerate pico frame: {}".format(result.to_tuple()))
+    if precise is not None:
+        errors.append("degenerate pico frame: precise {}".format(precise))
+
+    return errors
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark and regression check for airplane grasp estimation")
+    parser.add_argument("--sensor", choices=sorted(ESTIMATORS), action="append",
+                        help="estimator to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed passes over the frames")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--update-golden", action="store_true")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-shift", type=float, default=2.0, help="allowed grasp point shift [px]")
+    parser.add_argument("--max-angle-diff", type=float, default=1.0,
+                        help="allowed change of the legacy angle value (atan2 [rad] x 60, not degrees)")
+    parser.add_argument("--make-pico-frames", action="store_true", help="regenerate imgs/airplanes/pico first")
+    parser.add_argument("--max-slowdown", type=float, default=1.5, help="allowed p50 latency ratio to baseline")
+    args = parser.parse_args(argv)
+
+    sensors = args.sensor or sorted(ESTIMATORS)
+    if args.make_pico_frames:
+        make_pico_frames()
+
+    golden = load_json(args.golden) or {}
+    baseline = load_json(args.baseline) or {}
+    errors = check_synthetic()
+
+    for sensor in sensors:
+        results, stats = measure(ESTIMATORS[sensor], load_frames(sensor), args.repeat)
+        print("{:5s} {:8.1f} fps  p50 {:7.3f} ms  p99 {:7.3f} ms  peak {:8.1f} KiB".format(
+            sensor, stats["fps"], stats["p50_ms"], stats["p99_ms"], stats["peak_bytes"] / 1024.0))
+
+        if args.update_golden:
+            golden[sensor] = results
+        elif sensor in golden:
+            errors += compare_results(sensor, results, golden[sensor], args.max_shift, args.max_angle_diff)
+        else:
+            print("{}: no golden results (run with --update-golden)".format(sensor))
+
+        if args.save_baseline:
+            baseline[sensor] = stats
+        elif sensor in baseline:
+            ratio = stats["p50_ms"] / baseline[sensor]["p50_ms"]
+            if ratio > args.max_slowdown:
+                errors.append("{}: p50 {:.3f} ms is {:.2f}x baseline {:.3f} ms".format(
+                    sensor, stats["p50_ms"], ratio, baseline[sensor]["p50_ms"]))
+
+    if args.update_golden:
+        save_json(args.golden, golden)
+    if args.save_baseline:
+        save_json(args.baseline, baseline)
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# backprojection.backproject_pixel が元の Correspondence (全画素を変換して探すループ) と同じ対応点を返すことを確かめる
+#
+# 使い方:
+#   python bench_backprojection.py                 # ランダムな角度・座標と imgs/airplanes のフレームで比べる
+#   python bench_backprojection.py --cases 2000 --seed 1
+#
+# ランダムな場合: 小さな画像 (ループが遅いため) で角度・座標をランダムに選び，PICO_WINDOW と RS_WINDOW の両方で比べる．
+#   座標の一部は画像の外にとり，許容範囲に入る画素がない場合 (元の実装では UnboundLocalError) も確かめる．
+# フレームの場合: rs の推定器で imgs/airplanes の各フレームを推定し (point_mode は warp と points)，
+#   correspondence に渡された (画像の形状, 座標, 変換行列) で比べる．
+# 1つでも異なれば終了コード1で終わる．
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import airplane_estimator
+import backprojection
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+WINDOWS = {"pico": backprojection.PICO_WINDOW, "rs": backprojection.RS_WINDOW}
+
+
+# 元の Correspondence のループ (許容範囲を window で与えるようにしたもの)
+# 許容範囲に入る画素がない場合，元の実装は UnboundLocalError になるが，ここでは None を返す
+def legacy_correspondence(image_shape, pt, trans, window):
+    x_lo, x_hi, y_lo, y_hi = window
+    corr_pt = None
+    for h in range(image_shape[0]):
+        for w in range(image_shape[1]):
+            # 各画素をアフィン変換し、変換後の座標を得る
+            tmp_pt = (w, h, 1)
+            check = np.dot(trans, tmp_pt)
+            check = (int(check[0]), int(check[1]))
+
+            # 変換後の座標がパターン認識の座標と等しい（近い）ければ、そこが対応付けられた変換前の座標
+            if pt[0] + x_lo < check[0] <= pt[0] + x_hi and pt[1] + y_lo <= check[1] < pt[1] + y_hi:
+                corr_pt = (tmp_pt[0], tmp_pt[1])
+                if check == pt:  # 同一の座標を見つけたらそこで終了
+                    return corr_pt
+
+    return corr_pt
+
+
+# ランダムな (画像の形状, 座標, 変換行列) のリストを作る
+def random_cases(rng, count, max_size):
+    cases = []
+    for _ in range(count):
+        height = int(rng.integers(8, max_size + 1))
+        width = int(rng.integers(8, max_size + 1))
+        # 角度は従来どおり atan2 の結果を60倍した値 (度として回転に渡される)
+        angle = float(rng.uniform(-190.0, 190.0))
+        trans = cv2.getRotationMatrix2D((int(width/2), int(height/2)), angle, 1.0)
+        margin = 30
+        pt = (int(rng.integers(-margin, width + margin)), int(rng.integers(-margin, height + margin)))
+        cases.append(((height, width), pt, trans))
+
+    return cases
+
+
+# rs の推定器で各フレームを推定し，correspondence に渡された (画像の形状, 座標, 変換行列) のリストを返す
+def frame_cases():
+    cases = []
+    estimator = airplane_estimator.create_estimator("rs")
+    correspondence = estimator.correspondence
+
+    def record(image, pt, trans, inverse=None):
+        cases.append((image.shape[:2], tuple(int(v) for v in pt), np.array(trans)))
+        return correspondence(image, pt, trans, inverse)
+
+    estimator.correspondence = record
+    for path in sorted(glob.glob(FRAME_PATTERN)):
+        image = cv2.imread(path)
+        for point_mode in ("warp", "points"):
+            estimator.estimate_result(image, point_mode=point_mode)
+
+    return cases
+
+
+# 各場合を比べ，(比べた数, 対応点がない場合の数, 差分のメッセージのリスト) を返す
+def compare(label, cases, windows):
+    errors = []
+    unmatched = 0
+    for shape, pt, trans in cases:
+        for name in windows:
+            window = WINDOWS[name]
+            expected = legacy_correspondence(shape, pt, trans, window)
+            actual = backprojection.backproject_pixel(pt, trans, shape, window=window)
+            unmatched += expected is None
+            if actual != expected:
+                errors.append("{} {} shape {} pt {} trans {}: {} != legacy {}".format(
+                    label, name, shape, pt, trans.tolist(), actual, expected))
+
+    return len(cases) * len(windows), unmatched, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check backproject_pixel against the legacy Correspondence loop")
+    parser.add_argument("--cases", type=int, default=300, help="number of random cases")
+    parser.add_argument("--max-size", type=int, default=96, help="largest random image side [px]")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-frames", action="store_true", help="skip the imgs/airplanes frames")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    runs = [("random", random_cases(rng, args.cases, args.max_size), sorted(WINDOWS))]
+    if not args.no_frames:
+        runs.append(("frames", frame_cases(), ["rs"]))
+
+    errors = []
+    for label, cases, windows in runs:
+        start = time.perf_counter()
+        count, unmatched, run_errors = compare(label, cases, windows)
+        errors += run_errors
+        print("{:7s} {:5d} comparisons  {:4d} without a match  {:3d} mismatches  ({:.1f} s)".format(
+            label, count, unmatched, len(run_errors), time.perf_counter() - start))
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
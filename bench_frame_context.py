@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# FrameContext を使ったときに，定常状態のフレームで大きな配列を確保していないことを確認する
+#
+# 使い方: python bench_frame_context.py [--sensor rs] [--point-mode points] [--limit バイト数]
+#
+# 1周目 (warm-up) で FrameContext にバッファを確保し，2周目に各フレームの処理中に
+# tracemalloc で測ったメモリ使用量の増分のピークを求める．
+# rs の point_mode の既定値は推定関数と同じ "warp" とする．
+# 輪郭の点列 (cv2.findContours の戻り値) の大きさは画像の内容によって変わり，warp モードで背景の輪郭が多い
+# フレームでは画像1枚分を超えることもあるため，findContours の呼び出しで増えたメモリは別に数え，
+# ピークからそれを除いた値が --limit を超えないことを確認する．
+# --limit の既定値は1フレーム分の8bit画像 (高さ x 幅 バイト) で，画像サイズの配列を
+# 1つでも新たに確保すると失敗する．
+# 失敗した場合は終了コード1で終わる．
+
+import argparse
+import glob
+import os
+import sys
+import tracemalloc
+
+import cv2
+
+import frame_context
+import rs_detect_airplane
+from batch_grasp import estimate_pico
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+
+
+def estimate_rs(point_mode):
+    def estimate(image_bgr, frame):
+        return rs_detect_airplane.estimate_grasppose_airplane(image_bgr, point_mode=point_mode, frame=frame)
+
+    return estimate
+
+
+# cv2.findContours の代わりに呼ばれ，輪郭の点列のために増えたメモリ[byte]を数える
+class ContourCounter:
+
+    def __init__(self, find_contours):
+        self.find_contours = find_contours
+        self.nbytes = 0
+
+    def __call__(self, *args, **kwargs):
+        start = tracemalloc.get_traced_memory()[0]
+        result = self.find_contours(*args, **kwargs)
+        self.nbytes += tracemalloc.get_traced_memory()[0] - start
+
+        return result
+
+
+# 各フレームの処理中に増えたメモリのピーク[byte]と，そのうち輪郭の点列の大きさ[byte]のリストを返す
+def measure(estimate, frames, frame):
+    peaks = []
+    counter = ContourCounter(cv2.findContours)
+    cv2.findContours = counter
+    tracemalloc.start()
+    try:
+        for image in frames:
+            counter.nbytes = 0
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            estimate(image, frame=frame)
+            peaks.append((tracemalloc.get_traced_memory()[1] - start, counter.nbytes))
+    finally:
+        tracemalloc.stop()
+        cv2.findContours = counter.find_contours
+
+    return peaks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check that a warmed-up FrameContext avoids frame-sized allocations")
+    parser.add_argument("--sensor", choices=("pico", "rs"), action="append", help="estimator to check (default: all)")
+    parser.add_argument("--point-mode", choices=("warp", "points"), default="warp", help="grasp point mode for rs")
+    parser.add_argument("--limit", type=int, help="allowed peak allocation per frame [byte]")
+    args = parser.parse_args(argv)
+
+    frames = [cv2.imread(path) for path in sorted(glob.glob(FRAME_PATTERN))]
+    limit = args.limit
+    if limit is None:
+        limit = frames[0].shape[0] * frames[0].shape[1]
+
+    estimators = {"pico": estimate_pico, "rs": estimate_rs(args.point_mode)}
+    failed = False
+    for sensor in args.sensor or sorted(estimators):
+        estimate = estimators[sensor]
+
+        # 比較のため，バッファを使い回さない場合も計測する
+        fresh = measure(estimate, frames, frame_context.NULL_FRAME)
+
+        frame = frame_context.FrameContext()
+        measure(estimate, frames, frame)
+        allocations = frame.allocations
+        pooled = measure(estimate, frames, frame)
+        new_buffers = frame.allocations - allocations
+
+        print("{:5s} fresh peak {:8.1f} KiB  pooled peak {:8.1f} KiB (contours up to {:8.1f} KiB)  "
+              "pool {:8.1f} KiB ({} buffers)".format(
+                  sensor, max(peak for peak, _ in fresh) / 1024.0, max(peak for peak, _ in pooled) / 1024.0,
+                  max(contours for _, contours in pooled) / 1024.0, frame.nbytes / 1024.0, len(frame.buffers)))
+
+        if new_buffers:
+            print("FAIL {}: {} buffers allocated after warm-up".format(sensor, new_buffers))
+            failed = True
+        for i, (peak, contours) in enumerate(pooled):
+            if peak - contours >= limit:
+                print("FAIL {} frame {}: {} bytes ({} bytes without contours) >= limit {}".format(
+                    sensor, i, peak, peak - contours, limit))
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# frame_ring.FrameRing でワーカープロセスにフレームを渡す場合と，pickle で渡す場合の処理速度を比べる
+#
+# 使い方:
+#   python bench_frame_ring.py                      # 受け渡しだけ (推定しない) の速度を比べる
+#   python bench_frame_ring.py --op airplane        # rs の把持点推定を含めて比べ，結果が一致することも確認する
+#   python bench_frame_ring.py --op orientation --pattern-dir パターンのディレクトリ
+#
+# imgs/airplanes のフレームを --frames 回，--workers 個のワーカープロセスに送る．
+# どちらの方法でも応答を待っているフレームは --slots 個までとする (リングバッファのスロット数と同じ)．
+# 推定は grasp_service.py のワーカーと同じ処理関数で行う．
+#
+# 始めにリングバッファの動作 (スロットの再利用・空きがない場合・上書きされたフレームの検出) を確認する．
+# 確認に失敗した場合や，2つの方法で推定結果が異なる場合は終了コード1で終わる．
+
+import argparse
+import collections
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import frame_ring
+import grasp_service
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+
+# --op none: 推定せず，画像の一部の画素だけを読む (受け渡しの時間だけを計る)
+OPS = ("none", "airplane", "airplanes", "orientation")
+
+
+def process(op, image):
+    if op == "none":
+        return int(image[::64, ::64].sum())
+
+    return grasp_service.get_processor(op, {})(image)
+
+
+# pickle で画像を受け取る (ワーカープロセスで実行される)
+def work_pickled(op, image):
+    return process(op, image)
+
+
+# リングバッファの画像を使う (ワーカープロセスで実行される)
+def work_shared(op, ring_name, ref):
+    with frame_ring.get_ring(ring_name).frame(ref) as image:
+        return process(op, image)
+
+
+# リングバッファの動作を確認し，エラーのリストを返す
+def check_sequence(image):
+    errors = []
+    with frame_ring.FrameRing(slots=2, slot_bytes=image.nbytes) as ring:
+        # release したスロットは再利用する
+        refs = []
+        for _ in range(5):
+            ref = ring.write(image)
+            refs.append(ref)
+            view = ring.read(ref)
+            if not np.array_equal(view, image) or view.flags.writeable:
+                errors.append("frame {} differs from the written image or is writeable".format(ref.seq))
+            del view
+            ring.release(ref)
+        if [ref.seq for ref in refs] != [1, 2, 3, 4, 5] or {ref.slot for ref in refs} != {0, 1}:
+            errors.append("unexpected slot reuse: {}".format(refs))
+
+        # 空きがなければ RingFull
+        held = [ring.write(image), ring.write(image)]
+        try:
+            ring.write(image)
+            errors.append("write to a full ring succeeded")
+        except frame_ring.RingFull:
+            pass
+
+        # 上書きされたフレームは読めない
+        ref = ring.write(image[::2, ::2], overwrite=True)
+        if ref.slot != held[0].slot or ring.valid(held[0]) or not ring.valid(held[1]):
+            errors.append("overwrite did not replace the oldest frame")
+        try:
+            ring.read(held[0])
+            errors.append("read of an overwritten frame succeeded")
+        except frame_ring.StaleFrame:
+            pass
+        if ring.read(ref).shape != image[::2, ::2].shape:
+            errors.append("shape of the overwritten slot was not updated")
+
+        # 使っている間に上書きされた場合は，使い終わったときに StaleFrame
+        try:
+            with ring.frame(held[1]):
+                ring.write(image, overwrite=True)
+            errors.append("overwrite during use was not detected")
+        except frame_ring.StaleFrame:
+            pass
+
+        # 上書きされたフレームの release はほかのフレームのスロットを空けない
+        ring.release(held[0])
+        if ring.free:
+            errors.append("release of an overwritten frame freed a slot")
+
+    return errors
+
+
+# frames を count 回送り，(結果のリスト, 処理時間[s]) を返す
+# submit(image) は (AsyncResult, 終わったときに呼ぶ関数) を返す
+def run(frames, count, window, submit):
+    results = []
+    pending = collections.deque()
+
+    def finish():
+        result, done = pending.popleft()
+        results.append(result.get())
+        done()
+
+    start = time.perf_counter()
+    for i in range(count):
+        if len(pending) >= window:
+            finish()
+        pending.append(submit(frames[i % len(frames)]))
+    while pending:
+        finish()
+
+    return results, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="compare shared-memory frame handoff with pickling")
+    parser.add_argument("--op", choices=OPS, default="none")
+    parser.add_argument("--frames", type=int, default=400, help="frames to send")
+    parser.add_argument("--slots", type=int, default=8, help="ring slots, also the number of unanswered frames")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--config", help="parameter file written by tune_airplane.py")
+    parser.add_argument("--pattern-dir", help="template directory for --op orientation")
+    args = parser.parse_args(argv)
+
+    frames = [cv2.imread(path) for path in sorted(glob.glob(FRAME_PATTERN))]
+
+    errors = check_sequence(frames[0])
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+    # ワーカープロセスを起動する前に作成する (frame_ring.py を参照)
+    with frame_ring.FrameRing(slots=args.slots, slot_bytes=max(image.nbytes for image in frames)) as ring:
+        with multiprocessing.Pool(args.workers, initializer=grasp_service.init_worker,
+                                  initargs=(args.config, args.pattern_dir)) as pool:
+            def submit_pickled(image):
+                return pool.apply_async(work_pickled, (args.op, image)), lambda: None
+
+            def submit_shared(image):
+                ref = ring.write(image)
+                return pool.apply_async(work_shared, (args.op, ring.name, ref)), lambda: ring.release(ref)
+
+            # 1周目は処理関数の準備を含むため計測しない
+            run(frames, len(frames), args.slots, submit_shared)
+            run(frames, len(frames), args.slots, submit_pickled)
+
+            measured = {}
+            for method, submit in (("pickle", submit_pickled), ("shared", submit_shared)):
+                results, elapsed = run(frames, args.frames, args.slots, submit)
+                measured[method] = results
+                mbytes = sum(frames[i % len(frames)].nbytes for i in range(args.frames)) / 1e6
+                print("{:7s} {} frames x {} workers ({}): {:7.1f} frames/s  {:7.1f} MB/s  {:.3f} ms/frame".format(
+                    method, args.frames, args.workers, args.op, args.frames / elapsed, mbytes / elapsed,
+                    elapsed / args.frames * 1000.0))
+
+    print("ring: {} writes, {} overwrites".format(ring.writes, ring.overwrites))
+    if measured["pickle"] != measured["shared"]:
+        print("FAIL results differ between pickle and shared memory")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# grasp_node.DetectionNode を ROS を使わない LocalTransport で動かし，最新のフレームだけを処理することを確かめる
+#
+# 使い方:
+#   python bench_grasp_node.py                      # imgs/airplanes のフレームを rs の把持点推定で処理する
+#   python bench_grasp_node.py --frames 400 --interval 0.001
+#
+# 1. 処理中に届いたフレーム: 処理関数が1枚目のフレームで止まっている間に残りのフレームを配信すると，
+#    次に処理されるのは最後に配信したフレームだけで，間のフレームはすべて捨てられる．
+# 2. 連続した配信: airplane_processor で推定するより短い間隔 (--interval[s]) で --frames 枚を配信し，
+#    - 処理したフレームの seq は増加し続ける (古いフレームを後から処理しない)
+#    - 未処理のフレームは常に2枚以下 (バッファの1枚と処理中の1枚．配信が溜まらない)
+#    - 受信した数 = 処理した数 + 捨てた数，配信された結果の数 = 処理した数
+#    - 各結果は同じフレームを直接 airplane_processor で推定した結果と一致する
+# 失敗があれば終了コード1で終わる．
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+import cv2
+
+import grasp_node
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+IMAGE_TOPIC = "/camera/color/image_raw"
+RESULT_TOPIC = "/grasp/result"
+
+
+# 処理中に届いたフレームは最新のものだけが処理されることを確かめる
+def check_latest_only(frames, timeout):
+    errors = []
+    index = {id(image): i for i, image in enumerate(frames)}
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+
+    def process(image):
+        processed.append(index[id(image)])
+        started.set()
+        release.wait(timeout)
+        return None
+
+    transport = grasp_node.LocalTransport()
+    node = grasp_node.DetectionNode(transport, process, IMAGE_TOPIC, RESULT_TOPIC)
+    node.start()
+    try:
+        transport.publish_image(IMAGE_TOPIC, frames[0])
+        if not started.wait(timeout):
+            return ["the node did not start processing the first frame"]
+        for image in frames[1:]:
+            transport.publish_image(IMAGE_TOPIC, image)
+        release.set()
+        deadline = time.perf_counter() + timeout
+        while node.processed < 2 and time.perf_counter() < deadline:
+            time.sleep(0.001)
+    finally:
+        node.stop(timeout)
+
+    expected = [0, len(frames) - 1]
+    if processed != expected:
+        errors.append("processed frames {} != {}".format(processed, expected))
+    if node.dropped != len(frames) - 2:
+        errors.append("dropped {} frames, expected {}".format(node.dropped, len(frames) - 2))
+
+    return errors
+
+
+# 推定より速く配信したときに，配信が溜まらず，結果が正しいことを確かめる
+def check_stream(frames, count, interval, timeout):
+    errors = []
+    expected = [grasp_node.airplane_processor()(image) for image in frames]
+
+    transport = grasp_node.LocalTransport()
+    node = grasp_node.DetectionNode(transport, grasp_node.airplane_processor(), IMAGE_TOPIC, RESULT_TOPIC)
+    node.start()
+    backlog = 0
+    start = time.perf_counter()
+    try:
+        for i in range(count):
+            transport.publish_image(IMAGE_TOPIC, frames[i % len(frames)])
+            backlog = max(backlog, node.received - node.processed - node.dropped)
+            time.sleep(interval)
+        # 最後のフレームの処理を待つ
+        deadline = time.perf_counter() + timeout
+        while node.processed + node.dropped < node.received and time.perf_counter() < deadline:
+            time.sleep(0.001)
+    finally:
+        node.stop(timeout)
+    elapsed = time.perf_counter() - start
+
+    results = [json.loads(text) for topic, text in transport.published if topic == RESULT_TOPIC]
+    seqs = [result["seq"] for result in results]
+    print("stream: {} frames in {:.2f} s, {} processed, {} dropped, largest backlog {}".format(
+        node.received, elapsed, node.processed, node.dropped, backlog))
+
+    if any(later <= earlier for earlier, later in zip(seqs, seqs[1:])):
+        errors.append("results are not in increasing seq order: {}".format(seqs))
+    if backlog > 2:
+        errors.append("{} frames were waiting at once".format(backlog))
+    if node.received != count or node.processed + node.dropped != node.received:
+        errors.append("received {} != processed {} + dropped {}".format(node.received, node.processed, node.dropped))
+    if len(results) != node.processed:
+        errors.append("{} results published for {} processed frames".format(len(results), node.processed))
+    if node.dropped == 0:
+        errors.append("no frame was dropped; use a shorter --interval")
+    for result in results:
+        # seq は1から数えた配信の順番
+        frame_index = (result["seq"] - 1) % len(frames)
+        if "error" in result or result["result"] != expected[frame_index]:
+            errors.append("seq {}: {} != direct estimate {}".format(result["seq"], result, expected[frame_index]))
+
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check that DetectionNode processes only the latest frame")
+    parser.add_argument("--frames", type=int, default=200, help="frames to publish in the stream check")
+    parser.add_argument("--interval", type=float, default=0.0005, help="time between published frames [s]")
+    parser.add_argument("--timeout", type=float, default=10.0, help="longest wait for the node [s]")
+    args = parser.parse_args(argv)
+
+    frames = [cv2.imread(path) for path in sorted(glob.glob(FRAME_PATTERN))]
+
+    errors = check_latest_only(frames, args.timeout)
+    print("latest only: {} frames published while the first was processed, {} failures".format(
+        len(frames) - 1, len(errors)))
+    errors += check_stream(frames, args.frames, args.interval, args.timeout)
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# grasp_service.py の負荷試験 (1秒あたりの要求数と遅延を計測する)
+#
+# 使い方:
+#   python bench_grasp_service.py                          # サービスを起動して計測し，終了させる
+#   python bench_grasp_service.py --clients 8 --requests 50 --workers 2
+#   python bench_grasp_service.py --same-frames            # 全クライアントが同じ順に同じフレームを送る (重複の統合)
+#   python bench_grasp_service.py --socket /tmp/grasp.sock # 起動済みのサービスに接続する
+#   python bench_grasp_service.py --ring-slots 0           # raw の画像を共有メモリを使わずに送る場合と比べる
+#
+# --clients 個の接続から並行に --requests 回ずつ imgs/airplanes のフレームを送る．
+# 各クライアントは既定では別のフレームから始めるので，重複はほとんど起きない．
+# 最後にサービスの統計 (統合した要求・busy を返した要求の数) を表示する．
+
+import argparse
+import asyncio
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from grasp_client import GraspClient
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_PATTERN = os.path.join(ROOT_DIR, "imgs", "airplanes", "frame*.jpg")
+
+
+# 1つのクライアントが requests 回要求し，各要求の遅延[s]のリストを返す
+async def run_client(path, frames, offset, requests, op, encoding, max_inflight):
+    latencies = []
+    async with GraspClient(path, encoding=encoding, busy_retries=20) as client:
+        # 1つの接続で max_inflight 件まで応答を待たずに送る
+        window = asyncio.Semaphore(max_inflight)
+
+        async def one(i):
+            async with window:
+                image = frames[(offset + i) % len(frames)]
+                start = time.perf_counter()
+                await client.request(op, image)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        busy = client.busy
+
+    return latencies, busy
+
+
+async def run(args, path, frames):
+    start = time.perf_counter()
+    offsets = [0 if args.same_frames else i * len(frames) // args.clients for i in range(args.clients)]
+    results = await asyncio.gather(*(run_client(path, frames, offset, args.requests, args.op, args.encoding,
+                                                args.max_inflight) for offset in offsets))
+    elapsed = time.perf_counter() - start
+
+    async with GraspClient(path) as client:
+        stats = await client.stats()
+
+    latencies = np.array([t for latency, busy in results for t in latency]) * 1000.0
+    busy = sum(busy for latency, busy in results)
+    print("{} clients x {} requests ({}, {}): {:.1f} req/s  p50 {:.2f} ms  p99 {:.2f} ms  busy retries {}".format(
+        args.clients, args.requests, args.op, args.encoding, len(latencies) / elapsed,
+        np.percentile(latencies, 50), np.percentile(latencies, 99), busy))
+    print("service stats: " + " ".join("{}={}".format(key, stats[key]) for key in sorted(stats)))
+
+
+# サービスを起動し，ソケットができるまで待つ
+def start_service(path, args):
+    command = [sys.executable, os.path.join(ROOT_DIR, "grasp_service.py"), "--socket", path,
+               "-j", str(args.workers), "--max-pending", str(args.max_pending), "--ring-slots", str(args.ring_slots)]
+    proc = subprocess.Popen(command)
+    deadline = time.time() + 30.0
+    while not os.path.exists(path):
+        if proc.poll() is not None or time.time() > deadline:
+            proc.kill()
+            raise RuntimeError("grasp_service.py did not start")
+        time.sleep(0.05)
+
+    return proc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="load test for grasp_service.py")
+    parser.add_argument("--socket", help="connect to a running service instead of starting one")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--max-inflight", type=int, default=4, help="unanswered requests per client")
+    parser.add_argument("--op", choices=("airplane", "airplanes"), default="airplane")
+    parser.add_argument("--encoding", default="raw", help='"raw" or an image extension such as .jpg')
+    parser.add_argument("--same-frames", action="store_true", help="all clients send the same frame sequence")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="workers of a started service")
+    parser.add_argument("--max-pending", type=int, default=32, help="--max-pending of a started service")
+    parser.add_argument("--ring-slots", type=int, default=16, help="--ring-slots of a started service")
+    args = parser.parse_args(argv)
+
+    frames = [cv2.imread(path) for path in sorted(glob.glob(FRAME_PATTERN))]
+
+    if args.socket:
+        asyncio.run(run(args, args.socket, frames))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "grasp_service.sock")
+        proc = start_service(path, args)
+        try:
+            asyncio.run(run(args, path, frames))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# モジュールの読み込み時間を python -X importtime で計測し，起動が遅くなっていないことを確認する
+#
+# 使い方:
+#   python bench_import_time.py                  # 計測して判定 (失敗があれば終了コード1)
+#   python bench_import_time.py --save-baseline  # 現在の読み込み時間を baseline として保存
+#
+# 各モジュールを別のプロセスで読み込み，--repeat 回のうち最小の時間を用いる．
+# cv2 と numpy は推定に必須で時間の大半を占めるため，先に読み込んでおき，その分は含めない．
+#
+# 判定:
+#   - FORBIDDEN のパッケージ (表示用・ROS・PIL) を読み込んだ場合は失敗 (使うときに読み込むこと)
+#   - 読み込み時間が --max-ms を超えた場合は失敗
+#   - baseline (bench_import_baseline.json) がある場合，baseline の --max-slowdown 倍かつ
+#     baseline + --min-regression-ms を超えたら失敗 (1ms 未満のモジュールが誤差で失敗しないように)
+#     (処理時間は環境に依存するため，baseline はリポジトリには含めず各環境で作成する)
+
+import argparse
+import os
+import subprocess
+import sys
+
+import bench_airplane
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = (
+    "airplane_estimator",
+    "pico_detect_airplane",
+    "rs_detect_airplane",
+    "depth_grasp",
+    "template_matcher",
+    "check_direction",
+    "grasp_node",
+)
+
+# 読み込み時に読み込んではいけないパッケージ
+FORBIDDEN = ("matplotlib", "rospy", "sensor_msgs", "std_msgs", "PIL", "IPython")
+
+PRELUDE = "import cv2, numpy, sys"
+MARKER = "-- prelude done --"
+
+
+# 1つのモジュールを読み込み，(読み込み時間[us], 読み込んだモジュール名の集合) を返す
+def import_time(module):
+    code = "{}; sys.stderr.write({!r}); import {}".format(PRELUDE, MARKER + "\n", module)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    # 各行は "import time: self [us] | cumulative | imported package" で，子のモジュールが先に出力される．
+    # MARKER の後に読み込んだ最上位 (インデントが1文字) のモジュールの cumulative を合計する
+    total = 0
+    names = set()
+    lines = proc.stderr.splitlines()
+    for line in lines[lines.index(MARKER) + 1:]:
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        depth = len(name) - len(name.lstrip())
+        names.add(name.strip())
+        if depth == 1:
+            total += int(cumulative)
+
+    return total, names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check module import time with python -X importtime")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default="bench_import_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-ms", type=float, default=50.0, help="allowed import time excluding cv2/numpy [ms]")
+    parser.add_argument("--max-slowdown", type=float, default=1.5, help="allowed import time ratio to baseline")
+    parser.add_argument("--min-regression-ms", type=float, default=5.0,
+                        help="ignore slowdowns smaller than this [ms]")
+    args = parser.parse_args(argv)
+
+    baseline = bench_airplane.load_json(args.baseline) or {}
+    errors = []
+
+    for module in args.modules:
+        try:
+            runs = [import_time(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            errors.append("{}: import failed: {}".format(module, e))
+            continue
+        ms = min(total for total, names in runs) / 1000.0
+        names = runs[0][1]
+        print("{:22s} {:7.1f} ms  {} modules".format(module, ms, len(names)))
+
+        forbidden = sorted({name.split(".")[0] for name in names} & set(FORBIDDEN))
+        if forbidden:
+            errors.append("{}: imports {}".format(module, ", ".join(forbidden)))
+        if ms > args.max_ms:
+            errors.append("{}: {:.1f} ms > {:.1f} ms".format(module, ms, args.max_ms))
+
+        if args.save_baseline:
+            baseline[module] = ms
+        elif module in baseline and ms > max(baseline[module] * args.max_slowdown,
+                                             baseline[module] + args.min_regression_ms):
+            errors.append("{}: {:.1f} ms is {:.2f}x baseline {:.1f} ms".format(
+                module, ms, ms / baseline[module], baseline[module]))
+
+    if args.save_baseline:
+        bench_airplane.save_json(args.baseline, baseline)
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# morphology の expansion / contraction / trim が元の画素ごとのループと，
+# r_plane_mask が元の rs_detect_airplane のマスク作成と画素単位で一致することを確かめる
+#
+# 使い方:
+#   python bench_morphology.py                 # ランダムなマスクと imgs/airplanes のすべてのフレームで比べる
+#   python bench_morphology.py --limit 2       # 先頭の2フレームだけで比べる (ループが遅いため1フレーム約2秒)
+#   python bench_morphology.py --cases 500 --seed 1
+#
+# ランダムな場合: 窓より小さい画像を含む様々な大きさ・密度・値 (0/255 と任意の濃淡) の画像で比べる．
+#   元の実装の窓は y < ksize (x < ksize) で開始インデックスが負になり末尾からのスライスになるため，
+#   上端・左端の挙動 (legacy_border=True) もここで確かめる．
+# フレームの場合: pico の前処理 (グレー画像 -> 膨張 -> 収縮 -> トリミング) の各段階を比べる．
+#   膨張は前処理の ksize=4 とやり直しの ksize=5 の両方で比べる．
+# どちらも FrameContext を使い回した場合 (dst に書き込む場合) の結果も比べる．
+# R平面のマスク: 各フレームで MASK_KSIZES と MASK_ITERATIONS のすべての組み合わせについて比べる．
+#   偶数の ksize はカーネルの中心がずれるため，1回の大きなカーネルの膨張に置き換えられないことの確認を兼ねる．
+# 1つでも異なれば終了コード1で終わる．
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import frame_context
+import morphology
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+MASK_KSIZES = (2, 3, 4, 5, 6, 7)
+MASK_ITERATIONS = (0, 1, 2, 6)
+
+
+# ---- 元の実装 (pico_detect_airplane のループ．膨張の閾値だけを引数にしたもの) ----
+
+# 膨張処理
+def legacy_expansion(src, ksize=4, threshold=5):
+    h, w = src.shape
+    dst = src.copy()
+
+    for y in range(0, h):
+        for x in range(0, w):
+            # 近傍に白い画素が2つ以上あれば、注目画素を白色に塗り替える
+            roi = src[y-ksize:y+ksize+1, x-ksize:x+ksize+1]
+            if np.count_nonzero(roi) > threshold:
+                dst[y][x] = 255
+
+    return dst
+
+# 収縮処理
+def legacy_contraction(src, ksize=11):
+    h, w = src.shape
+    dst = src.copy()
+
+    for y in range(0, h):
+        for x in range(0, w):
+            # 近傍に黒い画素が1つでもあれば、注目画素を黒色に塗り替える
+            roi = src[y-ksize:y+ksize+1, x-ksize:x+ksize+1]
+            if roi.size - np.count_nonzero(roi) > 0:
+                dst[y][x] = 0
+
+    return dst
+
+# トリミング処理
+def legacy_trim(src, trim_size_x=15, trim_size_y=15):
+
+    h, w = src.shape
+    dst = src.copy()
+
+    for y in range(0, h):
+        for x in range(0, w):
+            if y < trim_size_y or y > h - trim_size_y:
+                dst[y][x] = 0
+            if x < trim_size_x or x > w - trim_size_x:
+                dst[y][x] = 0
+
+    return dst
+
+
+# ---- 元の実装 (rs_detect_airplane のマスク作成．閾値・カーネルの大きさ・膨張の回数を引数にしたもの) ----
+
+def legacy_r_plane_mask(image_bgr, threshold_r=40, ksize=5, iterations=6):
+    image_b, _, image_r = cv2.split(image_bgr)
+    _, r_binary = cv2.threshold(image_r, threshold_r, 255, cv2.THRESH_BINARY)
+    r_binary = cv2.bitwise_not(r_binary)
+
+    kernel = np.ones((ksize, ksize), np.uint8)
+    erosion = cv2.erode(r_binary, kernel, iterations=1)
+    image_mask = cv2.dilate(erosion, kernel, iterations=iterations)
+
+    return image_mask
+
+
+# 2つの画像を比べ，異なる場合はメッセージを返す (一致する場合は None)
+def diff(label, actual, expected):
+    if actual.shape == expected.shape and np.array_equal(actual, expected):
+        return None
+    if actual.shape != expected.shape:
+        return "{}: shape {} != legacy {}".format(label, actual.shape, expected.shape)
+    ys, xs = np.nonzero(actual != expected)
+
+    return "{}: {} pixels differ (first at x={} y={})".format(label, len(ys), xs[0], ys[0])
+
+
+# (名前, 新しい実装, 元の実装) を src に適用して比べ，差分のメッセージのリストを返す
+def compare(label, src, ops, frame):
+    errors = []
+    for name, op, legacy in ops:
+        expected = legacy(src)
+        for suffix, kwargs in (("", {}), (" (frame)", {"frame": frame})):
+            error = diff("{} {}{}".format(label, name, suffix), op(src, **kwargs), expected)
+            if error is not None:
+                errors.append(error)
+
+    return errors
+
+
+def morphology_ops(expansion_ksize, threshold, contraction_ksize, trim_x, trim_y):
+    def expansion(src, frame=None):
+        if frame is None:
+            return morphology.expansion(src, ksize=expansion_ksize, threshold=threshold)
+        return morphology.expansion(src, ksize=expansion_ksize, threshold=threshold,
+                                    dst=frame.buffer("out", src.shape), frame=frame)
+
+    def contraction(src, frame=None):
+        if frame is None:
+            return morphology.contraction(src, ksize=contraction_ksize)
+        return morphology.contraction(src, ksize=contraction_ksize, dst=frame.buffer("out", src.shape), frame=frame)
+
+    def trim(src, frame=None):
+        if frame is None:
+            return morphology.trim(src, trim_size_x=trim_x, trim_size_y=trim_y)
+        return morphology.trim(src, trim_size_x=trim_x, trim_size_y=trim_y, dst=frame.buffer("out", src.shape))
+
+    return [
+        ("expansion(ksize={}, threshold={})".format(expansion_ksize, threshold), expansion,
+         lambda src: legacy_expansion(src, expansion_ksize, threshold)),
+        ("contraction(ksize={})".format(contraction_ksize), contraction,
+         lambda src: legacy_contraction(src, contraction_ksize)),
+        ("trim({}, {})".format(trim_x, trim_y), trim, lambda src: legacy_trim(src, trim_x, trim_y)),
+    ]
+
+
+# ランダムな画像と各処理のパラメータで比べる
+def compare_random(rng, count, max_size, frame):
+    errors = []
+    for i in range(count):
+        h = int(rng.integers(1, max_size + 1))
+        w = int(rng.integers(1, max_size + 1))
+        density = float(rng.uniform(0.0, 1.0))
+        src = (rng.random((h, w)) < density).astype(np.uint8)
+        if rng.random() < 0.5:
+            src *= 255
+        else:
+            # 0 以外の濃淡も白画素として数える
+            src *= rng.integers(1, 256, (h, w), dtype=np.uint8)
+
+        ops = morphology_ops(int(rng.integers(0, 13)), int(rng.integers(0, 30)), int(rng.integers(0, 13)),
+                             int(rng.integers(-2, 20)), int(rng.integers(-2, 20)))
+        errors += compare("random #{} {}x{}".format(i, w, h), src, ops, frame)
+
+    return errors
+
+
+# pico の前処理の各段階で比べる
+def compare_frame(name, image_bgr, frame):
+    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+    errors = compare(name, gray, morphology_ops(5, 5, 11, 15, 15)[:1], frame)
+
+    src = gray
+    for op_name, op, legacy in morphology_ops(4, 5, 11, 15, 15):
+        expected = legacy(src)
+        for suffix, kwargs in (("", {}), (" (frame)", {"frame": frame})):
+            error = diff("{} {}{}".format(name, op_name, suffix), op(src, **kwargs), expected)
+            if error is not None:
+                errors.append(error)
+        # 次の段階は元の実装の出力を入力とする
+        src = expected
+
+    return errors
+
+
+# R平面のマスクを比べる
+def compare_mask(name, image_bgr, frame):
+    errors = []
+    shape = image_bgr.shape[:2]
+    for ksize in MASK_KSIZES:
+        for iterations in MASK_ITERATIONS:
+            expected = legacy_r_plane_mask(image_bgr, 40, ksize, iterations)
+            for suffix, kwargs in (("", {}), (" (frame)", {"dst": frame.buffer("out", shape),
+                                                          "plane": frame.buffer("plane", shape)})):
+                actual, _ = morphology.r_plane_mask(image_bgr, 40, ksize=ksize, iterations=iterations, **kwargs)
+                error = diff("{} r_plane_mask(ksize={}, iterations={}){}".format(name, ksize, iterations, suffix),
+                             actual, expected)
+                if error is not None:
+                    errors.append(error)
+
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check morphology against the legacy per-pixel loops")
+    parser.add_argument("--cases", type=int, default=200, help="number of random images")
+    parser.add_argument("--max-size", type=int, default=40, help="largest random image side [px]")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=0, help="number of imgs/airplanes frames (0: all)")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    frame = frame_context.FrameContext()
+
+    start = time.perf_counter()
+    errors = compare_random(rng, args.cases, args.max_size, frame)
+    print("random  {:4d} images  {:3d} mismatches  ({:.1f} s)".format(args.cases, len(errors),
+                                                                      time.perf_counter() - start))
+
+    paths = sorted(glob.glob(FRAME_PATTERN))
+    if args.limit > 0:
+        paths = paths[:args.limit]
+    start = time.perf_counter()
+    frame_errors = []
+    mask_errors = []
+    for path in paths:
+        image = cv2.imread(path)
+        frame_errors += compare_frame(os.path.basename(path), image, frame)
+        mask_errors += compare_mask(os.path.basename(path), image, frame)
+    errors += frame_errors + mask_errors
+    print("frames  {:4d} frames  {:3d} mismatches  ({:.1f} s)".format(len(paths), len(frame_errors),
+                                                                      time.perf_counter() - start))
+    print("masks   {:4d} frames  {:3d} mismatches  (ksize {}, iterations {})".format(
+        len(paths), len(mask_errors), MASK_KSIZES, MASK_ITERATIONS))
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# PatternBank の効果を測るマイクロベンチマーク
+# cold: 呼び出しごとに新しい PatternBank を作る (従来の毎回 imread する動作に相当)
+# warm: 読み込み済みの PatternBank を使い回す
+#
+# 使い方: python bench_pattern_bank.py [--root パターンディレクトリ] [--repeat 回数]
+# --root を指定しない場合は imgs/airplanes のフレームから切り出した仮のテンプレートを用いる
+#
+# fetch: detect_orientation_floor が1回に取り出す左右のテンプレートの取得だけの時間．
+#   warm の p50 が cold の p50 より小さくない場合は終了コード1で終わる．
+# detect: detect_orientation_floor 全体の時間 (参考)．
+#   matchTemplate の時間がテンプレートの読み込みより大きいため，cold と warm の差は誤差に埋もれることがある．
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from check_direction import CheckDirection
+from pattern_bank import PLACE_NAMES, OBJECT_NAMES, MARKER_NAME, SIDES, PatternBank
+
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame0019.jpg")
+
+
+# サンプル画像から切り出した仮のテンプレートを root_dir に書き出す
+def make_dummy_patterns(root_dir, image):
+    for i, side in enumerate(SIDES):
+        os.makedirs(os.path.join(root_dir, side), exist_ok=True)
+        for j, obj_name in enumerate(list(OBJECT_NAMES.values()) + [MARKER_NAME]):
+            for place_name in PLACE_NAMES.values():
+                x, y = 100 + 40 * j, 120 + 60 * i
+                template = image[y:y + 60, x:x + 80]
+                cv2.imwrite(os.path.join(root_dir, side, obj_name + "_" + place_name + ".jpg"), template)
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return np.median(times) * 1000.0, np.percentile(times, 99) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default=None, help="pattern directory ({root}/{side}/{obj}_{place}.jpg)")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    image = cv2.imread(SAMPLE_PATH)
+    img_trim = image[170:170 + 250, 150:150 + 300]
+
+    tmp_dir = None
+    root_dir = args.root
+    if root_dir is None:
+        tmp_dir = tempfile.mkdtemp()
+        root_dir = tmp_dir
+        make_dummy_patterns(root_dir, image)
+
+    try:
+        warm_bank = PatternBank(root_dir, preload=True)
+        warm_checker = CheckDirection(warm_bank)
+
+        # detect_orientation_floor と同じく左右のテンプレートを取り出す
+        def fetch(bank):
+            bank.get("floor", 26, "right")
+            bank.get("floor", 26, "left")
+
+        benches = [
+            ("fetch", lambda: fetch(PatternBank(root_dir)), lambda: fetch(warm_bank)),
+            ("detect", lambda: CheckDirection(PatternBank(root_dir)).detect_orientation_floor(img_trim, obj_id=26),
+             lambda: warm_checker.detect_orientation_floor(img_trim, obj_id=26)),
+        ]
+        results = {}
+        for name, cold, warm in benches:
+            for state, fn in (("cold", cold), ("warm", warm)):
+                p50, p99 = measure(fn, args.repeat)
+                results[name, state] = p50
+                print("{:6s} {:4s} p50 {:8.3f} ms  p99 {:8.3f} ms".format(name, state, p50, p99))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    if results["fetch", "warm"] >= results["fetch", "cold"]:
+        print("FAIL warm template fetch ({:.3f} ms) is not faster than cold ({:.3f} ms)".format(
+            results["fetch", "warm"], results["fetch", "cold"]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
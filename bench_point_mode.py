@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 把持点の求め方 (point_mode の "warp" と "points") の結果と処理時間を比べる
+#
+# 使い方:
+#   python bench_point_mode.py                      # rs の推定器で imgs/airplanes のフレームを比べる
+#   python bench_point_mode.py --max-mode-shift 5   # 2つの方法の把持点の差も判定する
+#
+# 各フレームについて，2つの方法の把持点・その差[px]・R平面のマスク (物体の領域) からの距離[px] を表示する．
+# "warp" は従来の方法で，画像全体を回転して閾値処理し直すため，選択した領域とは別の輪郭 (背景や画像の端など)
+# の右端を把持点にすることが多く，"points" とは一致しない (差の中央値は約210画素)．
+# そのため把持点の一致は，選択した領域の輪郭だけを塗りつぶしたマスクを回転し，閾値処理・輪郭抽出し直して
+# 右端を求めた場合 (warp の方法を選択した領域に限ったもの．region_warp_point) と比べる．
+# 回転したマスクの画素化と，右端に並ぶ点のどれを選ぶかの違いのため，数画素の差は生じる．
+# 判定 (失敗があれば終了コード1):
+#   - 2つの方法で状態・角度・表裏が異なる場合 (領域の選択は共通のため一致するはず)
+#   - "points" の把持点が region_warp_point の把持点から --max-parity-shift 画素より離れている場合
+#   - "points" の把持点がマスクから --max-off-object 画素より離れている場合
+#   - --max-mode-shift を指定した場合，2つの方法の把持点の差がそれを超えた場合
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import airplane_estimator
+import frame_context
+import morphology
+import profiling
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+POINT_MODES = ("warp", "points")
+
+
+# 把持点から物体のマスクまでの距離[px] (画像の外の場合は None)
+def distance_to_mask(distance, pt):
+    x, y = pt
+    height, width = distance.shape
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+
+    return float(distance[y, x])
+
+
+# 選択した領域 (contour) だけを塗りつぶしたマスクを angle_deg 回転し，get_point の warp と同じく
+# 閾値処理・輪郭抽出し直して右端を求め，回転前の座標に対応付けた把持点を返す
+def region_warp_point(estimator, image, angle_deg, contour):
+    height, width = image.shape[:2]
+    region = np.zeros((height, width), np.uint8)
+    cv2.drawContours(region, [contour], -1, 255, cv2.FILLED)
+
+    trans = cv2.getRotationMatrix2D((int(width/2), int(height/2)), angle_deg, 1.0)
+    rotated = cv2.warpAffine(region, trans, (width, height))
+    _, rotated_bw = cv2.threshold(rotated, 127, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(rotated_bw, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    points = max(contours, key=cv2.contourArea).reshape(-1, 2)
+    x, y = points[int(np.argmax(points[:, 0]))]
+    pt = (0, 0)
+    if x > 0:
+        pt = (int(x) - 8, int(y) - 10)
+
+    return estimator.correspondence(image, pt, trans)
+
+
+def distance(pt1, pt2):
+    return float(np.hypot(pt1[0] - pt2[0], pt1[1] - pt2[1]))
+
+
+def format_off(off):
+    return "outside" if off is None else "{:.1f}".format(off)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="compare the warp and points grasp point modes")
+    parser.add_argument("--config", help="parameter file written by tune_airplane.py")
+    parser.add_argument("--max-parity-shift", type=float, default=10.0,
+                        help="allowed distance of a points-mode grasp point from the region-warp reference [px]")
+    parser.add_argument("--max-off-object", type=float, default=15.0,
+                        help="allowed distance of a points-mode grasp point from the object mask [px]")
+    parser.add_argument("--max-mode-shift", type=float, help="allowed grasp point difference between modes [px]")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed passes over the frames")
+    args = parser.parse_args(argv)
+
+    config = airplane_estimator.load_config(args.config, "rs") if args.config else {}
+    estimator = airplane_estimator.create_estimator("rs", **config.get("mask", {}))
+    mask = estimator.mask
+    frames = [(os.path.basename(path), cv2.imread(path)) for path in sorted(glob.glob(FRAME_PATTERN))]
+
+    errors = []
+    shifts = []
+    parity_shifts = []
+    for name, image in frames:
+        results = {mode: estimator.estimate_result(image, point_mode=mode) for mode in POINT_MODES}
+        warp, points = results["warp"], results["points"]
+        if (warp.status, warp.angle, warp.flag) != (points.status, points.angle, points.flag):
+            errors.append("{}: warp {} differs from points {}".format(name, warp, points))
+            continue
+        if not points.ok:
+            print("{} {}".format(name, points.status.value))
+            continue
+
+        contours, image_point, _, max_id, _ = estimator.select_regions(
+            image, None, profiling.NULL_TIMER, frame_context.NULL_FRAME, airplane_estimator.GraspResult())
+        reference = region_warp_point(estimator, image_point, points.angle, contours[max_id])
+        if reference is None:
+            errors.append("{}: the selected region vanished after rotation".format(name))
+            continue
+        parity_shift = distance(points.point, reference)
+        parity_shifts.append(parity_shift)
+
+        object_mask, _ = morphology.r_plane_mask(image, mask.threshold_r, ksize=mask.ksize, iterations=mask.iterations)
+        object_distance = cv2.distanceTransform(255 - object_mask, cv2.DIST_L2, 3)
+        off = {mode: distance_to_mask(object_distance, results[mode].point) for mode in POINT_MODES}
+        shift = distance(warp.point, points.point)
+        shifts.append(shift)
+        print("{} warp {} (off {}) points {} (off {}) shift {:.1f} px  region warp {} parity {:.1f} px".format(
+            name, warp.point, format_off(off["warp"]), points.point, format_off(off["points"]), shift,
+            reference, parity_shift))
+
+        if parity_shift > args.max_parity_shift:
+            errors.append("{}: points-mode grasp point {} is {:.1f} px from the region-warp point {}".format(
+                name, points.point, parity_shift, reference))
+
+        if off["points"] is None or off["points"] > args.max_off_object:
+            errors.append("{}: points-mode grasp point {} is off the object ({})".format(name, points.point,
+                                                                                     off["points"]))
+        if args.max_mode_shift is not None and shift > args.max_mode_shift:
+            errors.append("{}: modes differ by {:.1f} px".format(name, shift))
+
+    if shifts:
+        print("shift between modes: median {:.1f} px  max {:.1f} px".format(np.median(shifts), max(shifts)))
+        print("points vs region warp: median {:.1f} px  max {:.1f} px".format(np.median(parity_shifts),
+                                                                             max(parity_shifts)))
+
+    for mode in POINT_MODES:
+        times = []
+        for _ in range(args.repeat):
+            for name, image in frames:
+                start = time.perf_counter()
+                estimator.estimate_result(image, point_mode=mode)
+                times.append(time.perf_counter() - start)
+        print("{:6s} p50 {:.3f} ms".format(mode, np.percentile(times, 50) * 1000.0))
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
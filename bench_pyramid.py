@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 向き推定の全探索とピラミッド照合の精度・処理時間を比較する
+#
+# 使い方: python bench_pyramid.py ラベル付き画像のディレクトリ [--root パターンディレクトリ] [--levels 2]
+# ラベル付き画像は {dir}/{place}/{obj_id}/{left|right}/*.jpg に置く
+#   place: floor または table
+#   obj_id: 26 (fork), 27 (spoon), marker
+# 画像は detect_orientation_4patternmatch に渡すフレーム全体
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from check_direction import CheckDirection
+from pattern_bank import DEFAULT_PATTERN_DIR, SIDES, PatternBank
+
+
+# ラベル付き画像の一覧を (パス, place, obj_id, 正解の向き) のリストで返す
+def load_labels(label_dir):
+    samples = []
+    for path in sorted(glob.glob(os.path.join(label_dir, "*", "*", "*", "*.jpg"))):
+        rest, side = os.path.split(os.path.dirname(path))
+        rest, obj_name = os.path.split(rest)
+        place = os.path.basename(rest)
+        if side not in SIDES:
+            continue
+        obj_id = int(obj_name) if obj_name.isdigit() else None
+        samples.append((path, place, obj_id, side))
+
+    return samples
+
+
+def evaluate(checker, samples, images):
+    orientations = []
+    times = []
+    for (path, place, obj_id, label), img in zip(samples, images):
+        start = time.perf_counter()
+        orientations.append(checker.detect_orientation_4patternmatch(img, place, obj_id))
+        times.append(time.perf_counter() - start)
+
+    return orientations, np.array(times) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("label_dir")
+    parser.add_argument("--root", default=DEFAULT_PATTERN_DIR, help="pattern directory")
+    parser.add_argument("--levels", type=int, default=2)
+    parser.add_argument("--peaks", type=int, default=3)
+    parser.add_argument("--ambiguity", type=float, default=0.05)
+    args = parser.parse_args()
+
+    samples = load_labels(args.label_dir)
+    if not samples:
+        print("no labelled images in", args.label_dir)
+        return
+    images = [cv2.imread(path) for path, _, _, _ in samples]
+
+    bank = PatternBank(args.root, preload=True)
+    exhaustive = CheckDirection(bank)
+    pyramid = CheckDirection(bank, pyramid_levels=args.levels, pyramid_peaks=args.peaks,
+                             pyramid_ambiguity=args.ambiguity)
+
+    results = {}
+    for name, checker in (("exhaustive", exhaustive), ("pyramid", pyramid)):
+        orientations, times = evaluate(checker, samples, images)
+        results[name] = orientations
+        correct = sum(o == label for o, (_, _, _, label) in zip(orientations, samples))
+        print("{:10s} accuracy {:3d}/{:3d} ({:6.2f}%)  mean {:7.3f} ms  p50 {:7.3f} ms  p99 {:7.3f} ms".format(
+            name, correct, len(samples), 100.0 * correct / len(samples),
+            times.mean(), np.percentile(times, 50), np.percentile(times, 99)))
+
+    agree = sum(a == b for a, b in zip(results["exhaustive"], results["pyramid"]))
+    print("pyramid agrees with exhaustive: {}/{}".format(agree, len(samples)))
+    print("pyramid fallback to exhaustive: {}/{}".format(pyramid.pyramid_fallback_count, len(samples)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# backprojection.RotationCache の効果 (ヒット率・処理時間・把持点のずれ) を確かめる
+#
+# 使い方: python bench_rotation_cache.py [--sensor rs] [--point-mode warp] [--step 0] [--maxsize 64] [--maps]
+#         python bench_rotation_cache.py --step 0.1   # 角度を丸めた場合のヒット率と把持点のずれ
+#
+# imgs/airplanes のフレームを --repeat 回繰り返して推定し，キャッシュを使わない場合と比べる．
+# 1周目はすべてミスになるので，2周目以降が定常状態のヒット率の目安になる．
+# 把持点のずれは丸めた角度で回転したことによるもので，--step 0 では0になる．
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+import backprojection
+import frame_context
+import rs_detect_airplane
+from batch_grasp import estimate_pico
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+
+
+def estimate_rs(point_mode):
+    def estimate(image_bgr, frame):
+        return rs_detect_airplane.estimate_grasppose_airplane_result(image_bgr, point_mode=point_mode, frame=frame)
+
+    return estimate
+
+
+def estimate_pico_frame(image_bgr, frame):
+    return estimate_pico(image_bgr, frame=frame)
+
+
+# 全フレームを repeat 周推定し，(最後の周の把持点のリスト, 処理時間[ms]の配列) を返す
+def run(estimate, frames, frame, repeat):
+    times = []
+    points = []
+    for _ in range(repeat):
+        points = []
+        for image in frames:
+            start = time.perf_counter()
+            result = estimate(image, frame)
+            times.append(time.perf_counter() - start)
+            points.append(result.point)
+
+    return points, np.array(times) * 1000.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="measure the rotation matrix / warp map cache")
+    parser.add_argument("--sensor", choices=("pico", "rs"), default="rs")
+    parser.add_argument("--point-mode", choices=("warp", "points"), default="warp", help="grasp point mode for rs")
+    parser.add_argument("--step", type=float, default=0.0, help="angle quantisation step [deg] (0: exact)")
+    parser.add_argument("--maxsize", type=int, default=64)
+    parser.add_argument("--maps", action="store_true", help="rotate with precomputed remap maps")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    frames = [cv2.imread(path) for path in sorted(glob.glob(FRAME_PATTERN))]
+    if args.sensor == "rs":
+        estimate = estimate_rs(args.point_mode)
+    else:
+        estimate = estimate_pico_frame
+
+    plain_points, plain_times = run(estimate, frames, frame_context.FrameContext(), args.repeat)
+
+    rotations = backprojection.RotationCache(step_deg=args.step, maxsize=args.maxsize, maps=args.maps)
+    cached_points, cached_times = run(estimate, frames, frame_context.FrameContext(rotations=rotations), args.repeat)
+
+    shifts = [np.hypot(a[0] - b[0], a[1] - b[1]) for a, b in zip(plain_points, cached_points)]
+    lookups = rotations.hits + rotations.misses
+    print("{} {}: hits {} misses {} evictions {} (hit rate {:.2f}) entries {} maps {:.1f} KiB".format(
+        args.sensor, args.point_mode, rotations.hits, rotations.misses, rotations.evictions,
+        rotations.hits / lookups if lookups else 0.0, len(rotations), rotations.nbytes / 1024.0))
+    print("p50 {:.3f} ms -> {:.3f} ms  max shift {:.1f} px".format(
+        np.percentile(plain_times, 50), np.percentile(cached_times, 50), max(shifts)))
+
+
+if __name__ == "__main__":
+    main()
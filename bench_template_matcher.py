@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# template_matcher.MultiTemplateMatcher の結果が cv2.matchTemplate (TM_CCOEFF) と一致することを確かめ，処理時間を比べる
+#
+# 使い方:
+#   python bench_template_matcher.py                    # imgs/airplanes のフレームから切り出した仮のテンプレートで比べる
+#   python bench_template_matcher.py --root パターンディレクトリ   # 保存しているテンプレート ({root}/{side}/{obj}_{place}.jpg)
+#
+# imgs/airplanes の各フレームについて，フレーム全体と detect_orientation_floor に渡す大きさの切り出しの両方で，
+# 全テンプレートの最大値 (max_val) とその座標 (max_loc) を cv2.matchTemplate + cv2.minMaxLoc と比べる．
+# max_val は相対誤差 --rtol 以内，max_loc は完全に一致すること．1つでも異なれば終了コード1で終わる．
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import bench_pattern_bank
+from pattern_bank import PLACE_NAMES, OBJECT_NAMES, SIDES, PatternBank
+from template_matcher import MultiTemplateMatcher
+
+
+FRAME_PATTERN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+
+
+# PatternBank のすべてのテンプレートを {キー: 画像} で返す
+def load_templates(root_dir):
+    bank = PatternBank(root_dir, preload=True)
+
+    return {bank.key(place, obj_id, side): bank.get(place, obj_id, side)
+            for place in PLACE_NAMES for obj_id in list(OBJECT_NAMES) + [None] for side in SIDES}
+
+
+# cv2.matchTemplate でテンプレートを1つずつ照合する (従来の方法)
+def match_each(img, templates):
+    table = {}
+    for key, template in templates.items():
+        res = cv2.matchTemplate(img, template, cv2.TM_CCOEFF)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        table[key] = (max_val, max_loc)
+
+    return table
+
+
+def compare(label, actual, expected, rtol):
+    errors = []
+    worst = 0.0
+    for key, (max_val, max_loc) in expected.items():
+        val, loc = actual[key]
+        error = abs(val - max_val) / max(abs(max_val), 1.0)
+        worst = max(worst, error)
+        if error > rtol or tuple(loc) != tuple(max_loc):
+            errors.append("{} {}: max_val {} at {} != matchTemplate {} at {}".format(
+                label, key, val, loc, max_val, max_loc))
+
+    return errors, worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check MultiTemplateMatcher against cv2.matchTemplate (TM_CCOEFF)")
+    parser.add_argument("--root", default=None, help="pattern directory ({root}/{side}/{obj}_{place}.jpg)")
+    parser.add_argument("--rtol", type=float, default=1e-4, help="allowed relative error of max_val")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(FRAME_PATTERN))
+    tmp_dir = None
+    root_dir = args.root
+    if root_dir is None:
+        tmp_dir = tempfile.mkdtemp()
+        root_dir = tmp_dir
+        bench_pattern_bank.make_dummy_patterns(root_dir, cv2.imread(bench_pattern_bank.SAMPLE_PATH))
+    try:
+        templates = load_templates(root_dir)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    matcher = MultiTemplateMatcher(templates)
+    errors = []
+    worst = 0.0
+    times = {"matchTemplate": [], "matcher": []}
+    for path in paths:
+        image = cv2.imread(path)
+        for label, img in ((os.path.basename(path), image),
+                           (os.path.basename(path) + " trim", image[170:170 + 250, 150:150 + 300])):
+            start = time.perf_counter()
+            expected = match_each(img, templates)
+            times["matchTemplate"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            actual = matcher.match(img)
+            times["matcher"].append(time.perf_counter() - start)
+
+            img_errors, img_worst = compare(label, actual, expected, args.rtol)
+            errors += img_errors
+            worst = max(worst, img_worst)
+
+    print("{} images x {} templates: {} mismatches, largest relative max_val error {:.2e}".format(
+        len(times["matcher"]), len(templates), len(errors), worst))
+    for name, values in times.items():
+        print("{:13s} p50 {:8.3f} ms per image (all templates)".format(name, np.median(values) * 1000.0))
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
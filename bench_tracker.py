@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# airplane_tracker.AirplaneTracker の動作を imgs/airplanes のフレームで確かめる
+#
+# 使い方:
+#   python bench_tracker.py                  # rs と pico の両方で確かめる
+#   python bench_tracker.py --sensor rs --config airplane_config.json
+#
+# 各センサーの推定器 (--config を指定した場合はその設定) で，次のことを確かめる．
+# 1. 全体: 追跡していない状態の update は，画像全体の estimate_result (point_mode="points") と同じ結果を返す．
+# 2. ROI: 同じフレームで2回目の update はROIで推定し (roi_hits が増える)，尾と頭の領域・角度・表裏は
+#    画像全体の結果と一致し，把持点の差は --max-shift 画素以内．
+#    (回転の中心がROIの中心になり，回転後の輪郭点の丸めと右端に並ぶ点の選び方が変わるため，把持点は一致しない)
+# 3. 判定の基準: 推定器の max_contours / area_max を変えた推定器では，トラッカーもその値で判定する．
+# 4. 見失った場合: 平滑化したトラッカーで (検出できるフレーム, 何もない画像, 検出できるフレーム) と
+#    処理すると，3つ目の結果は新しいトラッカーの結果と一致する．
+# 最後に，フレームを順に処理したときのROIで推定できたフレーム数を表示する．
+# 失敗があれば終了コード1で終わる．
+
+import argparse
+import sys
+
+import numpy as np
+
+import airplane_estimator
+import airplane_tracker
+import bench_airplane
+import pico_detect_airplane
+
+
+# 推定器に渡す引数 (rs: カラー画像，pico: 前処理したグレー画像とエッジのカラー画像)
+def estimator_inputs(sensor, image_bgr, preprocess):
+    if sensor == "rs":
+        return (image_bgr,)
+
+    return pico_detect_airplane.preprocess(image_bgr, **preprocess), image_bgr
+
+
+# overrides: 推定器の属性 (max_contours, area_max など) を置き換える
+def make_estimator(sensor, config, **overrides):
+    estimator = airplane_estimator.create_estimator(sensor, **config.get("mask", {}))
+    for name, value in overrides.items():
+        setattr(estimator, name, value)
+
+    return estimator
+
+
+def check_frames(sensor, estimator, frames, max_shift):
+    errors = []
+    for name, inputs in frames:
+        full = estimator.estimate_result(*inputs, point_mode="points")
+        tracker = airplane_tracker.AirplaneTracker(estimator=estimator)
+
+        first = tracker.update(*inputs)
+        if first != full.to_tuple():
+            errors.append("{} {}: first update {} != full frame {}".format(sensor, name, first, full.to_tuple()))
+        if not full.ok:
+            continue
+
+        second = tracker.update(*inputs)
+        if tracker.roi_hits != 1:
+            errors.append("{} {}: second update did not use the ROI".format(sensor, name))
+            continue
+        if tracker.region != full.region or second[1:] != (full.angle, full.flag):
+            errors.append("{} {}: ROI result {} region {} != full frame {} region {}".format(
+                sensor, name, second, tracker.region, full.to_tuple(), full.region))
+        shift = float(np.hypot(second[0][0] - full.point[0], second[0][1] - full.point[1]))
+        if shift > max_shift:
+            errors.append("{} {}: ROI grasp point {} is {:.1f} px from the full frame {}".format(
+                sensor, name, second[0], shift, full.point))
+
+    return errors
+
+
+# 推定器の判定の基準を変えると，トラッカーの結果もそれに従うことを確かめる
+def check_limits(sensor, config, frames):
+    errors = []
+    min_contours = airplane_estimator.SENSOR_PARAMS[sensor]["min_contours"]
+    strict = {
+        "max_contours": make_estimator(sensor, config, max_contours=min_contours),
+        "area_max": make_estimator(sensor, config, area_max=1),
+    }
+    for limit, estimator in strict.items():
+        for name, inputs in frames:
+            tracker = airplane_tracker.AirplaneTracker(estimator=estimator)
+            result = tracker.update(*inputs)
+            if result[:2] != airplane_tracker.UNKNOWN:
+                errors.append("{} {}: tracker accepted {} although the estimator's {} rejects it".format(
+                    sensor, name, result, limit))
+
+    return errors
+
+
+# 見失った後の結果が，見失う前の値と平滑化されないことを確かめる
+def check_lost(sensor, estimator, frames):
+    found = [inputs for name, inputs in frames if estimator.estimate_result(*inputs, point_mode="points").ok]
+    if len(found) < 2:
+        return ["{}: fewer than two frames where the airplane is detected".format(sensor)]
+    blank = tuple(np.zeros_like(image) for image in found[0])
+
+    tracker = airplane_tracker.AirplaneTracker(smoothing=0.8, estimator=estimator)
+    tracker.update(*found[0])
+    lost = tracker.update(*blank)
+    result = tracker.update(*found[-1])
+    expected = airplane_tracker.AirplaneTracker(smoothing=0.8, estimator=estimator).update(*found[-1])
+
+    errors = []
+    if lost[:2] != airplane_tracker.UNKNOWN:
+        errors.append("{}: blank frame gave {}".format(sensor, lost))
+    if result != expected:
+        errors.append("{}: result after losing the track {} != fresh tracker {}".format(sensor, result, expected))
+
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check AirplaneTracker against the full-frame estimator")
+    parser.add_argument("--sensor", choices=sorted(bench_airplane.FRAME_PATTERNS), action="append",
+                        help="estimator to check (default: all)")
+    parser.add_argument("--config", help="parameter file written by tune_airplane.py")
+    parser.add_argument("--max-shift", type=float, default=30.0,
+                        help="allowed grasp point difference between the ROI and the full frame [px]")
+    args = parser.parse_args(argv)
+
+    errors = []
+    for sensor in args.sensor or sorted(bench_airplane.FRAME_PATTERNS):
+        config = airplane_estimator.load_config(args.config, sensor) if args.config else {}
+        estimator = make_estimator(sensor, config)
+        frames = [(name, estimator_inputs(sensor, image, config.get("preprocess", {})))
+                  for name, image in bench_airplane.load_frames(sensor)]
+
+        sensor_errors = check_frames(sensor, estimator, frames, args.max_shift)
+        sensor_errors += check_limits(sensor, config, frames)
+        sensor_errors += check_lost(sensor, estimator, frames)
+        errors += sensor_errors
+
+        tracker = airplane_tracker.AirplaneTracker(estimator=estimator)
+        for name, inputs in frames:
+            tracker.update(*inputs)
+        print("{:5s} {:3d} frames  in sequence: {:3d} ROI hits  {:3d} full frames  {:3d} failures".format(
+            sensor, len(frames), tracker.roi_hits, tracker.full_frames, len(sensor_errors)))
+
+    for error in errors:
+        print("FAIL", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,19 +11,64 @@
 #==================================================
 
 
+import logging
+
 import cv2
-# from PIL import Image, ImageFilter
-import PIL.Image
 import numpy as np
-import traceback
 
-import rospy
-from sensor_msgs.msg import Image
-from std_msgs.msg import String
+from pattern_bank import SIDES, PatternBank
+from template_matcher import MultiTemplateMatcher, PyramidTemplateMatcher, build_pyramid
+
+# rospy と PIL は使うときに読み込む (テンプレート照合だけを使う場合や，ROSのない環境では不要)
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+_rospy = None
+
+
+#==================================================
+
+## @fn loginfo
+## @brief rospyが使える場合はrospy.loginfoで，使えない場合はloggingで出力する
+## @param msg 出力する文字列
+
+#==================================================
+def loginfo(msg):
+    global _rospy
+    if _rospy is None:
+        try:
+            import rospy
+        except ImportError:
+            rospy = False
+        _rospy = rospy
+
+    if _rospy:
+        _rospy.loginfo(msg)
+    else:
+        logger.info(msg)
+
 
 class CheckDirection:
-    def __init__(self):
-        return
+
+    #==================================================
+
+    ## @fn __init__
+    ## @param pattern_bank テンプレート画像を保持するPatternBank (Noneの場合は既定のディレクトリから読み込む)
+    ## @param pyramid_levels ピラミッド照合の縮小段数 (0の場合は全探索のみ)
+    ## @param pyramid_peaks 原画像で再探索する縮小画像上のピークの数
+    ## @param pyramid_ambiguity 縮小画像での左右の相関値の差がこの割合未満なら全探索に切り替える
+
+    #==================================================
+    def __init__(self, pattern_bank=None, pyramid_levels=0, pyramid_peaks=3, pyramid_ambiguity=0.05):
+        if pattern_bank is None:
+            pattern_bank = PatternBank()
+        self.pattern_bank = pattern_bank
+        self.matcher = MultiTemplateMatcher({})
+
+        self.pyramid_levels = pyramid_levels
+        self.pyramid_ambiguity = pyramid_ambiguity
+        self.pyramid_matcher = PyramidTemplateMatcher(levels=pyramid_levels, peaks=pyramid_peaks)
+        self.pyramid_fallback_count = 0
 
 
     #==================================================
@@ -42,33 +87,56 @@ class CheckDirection:
             new_image = cv2.cvtColor(new_image, cv2.COLOR_BGR2RGB)
         elif new_image.shape[2] == 4:  # 透過
             new_image = cv2.cvtColor(new_image, cv2.COLOR_BGRA2RGBA)
+        import PIL.Image
         new_image = PIL.Image.fromarray(new_image)
 
         return new_image
 
 
+    #==================================================
+
+    ## @fn to_rgb_array
+    ## @brief 画像をRGB順のnumpy配列として参照する
+    ## @param img cv2型(BGR)の画像, またはpillow型の画像
+    ## @return rgb (h, w, 3)のRGB配列 (cv2型の場合はコピーしないview)
+
+    #==================================================
+    def to_rgb_array(self, img):
+        if isinstance(img, np.ndarray):
+            if img.ndim == 2:  # モノクロ
+                return np.stack((img, img, img), axis=2)
+            return img[:, :, 2::-1]  # カラー, 透過 (BGR(A) -> RGB)
+
+        return np.asarray(img.convert("RGB"))
+
+
     #==================================================
 
     ## @fn get_objectedge
     ## @brief 物体の左端と右端を算出
-    ## @param img pillow型のカラー画像
+    ## @param img cv2型(BGR)またはpillow型のカラー画像
     ## @return left_edge 物体の左端(x, y)
     ## @return right_edge 物体の右端(x, y)
+    ##                    同じ列に複数の画素がある場合は最も下の画素を返す
 
     #==================================================
     def get_objectedge(self, img):
-        left_edge, right_edge = {'x':img.width, 'y': 0}, {'x':0, 'y': 0}
-        # print(type(left_edge['x']))
-        r, g, b = img.convert("RGB").split()
+        rgb = self.to_rgb_array(img)
+        height, width = rgb.shape[:2]
+        left_edge, right_edge = {'x': width, 'y': 0}, {'x': 0, 'y': 0}
 
         # マスク部分ではない画素情報を求めることで、物体の左端と右端を算出
-        for x in range(img.width):
-            for y in range(0, img.height):
-                if r.getpixel((x, y)) != 0 and g.getpixel((x, y)) != 0 and b.getpixel((x, y)) != 0:
-                    if left_edge['x'] >= x:
-                        left_edge['x'], left_edge['y'] = x, y
-                    if right_edge['x'] <= x:
-                        right_edge['x'], right_edge['y'] = x, y
+        mask = np.all(rgb != 0, axis=2)
+        columns = mask.any(axis=0)
+        if not columns.any():
+            return left_edge, right_edge
+
+        left_x = int(np.argmax(columns))
+        right_x = width - 1 - int(np.argmax(columns[::-1]))
+        left_edge['x'] = left_x
+        left_edge['y'] = height - 1 - int(np.argmax(mask[::-1, left_x]))
+        right_edge['x'] = right_x
+        right_edge['y'] = height - 1 - int(np.argmax(mask[::-1, right_x]))
 
         # print('edge of object, left = {}, right = {}' .format(left_edge, right_edge))
         return left_edge, right_edge
@@ -79,28 +147,31 @@ class CheckDirection:
 
     ## @fn detectCutleryOrientation
     ## @brief Cutleryオブジェクトの向き推定
-    ## @param img pillow型のカラー画像
+    ## @param img cv2型(BGR)またはpillow型のカラー画像
+    ## @param edges get_objectedgeの結果 (Noneの場合は内部で算出)
     ## @return flag 柄の部分がどちらにあるかを(left, right)で返答
     ##               柄が右側ならright, 左側ならleftで返答
 
     #==================================================
-    def detectCutleryOrientation(self, img):
-        r, g, b = img.convert("RGB").split()
+    def detectCutleryOrientation(self, img, edges=None):
+        rgb = self.to_rgb_array(img)
         # 物体の左端と右端を取得
-        left_edge, right_edge = self.get_objectedge(img)
+        if edges is None:
+            edges = self.get_objectedge(img)
+        left_edge, right_edge = edges
 
         # 物体の中間地点を算出 ((右端 - 左端) / 2) + 左端)
         width_th = ((right_edge['x'] - left_edge['x']) / 2.0) + left_edge['x']
 
         # 左と右の赤色と認識した画素の量を算出
         right, left = 0, 0
-        for x in range(left_edge['x'], right_edge['x']):
-            for y in range(0, img.height):
-                if r.getpixel((x, y)) > 100 and g.getpixel((x, y)) < 40 and b.getpixel((x, y)) < 40:
-                    if width_th > x:
-                        left += 1
-                    else:
-                        right += 1
+        if left_edge['x'] < right_edge['x']:
+            region = rgb[:, left_edge['x']:right_edge['x']]
+            red = (region[:, :, 0] > 100) & (region[:, :, 1] < 40) & (region[:, :, 2] < 40)
+            counts = np.count_nonzero(red, axis=0)
+            is_left = np.arange(left_edge['x'], right_edge['x']) < width_th
+            left = int(counts[is_left].sum())
+            right = int(counts[~is_left].sum())
 
         # どちらに赤色が多かったかの判定
         if right > left:
@@ -109,7 +180,7 @@ class CheckDirection:
             flag = "left"
 
         # print('handle postion = {}' .format(flag))
-        rospy.loginfo("handle　position = " + flag)
+        loginfo("handle　position = " + flag)
         return flag
 
 
@@ -118,27 +189,30 @@ class CheckDirection:
 
     ## @fn detectMarkerOrientation
     ## @brief Cutleryオブジェクトの向き推定
-    ## @param img pillow型のカラー画像
+    ## @param img cv2型(BGR)またはpillow型のカラー画像
+    ## @param edges get_objectedgeの結果 (Noneの場合は内部で算出)
     ## @return flag 柄の部分がどちらにあるかを(left, right)で返答
     ##             キャップでない側が右側ならright, 左側ならleftで返答
 
     #==================================================
-    def detectMarkerOrientation(self, img):
-        r, g, b = img.convert("RGB").split()
+    def detectMarkerOrientation(self, img, edges=None):
+        rgb = self.to_rgb_array(img)
         # 物体の左端と右端を取得
-        left_edge, right_edge = self.get_objectedge(img)
+        if edges is None:
+            edges = self.get_objectedge(img)
+        left_edge, right_edge = edges
 
-        left, right = 0, 0
         # 左端と右端の周辺画素におけるRGB値の総和を算出
+        # getpixelと同様に負の座標は末尾からの位置として扱い、範囲外はIndexErrorとする
         # 左端周辺の画素値計算
-        for x in range(left_edge['x'], left_edge['x'] + 10):
-            for y in range(left_edge['y'] - 10, left_edge['y'] + 10):
-                left += (r.getpixel((x, y)) + g.getpixel((x, y)) + b.getpixel((x, y)))
+        xs = np.arange(left_edge['x'], left_edge['x'] + 10)
+        ys = np.arange(left_edge['y'] - 10, left_edge['y'] + 10)
+        left = int(rgb[np.ix_(ys, xs)].sum(dtype=np.int64))
 
         # 右端周辺の画素値計算
-        for x in range(right_edge['x'] - 10, right_edge['x']):
-            for y in range(right_edge['y'] - 10, right_edge['y'] + 10):
-                right += (r.getpixel((x, y)) + g.getpixel((x, y)) + b.getpixel((x, y)))
+        xs = np.arange(right_edge['x'] - 10, right_edge['x'])
+        ys = np.arange(right_edge['y'] - 10, right_edge['y'] + 10)
+        right = int(rgb[np.ix_(ys, xs)].sum(dtype=np.int64))
 
         if left > right:
             flag = 'left'
@@ -146,65 +220,50 @@ class CheckDirection:
             flag = 'right'
 
         # print('nocap postion = {}' .format(flag))
-        rospy.loginfo("nocap postion = " + flag)
+        loginfo("nocap postion = " + flag)
         return flag
 
 
 
 
-    def detect_orientation_floor(self, img, obj_id=26):
-        method = eval('cv2.TM_CCOEFF')
-        # print(img.shape())
-        # forkの場合
-        if obj_id == 26:
-            # right template Matching
-    #         img = cv2.imread('pattern/fork_yuka_left.jpg')
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/right/fork_yuka.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            right_match = max_val
-
-            # left template Matching
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/left/fork_yuka.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            left_match = max_val
-
-        # spoonの場合
-        elif obj_id == 27:
-            # right template Matching
-    #         img = cv2.imread('pattern/spoon_yuka_left.jpg')
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/right/spoon_yuka.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            right_match = max_val
-
-            # left template Matching
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/left/spoon_yuka.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            left_match = max_val
-
-        # markerの場合
-        else:
-            # right template Matching
-    #         img = cv2.imread('pattern/spoon_yuka_left.jpg')
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/right/marker_yuka.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            right_match = max_val
-
-            # left template Matching
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/left/marker_yuka.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            left_match = max_val
+    #==================================================
+
+    ## @fn match_orientation
+    ## @brief 左右のテンプレートとのマッチング結果から向きを推定
+    ##        pyramid_levels > 0 の場合はピラミッド照合を用いる
+    ## @param img cv2型のカラー画像
+    ## @param place 場所 ("floor" or "table")
+    ## @param obj_id 物体ID (26: fork, 27: spoon, それ以外: marker)
+    ## @return orientation マッチ度の高い向き(left, right)
+
+    #==================================================
+    def match_orientation(self, img, place, obj_id=26):
+        if self.pyramid_levels > 0:
+            return self.match_orientation_pyramid(img, place, obj_id)
+
+        return self.match_orientation_exhaustive(img, place, obj_id)
+
+
+    #==================================================
+
+    ## @fn match_orientation_exhaustive
+    ## @brief 原画像の全域でテンプレートを照合して向きを推定
+
+    #==================================================
+    def match_orientation_exhaustive(self, img, place, obj_id=26):
+        method = cv2.TM_CCOEFF
+
+        # right template Matching
+        template = self.pattern_bank.get(place, obj_id, "right")
+        res = cv2.matchTemplate(img, template, method)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        right_match = max_val
+
+        # left template Matching
+        template = self.pattern_bank.get(place, obj_id, "left")
+        res = cv2.matchTemplate(img, template, method)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        left_match = max_val
 
         if left_match > right_match:
             orientation = "left"
@@ -215,68 +274,99 @@ class CheckDirection:
         return orientation
 
 
-    def detect_orientation_table(self, img, obj_id=26):
-        method = eval('cv2.TM_CCOEFF')
-        # forkの場合
-        if obj_id == 26:
-            # right template Matching
-    #         img = cv2.imread('pattern/fork_yuka_left.jpg')
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/right/fork_tukue.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            right_match = max_val
-
-            # left template Matching
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/left/fork_tukue.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            left_match = max_val
-
-        # spoonの場合
-        elif obj_id == 27:
-            # right template Matching
-    #         img = cv2.imread('pattern/spoon_yuka_left.jpg')
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/right/spoon_tukue.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            right_match = max_val
-
-            # left template Matching
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/left/spoon_tukue.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            left_match = max_val
-
-        # markerの場合
-        else:
-            # right template Matching
-    #         img = cv2.imread('pattern/spoon_yuka_left.jpg')
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/right/marker_tukue.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            right_match = max_val
-
-            # left template Matching
-            template_image_path = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern/left/marker_tukue.jpg"
-            template = cv2.imread(template_image_path)
-            res = cv2.matchTemplate(img, template, method)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            left_match = max_val
+    #==================================================
+
+    ## @fn match_orientation_pyramid
+    ## @brief 縮小画像で照合し，ピーク周辺のみを原画像で照合して向きを推定
+    ##        縮小画像での左右の相関値が近い場合は全探索で推定する
+    ## @param img cv2型のカラー画像
+    ## @param place 場所 ("floor" or "table")
+    ## @param obj_id 物体ID (26: fork, 27: spoon, それ以外: marker)
+    ## @return orientation マッチ度の高い向き(left, right)
+
+    #==================================================
+    def match_orientation_pyramid(self, img, place, obj_id=26):
+        img_pyramid = build_pyramid(img, self.pyramid_levels)
+
+        coarse = {}
+        for side in SIDES:
+            key = self.pattern_bank.key(place, obj_id, side)
+            self.pyramid_matcher.set_template(key, self.pattern_bank.load(key))
+            coarse[side] = self.pyramid_matcher.coarse_match(img_pyramid, key)
+
+        # 縮小画像での左右の差が小さい場合は判定が曖昧なので全探索を行う
+        right_coarse = coarse["right"][1][0][0]
+        left_coarse = coarse["left"][1][0][0]
+        scale = max(abs(right_coarse), abs(left_coarse))
+        if scale == 0 or abs(left_coarse - right_coarse) < self.pyramid_ambiguity * scale:
+            self.pyramid_fallback_count += 1
+            return self.match_orientation_exhaustive(img, place, obj_id)
+
+        right_match, _ = self.pyramid_matcher.refine(img, self.pattern_bank.key(place, obj_id, "right"), *coarse["right"])
+        left_match, _ = self.pyramid_matcher.refine(img, self.pattern_bank.key(place, obj_id, "left"), *coarse["left"])
 
         if left_match > right_match:
             orientation = "left"
         else:
             orientation = "right"
-        # print(orientation)
 
         return orientation
 
 
+    #==================================================
+
+    ## @fn orientation_scores
+    ## @brief 複数物体の左右テンプレートとの照合をまとめて行う
+    ##        画像のFFTは1回だけ計算し，すべてのテンプレートで共有する
+    ## @param img cv2型のカラー画像
+    ## @param place 場所 ("floor" or "table")
+    ## @param obj_ids 物体IDのリスト (26: fork, 27: spoon, それ以外: marker)
+    ## @return table {(場所, 物体名, 左右): (TM_CCOEFFの最大値, 最大値の座標)}
+
+    #==================================================
+    def orientation_scores(self, img, place, obj_ids=(26, 27, None)):
+        keys = []
+        for obj_id in obj_ids:
+            for side in SIDES:
+                key = self.pattern_bank.key(place, obj_id, side)
+                if key not in keys:
+                    keys.append(key)
+                    self.matcher.set_template(key, self.pattern_bank.load(key))
+
+        return self.matcher.match(img, keys)
+
+
+    #==================================================
+
+    ## @fn detect_orientations
+    ## @brief 複数物体の向きをまとめて推定
+    ## @return orientations {物体ID: 向き(left, right)}
+    ## @return table orientation_scoresの結果
+
+    #==================================================
+    def detect_orientations(self, img, place, obj_ids=(26, 27, None)):
+        table = self.orientation_scores(img, place, obj_ids)
+
+        orientations = {}
+        for obj_id in obj_ids:
+            right_match = table[self.pattern_bank.key(place, obj_id, "right")][0]
+            left_match = table[self.pattern_bank.key(place, obj_id, "left")][0]
+            if left_match > right_match:
+                orientations[obj_id] = "left"
+            else:
+                orientations[obj_id] = "right"
+
+        return orientations, table
+
+
+    def detect_orientation_floor(self, img, obj_id=26):
+        return self.match_orientation(img, "floor", obj_id)
+
+
+    def detect_orientation_table(self, img, obj_id=26):
+        return self.match_orientation(img, "table", obj_id)
+
+
     def detect_orientation_4patternmatch(self, img, place, obj_id):
         # y = 170
         # h = 350
@@ -292,7 +382,7 @@ class CheckDirection:
             w = 300
 
             img_trim = img[y:y+h, x:x+w]
-            orientation = self.detect_orientation_floor(img_trim)
+            orientation = self.detect_orientation_floor(img_trim, obj_id)
         else:
             y = 170
             h = 200
@@ -300,7 +390,7 @@ class CheckDirection:
             w = 280
 
             img_trim = img[y:y+h, x:x+w]
-            orientation = self.detect_orientation_table(img_trim)
+            orientation = self.detect_orientation_table(img_trim, obj_id)
         
         return orientation
 
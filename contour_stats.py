@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 輪郭ごとの統計量 (面積・重心・外接矩形・上下左右の端点) を1回だけ計算して構造化配列にまとめる
+# compare_area / get_center / get_rightedge はこの配列を参照する
+#
+# 面積は全輪郭について求めるが，重心・外接矩形・端点は必要な輪郭についてのみ求める
+# (回転後の画像では輪郭が数百個になるため，すべてを計算すると従来より遅くなる)
+# 輪郭に対する cv2.moments の m00 は cv2.contourArea と同じ値になる
+
+import cv2
+import numpy as np
+
+
+CONTOUR_STATS_DTYPE = np.dtype([
+    ("area", np.float64),
+    ("filled", np.bool_),
+    ("m10", np.float64),
+    ("m01", np.float64),
+    ("x", np.int32), ("y", np.int32), ("w", np.int32), ("h", np.int32),
+    ("left_x", np.int32), ("left_y", np.int32),
+    ("right_x", np.int32), ("right_y", np.int32),
+    ("top_x", np.int32), ("top_y", np.int32),
+    ("bottom_x", np.int32), ("bottom_y", np.int32),
+])
+
+
+# 輪郭のリストから統計量の配列を作る
+# ids: 重心などを求める輪郭のid (Noneの場合はすべて)
+def compute(contours, ids=None):
+    stats = np.zeros(len(contours), dtype=CONTOUR_STATS_DTYPE)
+    stats["area"] = np.fromiter(map(cv2.contourArea, contours), np.float64, len(contours))
+
+    if ids is None:
+        ids = range(len(contours))
+    fill(stats, contours, ids)
+
+    return stats
+
+
+# ids の輪郭について重心・外接矩形・端点を求める (計算済みのものは飛ばす)
+# 端点は同じ座標の点が複数ある場合，輪郭の点列で最初の点とする
+def fill(stats, contours, ids):
+    for i in ids:
+        if stats["filled"][i]:
+            continue
+
+        contour = contours[i]
+        mu = cv2.moments(contour)
+        points = contour.reshape(-1, 2)
+
+        row = stats[i:i + 1]
+        row["filled"] = True
+        row["m10"], row["m01"] = mu["m10"], mu["m01"]
+        row["x"], row["y"], row["w"], row["h"] = cv2.boundingRect(contour)
+        row["left_x"], row["left_y"] = points[np.argmin(points[:, 0])]
+        row["right_x"], row["right_y"] = points[np.argmax(points[:, 0])]
+        row["top_x"], row["top_y"] = points[np.argmin(points[:, 1])]
+        row["bottom_x"], row["bottom_y"] = points[np.argmax(points[:, 1])]
+
+    return stats
+
+
+# 重心 (int に切り捨て) を返す
+def center(stats, id):
+    row = stats[id]
+    x, y = int(row["m10"] / row["area"]), int(row["m01"] / row["area"])
+
+    return x, y
+
+
+# 面積が area_max 未満の輪郭のうち，面積が最大の輪郭と2番目の輪郭のidを返す
+# 従来の compare_area のループと同じ結果になるようにしている
+#   - 該当する輪郭が足りない場合のidは0
+#   - 同じ面積の輪郭がある場合は，従来のループの挙動 (面積のリセット) をそのまま再現する
+def select_top_two(areas, area_max):
+    areas = np.asarray(areas, dtype=np.float64)
+    valid = np.flatnonzero((areas < area_max) & (areas > 0))
+    valid_areas = areas[valid]
+
+    if len(np.unique(valid_areas)) != len(valid_areas):
+        return _select_top_two_sequential(areas, area_max)
+
+    if len(valid) == 0:
+        return 0, 0
+    if len(valid) == 1:
+        return int(valid[0]), 0
+
+    top = np.argpartition(-valid_areas, 1)[:2]
+    if valid_areas[top[0]] < valid_areas[top[1]]:
+        top = top[::-1]
+
+    return int(valid[top[0]]), int(valid[top[1]])
+
+
+# 従来の compare_area と同じ逐次処理 (同じ面積の輪郭がある場合に用いる)
+def _select_top_two_sequential(areas, area_max):
+    max_area = 0
+    second_area = 0
+    max_id = 0
+    second_id = 0
+
+    for num, area in enumerate(areas):
+        if area < area_max:
+            if max_area < area:
+                second_area = max_area
+                second_id = max_id
+                max_area = area
+                max_id = num
+
+            elif second_area < area:
+                second_area = area
+                second_id = num
+
+            if second_area >= max_area:
+                second_area = 0
+                max_area = 0
+
+    return max_id, second_id
+
+
+# 輪郭の点をアフィン変換し，変換後に最も右にある点を返す
+# 画像全体を warpAffine して輪郭を抽出し直す代わりに用いる
+# rounding: True の場合は画素座標に丸めた int，False の場合は丸めない float の座標を返す
+def rotated_right_point(contour, trans, rounding=True):
+    points = contour.reshape(-1, 2).astype(np.float64)
+    rotated = points @ np.asarray(trans, dtype=np.float64)[:, :2].T + trans[:, 2]
+    if not rounding:
+        right = int(np.argmax(rotated[:, 0]))
+        return float(rotated[right, 0]), float(rotated[right, 1])
+
+    rotated = np.rint(rotated).astype(np.int64)
+    right = int(np.argmax(rotated[:, 0]))
+
+    return int(rotated[right, 0]), int(rotated[right, 1])
+
+
+# 重心を float のまま返す
+def centroid(stats, id):
+    row = stats[id]
+
+    return float(row["m10"] / row["area"]), float(row["m01"] / row["area"])
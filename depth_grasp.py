@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# RealSense の深度画像を用いて，画像上の把持点をカメラ座標系の3次元の点に変換する
+#
+# 深度画像はカラー画像に位置合わせ (align) 済みで，同じ大きさであることを前提とする．
+# uint16 の場合は depth_scale を掛けて[m]に変換し，float の場合はそのまま[m]として扱う．
+# 値が0の画素 (深度を取得できなかった画素) は無視する．
+#
+# 動作確認: python depth_grasp.py
+#   imgs/airplanes のフレームから作った合成の深度画像で，把持点の奥行きを正しく求められるか確認する
+
+import collections
+
+import numpy as np
+
+
+# カメラの内部パラメータ
+#   fx, fy: 焦点距離[px], cx, cy: 画像中心[px]
+#   depth_scale: uint16 の深度の値1あたりの長さ[m] (RealSense の z16 は 0.001)
+class CameraIntrinsics(collections.namedtuple("CameraIntrinsics", "fx fy cx cy depth_scale")):
+    __slots__ = ()
+
+    def __new__(cls, fx, fy, cx, cy, depth_scale=0.001):
+        return super().__new__(cls, fx, fy, cx, cy, depth_scale)
+
+
+# 把持点 pt を中心とした (2 * radius + 1) 四方の窓の深度の中央値[m]を返す
+# 窓は画像の内側にクリップし，深度が0の画素と [min_depth, max_depth] の範囲外の画素は除く．
+# 有効な画素がない場合は None
+def median_depth(depth, pt, intrinsics, radius=3, min_depth=0.1, max_depth=10.0):
+    height, width = depth.shape[:2]
+    x, y = int(round(pt[0])), int(round(pt[1]))
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+
+    window = depth[max(y - radius, 0):y + radius + 1, max(x - radius, 0):x + radius + 1]
+    if np.issubdtype(window.dtype, np.integer):
+        values = window[window > 0].astype(np.float64) * intrinsics.depth_scale
+    else:
+        values = window[window > 0].astype(np.float64)
+
+    values = values[(values >= min_depth) & (values <= max_depth)]
+    if len(values) == 0:
+        return None
+
+    return float(np.median(values))
+
+
+# 画素 (u, v) と奥行き z[m] からカメラ座標系の点 (x, y, z)[m] を求める
+def deproject(pt, z, intrinsics):
+    x = (pt[0] - intrinsics.cx) * z / intrinsics.fx
+    y = (pt[1] - intrinsics.cy) * z / intrinsics.fy
+
+    return float(x), float(y), float(z)
+
+
+# 推定結果 (airplane_estimator.GraspResult) に3次元の把持点を書き込む
+# 把持点が求まっていない場合や深度が得られない場合は point_3d は None のまま
+def attach_depth(result, depth, intrinsics, radius=3, min_depth=0.1, max_depth=10.0):
+    if not result.ok:
+        return result
+
+    z = median_depth(depth, result.point, intrinsics, radius, min_depth, max_depth)
+    result.depth = z
+    if z is not None:
+        result.point_3d = deproject(result.point, z, intrinsics)
+
+    return result
+
+
+# カラー画像から動作確認用の深度画像 (uint16, depth_scale 単位) を作る
+# R平面のマスクの領域 (尾と頭) を囲む凸包を airplane とみなし，table_depth より object_height だけ手前にする．
+# さらに noise[m] の正規分布の雑音と，hole_ratio の割合の欠損 (値0) を加える
+def make_synthetic_depth(image_bgr, table_depth=0.8, object_height=0.03, noise=0.002, hole_ratio=0.05,
+                         threshold_r=40, depth_scale=0.001, seed=0):
+    import cv2
+
+    import morphology
+
+    rng = np.random.default_rng(seed)
+    mask, _ = morphology.r_plane_mask(image_bgr, threshold_r)
+    silhouette = np.zeros_like(mask)
+    points = cv2.findNonZero(mask)
+    if points is not None:
+        cv2.fillConvexPoly(silhouette, cv2.convexHull(points), 255)
+
+    depth = np.full(mask.shape, table_depth, dtype=np.float64)
+    depth[silhouette > 0] -= object_height
+    depth += rng.normal(0.0, noise, size=depth.shape)
+    depth[rng.random(depth.shape) < hole_ratio] = 0.0
+
+    return np.round(depth / depth_scale).astype(np.uint16)
+
+
+def main():
+    import glob
+    import os
+    import sys
+
+    import cv2
+
+    import rs_detect_airplane
+
+    pattern = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "airplanes", "frame*.jpg")
+    table_depth, object_height = 0.8, 0.03
+    failed = 0
+    for path in sorted(glob.glob(pattern)):
+        image = cv2.imread(path)
+        height, width = image.shape[:2]
+        intrinsics = CameraIntrinsics(fx=615.0, fy=615.0, cx=width / 2.0, cy=height / 2.0)
+        depth = make_synthetic_depth(image, table_depth, object_height)
+
+        result = rs_detect_airplane.estimate_grasppose_airplane_3d(image, depth, intrinsics)
+        expected = table_depth - object_height
+        ok = result.point_3d is not None and abs(result.point_3d[2] - expected) < 0.01
+        failed += not ok
+        print("{} {:4s} pt {} xyz {}".format(os.path.basename(path), "ok" if ok else "FAIL", result.point,
+                                             None if result.point_3d is None else
+                                             tuple(round(v, 3) for v in result.point_3d)))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# フレームごとの作業用バッファを使い回すための FrameContext
+#
+# カメラの解像度は一定なので，各段階で使う配列は前のフレームのものを再利用できる．
+# 推定関数に frame=FrameContext() を渡し，同じオブジェクトを次のフレームでも渡すと，
+# 2フレーム目以降は画像サイズの配列を新たに確保しない．
+# frame を渡さない場合は毎回新しい配列を確保する NULL_FRAME が使われる (従来と同じ動作)．
+#
+# バッファは (名前, 形状, dtype) ごとに1つだけ持つ．
+# 同じ名前のバッファは次に同じ名前で要求されたときに上書きされるため，
+# 推定結果として返す配列には使わないこと．
+#
+# rotations に backprojection.RotationCache を渡すと，get_point の回転行列を使い回す
+# (既定の None では使わない．角度を丸める場合は結果が変わる．RotationCache を参照)．
+
+import numpy as np
+
+
+class NullFrame:
+    rotations = None
+
+    # バッファを保持せず，毎回新しい配列を返す
+    def buffer(self, name, shape, dtype=np.uint8):
+        return np.empty(shape, dtype)
+
+    def like(self, name, array):
+        return np.empty_like(array)
+
+
+NULL_FRAME = NullFrame()
+
+
+class FrameContext:
+
+    def __init__(self, rotations=None):
+        self.buffers = {}
+        self.rotations = rotations
+        # 新たに確保したバッファの数
+        self.allocations = 0
+
+    # name のバッファを返す (形状か dtype が異なる場合は新たに確保する)
+    def buffer(self, name, shape, dtype=np.uint8):
+        if isinstance(shape, int):
+            shape = (shape,)
+        key = (name, tuple(shape), np.dtype(dtype))
+        buf = self.buffers.get(key)
+        if buf is None:
+            buf = np.empty(shape, dtype)
+            self.buffers[key] = buf
+            self.allocations += 1
+
+        return buf
+
+    # array と同じ形状・dtype のバッファを返す
+    def like(self, name, array):
+        return self.buffer(name, array.shape, array.dtype)
+
+    # 保持しているバッファの合計サイズ[byte]
+    @property
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self.buffers.values())
+
+    def clear(self):
+        self.buffers.clear()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# プロセス間でフレームをコピーせずに受け渡すための共有メモリのリングバッファ
+#
+# 推定をプロセスプールで行う場合，フレームを引数で渡すと pickle されて送られる (640x480 の BGR で約900KB)．
+# FrameRing は multiprocessing.shared_memory 上に固定サイズのスロットを並べたもので，
+# 書き込み側がフレームをスロットに1回コピーし，FrameRef (スロットの番号と通し番号) だけを送ると，
+# 読み込み側はスロットを指す numpy の配列 (読み込み専用) をコピーせずに使える．
+#
+# 使い方 (書き込み側):
+#   ring = FrameRing(slots=8, slot_bytes=640 * 480 * 3)
+#   ref = ring.write(image_bgr)     # 空きスロットがない場合は RingFull
+#   pool.apply_async(work, (ring.name, ref), callback=lambda result: ring.release(ref))
+#   ...
+#   ring.close()                    # 作成したプロセスで close すると共有メモリを削除する
+# 使い方 (読み込み側):
+#   ring = FrameRing.attach(name)
+#   with ring.frame(ref) as image:  # 使っている間にスロットが上書きされた場合は，抜けるときに StaleFrame
+#       result = estimate(image)
+#
+# スロットの再利用:
+#   書き込み側は読み込み側の処理が終わったスロットを release で返し，空いたスロットから順に使う．
+#   write(image, overwrite=True) では空きがない場合に最も古いスロットを上書きする
+#   (最新のフレームだけを処理すればよいカメラの入力向け)．
+# 通し番号による確認:
+#   各スロットのヘッダーには通し番号・形状・dtype を持つ．書き込み中は通し番号を0にし，書き終えてから設定する．
+#   読み込み側は使う前と使った後に通し番号が FrameRef と同じことを確かめ，異なる場合は StaleFrame を送出する．
+#
+# 書き込むプロセスは1つとすること．
+# 読み込み側は作成したプロセスから multiprocessing で起動したプロセスとすること
+# (共有メモリの後始末を行う resource_tracker を共有するため．別に起動したプロセスで attach すると，
+#  そのプロセスの終了時に共有メモリが削除される)．
+
+import collections
+import contextlib
+import struct
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+MAGIC = b"FRNG"
+# 共有メモリの先頭: MAGIC, スロット数, 1スロットの大きさ[byte]
+LAYOUT = struct.Struct("<4sIQ")
+ALIGN = 64
+
+# 各スロットのヘッダー (ndim は最大3次元)
+SLOT_HEADER = np.dtype([("seq", "<u8"), ("ndim", "<u4"), ("shape", "<u4", (3,)), ("dtype", "S4")])
+
+# 640x480 の BGR 画像
+DEFAULT_SLOT_BYTES = 640 * 480 * 3
+
+
+class RingFull(BufferError):
+    pass
+
+
+class StaleFrame(RuntimeError):
+    pass
+
+
+# スロットの番号と通し番号 (ワーカープロセスに送るのはこれだけ)
+FrameRef = collections.namedtuple("FrameRef", ["slot", "seq"])
+
+
+def _align(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+class FrameRing:
+
+    # slots: スロットの数 (同時に処理中にできるフレームの数)
+    # slot_bytes: 1スロットの大きさ[byte] (これより大きいフレームは書き込めない)
+    # name: 共有メモリの名前 (None の場合は自動で決める)
+    def __init__(self, slots=8, slot_bytes=DEFAULT_SLOT_BYTES, name=None):
+        slot_bytes = _align(slot_bytes)
+        size = self._data_offset(slots) + slots * slot_bytes
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        LAYOUT.pack_into(shm.buf, 0, MAGIC, slots, slot_bytes)
+        self._open(shm, owner=True)
+        self.headers["seq"] = 0
+
+    # 別のプロセスで作成したリングバッファに接続する
+    @classmethod
+    def attach(cls, name):
+        shm = shared_memory.SharedMemory(name=name)
+        magic, slots, slot_bytes = LAYOUT.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            shm.close()
+            raise ValueError("{} is not a frame ring".format(name))
+        ring = cls.__new__(cls)
+        ring._open(shm, owner=False)
+
+        return ring
+
+    @staticmethod
+    def _data_offset(slots):
+        return _align(_align(LAYOUT.size) + slots * SLOT_HEADER.itemsize)
+
+    def _open(self, shm, owner):
+        _, self.slots, self.slot_bytes = LAYOUT.unpack_from(shm.buf, 0)
+        self.shm = shm
+        self.owner = owner
+        self.headers = np.ndarray((self.slots,), SLOT_HEADER, buffer=shm.buf, offset=_align(LAYOUT.size))
+        self.data = np.ndarray((self.slots, self.slot_bytes), np.uint8, buffer=shm.buf,
+                               offset=self._data_offset(self.slots))
+        # 書き込み側の状態 (空いているスロット，処理中のスロット -> 通し番号)
+        self.free = collections.deque(range(self.slots))
+        self.held = collections.OrderedDict()
+        self.seq = 0
+        # 統計
+        self.writes = 0
+        self.overwrites = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # スロットの先頭から shape, dtype の配列を作る
+    def _view(self, slot, shape, dtype):
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+
+        return self.data[slot, :nbytes].view(dtype).reshape(shape)
+
+    # ---- 書き込み側 ----
+
+    # image を空いているスロットにコピーし，FrameRef を返す
+    # overwrite: 空きがない場合に最も古いスロットを上書きする (False の場合は RingFull)
+    def write(self, image, overwrite=False):
+        image = np.asarray(image)
+        if image.ndim > 3 or image.nbytes > self.slot_bytes:
+            raise ValueError("frame {} {} does not fit a slot of {} bytes".format(
+                image.shape, image.dtype, self.slot_bytes))
+
+        if self.free:
+            slot = self.free.popleft()
+        elif overwrite and self.held:
+            slot, _ = self.held.popitem(last=False)
+            self.overwrites += 1
+        else:
+            raise RingFull("all {} slots are in use".format(self.slots))
+
+        self.seq += 1
+        header = self.headers[slot]
+        # 書き込み中は通し番号を0にしておき，読み込み側が途中の内容を使わないようにする
+        header["seq"] = 0
+        np.copyto(self._view(slot, image.shape, image.dtype), image)
+        header["ndim"] = image.ndim
+        header["shape"][:image.ndim] = image.shape
+        header["dtype"] = image.dtype.str.encode("ascii")
+        header["seq"] = self.seq
+
+        self.held[slot] = self.seq
+        self.writes += 1
+
+        return FrameRef(slot, self.seq)
+
+    # 読み込み側の処理が終わったスロットを空きに戻す
+    # (overwrite で既に上書きされている場合は何もしない)
+    def release(self, ref):
+        if self.held.get(ref.slot) == ref.seq:
+            del self.held[ref.slot]
+            self.free.append(ref.slot)
+
+    # ---- 読み込み側 ----
+
+    # ref のフレームがまだスロットにあるか
+    def valid(self, ref):
+        return int(self.headers["seq"][ref.slot]) == ref.seq
+
+    # ref のフレームを指す読み込み専用の配列を返す (コピーしない)
+    # 配列を使い終わった後に valid(ref) で上書きされていないことを確かめること
+    def read(self, ref):
+        header = self.headers[ref.slot]
+        if int(header["seq"]) != ref.seq:
+            raise StaleFrame("slot {} holds frame {}, not {}".format(ref.slot, int(header["seq"]), ref.seq))
+        ndim = int(header["ndim"])
+        view = self._view(ref.slot, tuple(int(n) for n in header["shape"][:ndim]), header["dtype"].decode("ascii"))
+        view.flags.writeable = False
+
+        return view
+
+    # read と同じ配列を渡し，使い終わった時点で上書きされていた場合は StaleFrame を送出する
+    @contextlib.contextmanager
+    def frame(self, ref):
+        view = self.read(ref)
+        yield view
+        if not self.valid(ref):
+            raise StaleFrame("frame {} in slot {} was overwritten while in use".format(ref.seq, ref.slot))
+
+    # 共有メモリを閉じる (作成したプロセスでは削除する)
+    # read で得た配列が残っていると BufferError になるため，先に破棄すること
+    def close(self):
+        if self.shm is None:
+            return
+        self.headers = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ---- ワーカープロセス側 ----
+
+# ワーカープロセスごとに接続したリングバッファ (名前 -> FrameRing)
+_rings = {}
+
+
+# name のリングバッファに接続する (プロセスごとに1回だけ接続し，使い回す)
+def get_ring(name):
+    ring = _rings.get(name)
+    if ring is None:
+        ring = FrameRing.attach(name)
+        _rings[name] = ring
+
+    return ring
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# grasp_service.py のクライアント
+#
+# asyncio から使う場合:
+#   async with GraspClient("/tmp/grasp_service.sock") as client:
+#       result = await client.airplane(image_bgr)  # {"status": ..., "pt": [x, y], "angle": ..., "flag": ...}
+#       results = await asyncio.gather(*(client.orientation(img, "floor", 26) for img in images))
+#
+# 同期的に呼び出す場合:
+#   client = BlockingGraspClient("/tmp/grasp_service.sock")
+#   result = client.airplane(image_bgr)
+#   client.close()
+#
+# 画像は numpy の配列 (encoding="raw" では画素をそのまま，".jpg" などでは圧縮して送る)
+# またはファイルの内容のバイト列 (そのまま送る) を渡す．
+# サービスが "busy" を返した場合は busy_retries 回まで待ってから再送し，それでも busy なら ServiceBusy を送出する．
+
+import asyncio
+import itertools
+
+import grasp_service
+
+
+class ServiceError(Exception):
+    pass
+
+
+class ServiceBusy(ServiceError):
+    pass
+
+
+class GraspClient:
+
+    # path: サービスのUnixソケットのパス
+    # encoding: 配列の画像の送り方 ("raw" または cv2.imencode の拡張子 ".jpg", ".png" など)
+    # busy_retries, busy_wait: "busy" の場合に再送する回数と，最初の待ち時間[s]
+    #                          (再送するごとに2倍にし，busy_wait_max[s] を上限とする)
+    def __init__(self, path, encoding="raw", busy_retries=5, busy_wait=0.01, busy_wait_max=0.2):
+        self.path = path
+        self.encoding = encoding
+        self.busy_retries = busy_retries
+        self.busy_wait = busy_wait
+        self.busy_wait_max = busy_wait_max
+        self.reader = None
+        self.writer = None
+        self.receiver = None
+        self.waiting = {}
+        self.ids = itertools.count()
+        # 統計
+        self.busy = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        self.receiver = asyncio.ensure_future(self.receive())
+
+        return self
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+        if self.receiver is not None:
+            await self.receiver
+            self.receiver = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # 応答を読み込み，id に対応する要求に渡す
+    # 接続が閉じられた場合や不正な応答 (JSON として読めない，id が不正など) を受け取った場合は読み込みを終え，
+    # 応答を待っているすべての要求を ServiceError で失敗させる (タスクが取り消された場合も同じ)
+    async def receive(self):
+        error = None
+        try:
+            while True:
+                header, body = await grasp_service.read_message(self.reader)
+                future = self.waiting.pop(header.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(header)
+        except Exception as e:
+            error = e
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ServiceError("connection closed: {!r}".format(error)))
+            self.waiting.clear()
+
+    # 画像を (ヘッダーに加える項目, 本体) にする
+    def encode_image(self, image):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return {"encoding": "encoded"}, bytes(image)
+
+        if self.encoding == "raw":
+            import numpy as np
+            image = np.ascontiguousarray(image)
+            return {"encoding": "raw", "shape": list(image.shape), "dtype": image.dtype.str}, image.data
+
+        import cv2
+        ok, data = cv2.imencode(self.encoding, image)
+        if not ok:
+            raise ValueError("cannot encode image as {}".format(self.encoding))
+        return {"encoding": "encoded"}, data.tobytes()
+
+    # 要求を1つ送り，"ok" の応答のヘッダーを返す
+    async def request(self, op, image=None, params=None):
+        header = {"op": op, "params": params or {}}
+        body = b""
+        if image is not None:
+            fields, body = self.encode_image(image)
+            header.update(fields)
+
+        wait = self.busy_wait
+        for attempt in range(self.busy_retries + 1):
+            # 応答の読み込みを終えた後の要求には応答が渡されない
+            if self.writer is None or self.receiver is None or self.receiver.done():
+                raise ServiceError("not connected")
+            header["id"] = next(self.ids)
+            future = asyncio.get_running_loop().create_future()
+            self.waiting[header["id"]] = future
+            self.writer.writelines(grasp_service.pack_message(header, body))
+            await self.writer.drain()
+
+            reply = await future
+            if reply.get("status") == "ok":
+                return reply
+            if reply.get("status") != "busy":
+                raise ServiceError(reply.get("error"))
+
+            self.busy += 1
+            if attempt < self.busy_retries:
+                await asyncio.sleep(wait)
+                wait = min(wait * 2, self.busy_wait_max)
+
+        raise ServiceBusy(reply.get("error"))
+
+    async def airplane(self, image, threshold_r=None):
+        params = {} if threshold_r is None else {"threshold_r": threshold_r}
+        return (await self.request("airplane", image, params))["result"]
+
+    async def airplanes(self, image, threshold_r=None):
+        params = {} if threshold_r is None else {"threshold_r": threshold_r}
+        return (await self.request("airplanes", image, params))["result"]["airplanes"]
+
+    async def orientation(self, image, place, obj_id):
+        return (await self.request("orientation", image, {"place": place, "obj_id": obj_id}))["result"]["orientation"]
+
+    async def stats(self):
+        return (await self.request("stats"))["result"]
+
+
+# 専用のイベントループで GraspClient を動かし，同期的に呼び出せるようにしたもの
+class BlockingGraspClient:
+
+    def __init__(self, path, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.client = GraspClient(path, **kwargs)
+        self.loop.run_until_complete(self.client.connect())
+
+    def airplane(self, image, threshold_r=None):
+        return self.loop.run_until_complete(self.client.airplane(image, threshold_r))
+
+    def airplanes(self, image, threshold_r=None):
+        return self.loop.run_until_complete(self.client.airplanes(image, threshold_r))
+
+    def orientation(self, image, place, obj_id):
+        return self.loop.run_until_complete(self.client.orientation(image, place, obj_id))
+
+    def stats(self):
+        return self.loop.run_until_complete(self.client.stats())
+
+    def close(self):
+        self.loop.run_until_complete(self.client.close())
+        self.loop.close()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+#==================================================
+
+## @file grasp_node.py
+## @brief カメラ画像を購読して把持点推定・向き推定を行うノード
+##
+## 受信した画像は1枚分のバッファに最新のものだけを保持し，処理用のスレッドで推定する．
+## 処理がカメラのフレームレートに追いつかない場合は古いフレームを捨てるため，遅延は蓄積しない．
+## 通信部分は Transport として分離しており，ROSを使わない LocalTransport でも動作する．
+
+#==================================================
+
+
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class LatestFrameSlot:
+
+    #==================================================
+
+    ## @fn __init__
+    ## @brief 最新の1フレームだけを保持するバッファ
+
+    #==================================================
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.dropped = 0
+        self.closed = False
+
+
+    #==================================================
+
+    ## @fn put
+    ## @brief フレームを書き込む (未処理のフレームがあれば上書きして捨てる)
+
+    #==================================================
+    def put(self, frame):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.seq += 1
+            self.condition.notify()
+
+
+    #==================================================
+
+    ## @fn take
+    ## @brief 新しいフレームが来るまで待って取り出す
+    ## @param timeout 待ち時間[s] (Noneの場合は無期限)
+    ## @return seq, frame タイムアウトまたはclose後は (None, None)
+
+    #==================================================
+    def take(self, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.frame is not None or self.closed, timeout):
+                return None, None
+            if self.frame is None:
+                return None, None
+            frame, self.frame = self.frame, None
+
+            return self.seq, frame
+
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class LocalTransport:
+
+    #==================================================
+
+    ## @fn __init__
+    ## @brief ROSを使わずにプロセス内で画像を配信するスタブ
+    ##        publish_stringされたメッセージは published に (topic, text) として記録する
+
+    #==================================================
+    def __init__(self):
+        self.subscribers = {}
+        self.published = []
+        self.lock = threading.Lock()
+
+
+    def subscribe_image(self, topic, callback):
+        self.subscribers.setdefault(topic, []).append(callback)
+
+
+    def publish_image(self, topic, image):
+        for callback in self.subscribers.get(topic, []):
+            callback(image)
+
+
+    def publish_string(self, topic, text):
+        with self.lock:
+            self.published.append((topic, text))
+
+
+class RosTransport:
+
+    #==================================================
+
+    ## @fn __init__
+    ## @brief rospyを用いたTransport
+    ##        sensor_msgs/Image (bgr8, rgb8, mono8) を受信し，std_msgs/String で結果を配信する
+
+    #==================================================
+    def __init__(self, queue_size=1):
+        import rospy
+        from sensor_msgs.msg import Image
+        from std_msgs.msg import String
+
+        self.rospy = rospy
+        self.Image = Image
+        self.String = String
+        self.queue_size = queue_size
+        self.subscribers = []
+        self.publishers = {}
+
+
+    #==================================================
+
+    ## @fn image_to_array
+    ## @brief sensor_msgs/Imageをcv2型(BGR)の画像に変換
+
+    #==================================================
+    def image_to_array(self, msg):
+        if msg.encoding == "mono8":
+            image = np.frombuffer(msg.data, dtype=np.uint8).reshape(msg.height, msg.step)[:, :msg.width]
+            return np.stack((image, image, image), axis=2)
+
+        image = np.frombuffer(msg.data, dtype=np.uint8).reshape(msg.height, msg.step)
+        image = image[:, :msg.width * 3].reshape(msg.height, msg.width, 3)
+        if msg.encoding == "rgb8":
+            image = image[:, :, ::-1]
+        elif msg.encoding != "bgr8":
+            raise ValueError("unsupported encoding: {}".format(msg.encoding))
+
+        return image
+
+
+    def subscribe_image(self, topic, callback):
+        # queue_sizeを1にしてrospy側でも古いフレームを溜めないようにする
+        subscriber = self.rospy.Subscriber(topic, self.Image, lambda msg: callback(self.image_to_array(msg)),
+                                           queue_size=self.queue_size, buff_size=2 ** 24)
+        self.subscribers.append(subscriber)
+
+
+    def publish_string(self, topic, text):
+        publisher = self.publishers.get(topic)
+        if publisher is None:
+            publisher = self.rospy.Publisher(topic, self.String, queue_size=10)
+            self.publishers[topic] = publisher
+        publisher.publish(self.String(data=text))
+
+
+class DetectionNode:
+
+    #==================================================
+
+    ## @fn __init__
+    ## @param transport 画像の受信と結果の配信を行うTransport
+    ## @param process_fn 画像を受け取り，JSONに変換できる結果を返す関数
+    ## @param image_topic 購読する画像のトピック
+    ## @param result_topic 結果を配信するトピック
+
+    #==================================================
+    def __init__(self, transport, process_fn, image_topic, result_topic):
+        self.transport = transport
+        self.process_fn = process_fn
+        self.image_topic = image_topic
+        self.result_topic = result_topic
+
+        self.slot = LatestFrameSlot()
+        self.thread = None
+        self.received = 0
+        self.processed = 0
+
+        self.transport.subscribe_image(self.image_topic, self.on_image)
+
+
+    def on_image(self, image):
+        self.received += 1
+        self.slot.put(image)
+
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+    def stop(self, timeout=None):
+        self.slot.close()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+
+    @property
+    def dropped(self):
+        return self.slot.dropped
+
+
+    #==================================================
+
+    ## @fn run
+    ## @brief 処理用スレッドの本体 (最新のフレームを取り出して推定し，結果を配信)
+
+    #==================================================
+    def run(self):
+        while True:
+            seq, image = self.slot.take()
+            if image is None:
+                break
+
+            start = time.perf_counter()
+            try:
+                result = {"seq": seq, "result": self.process_fn(image)}
+            except Exception as e:
+                result = {"seq": seq, "error": repr(e)}
+            result["time"] = time.perf_counter() - start
+
+            self.processed += 1
+            self.transport.publish_string(self.result_topic, json.dumps(result))
+
+
+#==================================================
+
+## @fn airplane_processor
+## @brief rs_detect_airplaneで把持点を推定する処理関数を返す
+## @param threshold_r R平面の閾値 (None の場合は設定ファイルの値)
+## @param multi Trueの場合は画像内の複数のairplaneを推定し，{"airplanes": [...]} を返す
+## @param config tune_airplane.py が出力した設定ファイルのパス (None の場合は既定の設定)
+
+#==================================================
+def airplane_processor(threshold_r=None, multi=False, config=None):
+    import frame_context
+    import rs_detect_airplane
+
+    if config:
+        rs_detect_airplane.load_config(config)
+
+    # 処理用スレッドは1つなので，作業用の配列はフレーム間で使い回す
+    frame = frame_context.FrameContext()
+
+    def process_all(image):
+        results = rs_detect_airplane.estimate_grasppose_airplanes(image, threshold_r=threshold_r, frame=frame)
+        return {"airplanes": [{"pt": [int(pt[0]), int(pt[1])], "angle": float(angle), "flag": flag}
+                              for pt, angle, flag in results]}
+
+    if multi:
+        return process_all
+
+    def process(image):
+        result = rs_detect_airplane.estimate_grasppose_airplane_result(image, threshold_r=threshold_r, frame=frame)
+        pt, angle, flag = result.to_tuple()
+        return {"status": result.status.value, "pt": [int(pt[0]), int(pt[1])], "angle": float(angle), "flag": flag}
+
+    return process
+
+
+#==================================================
+
+## @fn orientation_processor
+## @brief CheckDirectionで向きを推定する処理関数を返す
+
+#==================================================
+def orientation_processor(place, obj_id, checker=None):
+    if checker is None:
+        from check_direction import CheckDirection
+        checker = CheckDirection()
+
+    def process(image):
+        return {"orientation": checker.detect_orientation_4patternmatch(image, place, obj_id)}
+
+    return process
+
+
+if __name__ == "__main__":
+    import rospy
+
+    rospy.init_node("hma_img_processing")
+    mode = rospy.get_param("~mode", "airplane")
+    image_topic = rospy.get_param("~image_topic", "/camera/color/image_raw")
+    result_topic = rospy.get_param("~result_topic", "~result")
+
+    if mode == "airplane":
+        process_fn = airplane_processor(rospy.get_param("~threshold_r", None), rospy.get_param("~multi", False),
+                                        rospy.get_param("~config", None))
+    else:
+        process_fn = orientation_processor(rospy.get_param("~place", "floor"), rospy.get_param("~obj_id", 26))
+
+    node = DetectionNode(RosTransport(), process_fn, image_topic, result_topic)
+    node.start()
+    rospy.spin()
+    node.stop()
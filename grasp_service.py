@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 把持点推定・向き推定をUnixソケットで受け付けるローカルサービス (asyncio)
+#
+# 使い方:
+#   python grasp_service.py --socket /tmp/grasp.sock -j 4
+#   python grasp_service.py --socket /tmp/grasp.sock --config airplane_config.json --pattern-dir パターンのディレクトリ
+# クライアントは grasp_client.GraspClient，負荷試験は bench_grasp_service.py を参照．
+#
+# メッセージ (要求・応答とも):
+#   ヘッダー長 (uint32, big endian) | 本体長 (uint32, big endian) | ヘッダー (UTF-8 の JSON) | 本体 (バイト列)
+# 要求のヘッダー:
+#   {"id": 要求の番号, "op": OPS のいずれか, "params": {...},
+#    "encoding": "encoded" (jpg/png などのファイルの内容) または "raw" (画素の配列),
+#    "shape": [h, w, c], "dtype": "uint8" (raw の場合)}
+#   本体は画像 (op が "stats" の場合は空)
+# 応答のヘッダー:
+#   {"id": 要求の番号, "status": "ok", "result": 推定結果, "time": 推定の処理時間[s], "coalesced": bool}
+#   {"id": 要求の番号, "status": "busy" または "error", "error": 内容}
+#   本体は空
+#
+# 1つの接続で複数の要求を続けて送ってよく，応答は処理が終わった順に返る (id で対応付ける)．
+#
+# 推定 (画像の復号を含む) はプロセスプールで行い，イベントループでは通信だけを行う．
+#   重複の統合: 同じ op・params・画像の要求が処理中の場合は，新たに処理せず同じ結果を返す
+#   背圧: 処理中の要求が --max-pending 件に達したら "busy" を返す (クライアントは待ってから再送する)．
+#         また1つの接続で応答を待っている要求が --max-inflight 件に達したら，その接続からの読み込みを止める
+#   共有メモリ: raw の画像は frame_ring.FrameRing (--ring-slots 個のスロット) にコピーし，ワーカープロセスには
+#         FrameRef だけを送る (pickle で画像を送らない)．スロットが空いていない場合や大きすぎる画像，
+#         encoded の画像は従来どおり本体を引数で送る
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import signal
+import struct
+import time
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+HEADER = struct.Struct(">II")
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# 受け付ける op (stats 以外はワーカープロセスで処理する)
+#   airplane:    rs_detect_airplane で把持点を推定 (params: threshold_r)
+#   airplanes:   画像内の複数のairplaneの把持点を推定 (params: threshold_r)
+#   orientation: CheckDirection で向きを推定 (params: place, obj_id)
+#   stats:       サービスの統計
+OPS = ("airplane", "airplanes", "orientation", "stats")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+# ヘッダーと本体をメッセージのバイト列のリストにする (writer.writelines に渡す)
+# body: bytes-like (numpy の配列の memoryview などはコピーせずにそのまま送る)
+def pack_message(header, body=b""):
+    data = json.dumps(header).encode("utf-8")
+    body = memoryview(body).cast("B")
+
+    return [HEADER.pack(len(data), body.nbytes), data, body]
+
+
+# メッセージを1つ読み込み (ヘッダー, 本体) を返す
+# 接続が閉じられた場合は asyncio.IncompleteReadError
+async def read_message(reader):
+    header_len, body_len = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if header_len > MAX_HEADER_BYTES or body_len > MAX_BODY_BYTES:
+        raise ProtocolError("message too large: header {} body {}".format(header_len, body_len))
+
+    header = json.loads((await reader.readexactly(header_len)).decode("utf-8"))
+    body = await reader.readexactly(body_len) if body_len else b""
+    if not isinstance(header, dict):
+        raise ProtocolError("header is not an object")
+
+    return header, body
+
+
+# ---- ワーカープロセス側 ----
+
+# ワーカープロセスごとに持ち，(op, params) ごとの処理関数と向き推定器を使い回す
+_processors = {}
+_checker = None
+_pattern_dir = None
+
+
+def init_worker(config=None, pattern_dir=None):
+    global _pattern_dir
+    _pattern_dir = pattern_dir
+    if config:
+        import rs_detect_airplane
+        rs_detect_airplane.load_config(config)
+
+
+def get_processor(op, params):
+    global _checker
+    key = (op, json.dumps(params, sort_keys=True))
+    process = _processors.get(key)
+    if process is not None:
+        return process
+
+    import grasp_node
+    if op == "orientation":
+        if _checker is None:
+            from check_direction import CheckDirection
+            from pattern_bank import PatternBank
+            _checker = CheckDirection(PatternBank(_pattern_dir) if _pattern_dir else None)
+        process = grasp_node.orientation_processor(params.get("place", "floor"), params.get("obj_id", 26),
+                                                   checker=_checker)
+    else:
+        process = grasp_node.airplane_processor(params.get("threshold_r"), multi=(op == "airplanes"))
+    _processors[key] = process
+
+    return process
+
+
+def decode_image(encoding, shape, dtype, body):
+    import numpy as np
+
+    if encoding == "raw":
+        shape = tuple(shape)
+        image = np.frombuffer(body, dtype=dtype)
+        if image.size != int(np.prod(shape)):
+            raise ValueError("raw image of {} bytes does not match shape {} {}".format(len(body), shape, dtype))
+        return image.reshape(shape)
+
+    import cv2
+    image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("cannot decode image")
+
+    return image
+
+
+# 1つの要求を処理する (ワーカープロセスで実行される)
+# 戻り値: (推定結果, 処理時間[s])
+def process_request(op, params, encoding, shape, dtype, body):
+    start = time.perf_counter()
+    image = decode_image(encoding, shape, dtype, body)
+    result = get_processor(op, params)(image)
+
+    return result, time.perf_counter() - start
+
+
+# 共有メモリのリングバッファにある画像で1つの要求を処理する (ワーカープロセスで実行される)
+def process_shared(op, params, ring_name, ref):
+    import frame_ring
+
+    start = time.perf_counter()
+    with frame_ring.get_ring(ring_name).frame(ref) as image:
+        result = get_processor(op, params)(image)
+
+    return result, time.perf_counter() - start
+
+
+# ---- イベントループ側 ----
+
+class GraspService:
+
+    # executor: 推定を行う concurrent.futures.Executor (ProcessPoolExecutor など)
+    # max_pending: 同時に処理する要求の上限 (重複を統合した後の数)
+    # max_inflight: 1つの接続で応答を待っている要求の上限
+    # ring: raw の画像をワーカープロセスに渡す frame_ring.FrameRing (None の場合は引数で送る)
+    def __init__(self, executor, max_pending=32, max_inflight=8, ring=None):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.max_inflight = max_inflight
+        self.ring = ring
+        # 処理中の要求 (重複の判定のキー -> Future)
+        self.pending = {}
+        self.stats = collections.Counter()
+
+    async def handle_connection(self, reader, writer):
+        self.stats["connections"] += 1
+        window = asyncio.Semaphore(self.max_inflight)
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                # 応答を待っている要求が多い場合は，ここで読み込みを止める
+                await window.acquire()
+                try:
+                    header, body = await read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    window.release()
+                    break
+                except (ProtocolError, ValueError) as e:
+                    window.release()
+                    logger.warning("closing connection: %s", e)
+                    break
+
+                task = asyncio.ensure_future(self.respond(header, body, writer, lock, window))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def respond(self, header, body, writer, lock, window):
+        try:
+            reply = await self.dispatch(header, body)
+        except Exception as e:
+            self.stats["errors"] += 1
+            reply = {"status": "error", "error": repr(e)}
+        finally:
+            window.release()
+        reply["id"] = header.get("id")
+
+        async with lock:
+            try:
+                writer.writelines(pack_message(reply))
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, header, body):
+        op = header.get("op")
+        self.stats["requests"] += 1
+        if op == "stats":
+            return {"status": "ok", "result": dict(self.stats, pending=len(self.pending))}
+        if op not in OPS:
+            raise ValueError("unknown op: {!r}".format(op))
+
+        params = header.get("params") or {}
+        encoding = header.get("encoding", "encoded")
+        shape = header.get("shape")
+        dtype = header.get("dtype", "uint8")
+        key = (op, json.dumps(params, sort_keys=True), encoding, json.dumps(shape), dtype,
+               hashlib.blake2b(body, digest_size=16).digest())
+
+        coalesced = key in self.pending
+        if coalesced:
+            self.stats["coalesced"] += 1
+            future = self.pending[key]
+        elif len(self.pending) >= self.max_pending:
+            self.stats["busy"] += 1
+            return {"status": "busy", "error": "{} requests pending".format(len(self.pending))}
+        else:
+            future = self.submit(op, params, encoding, shape, dtype, body)
+            self.pending[key] = future
+            future.add_done_callback(lambda f: self.finish(key, f))
+
+        # 接続が切れて待っている側がキャンセルされても，他の待っている要求のために処理は続ける
+        result, elapsed = await asyncio.shield(future)
+        self.stats["completed"] += 1
+
+        return {"status": "ok", "result": result, "time": elapsed, "coalesced": coalesced}
+
+    # 要求をワーカープロセスに送る (raw の画像はできればリングバッファを通す)
+    def submit(self, op, params, encoding, shape, dtype, body):
+        loop = asyncio.get_running_loop()
+        if self.ring is not None and encoding == "raw":
+            try:
+                ref = self.ring.write(decode_image(encoding, shape, dtype, body))
+            except (BufferError, ValueError, TypeError):
+                # スロットが空いていない・入らない・不正な画像は引数で送る (不正な場合はワーカーでエラーになる)
+                self.stats["unshared"] += 1
+            else:
+                self.stats["shared"] += 1
+                future = loop.run_in_executor(self.executor, process_shared, op, params, self.ring.name, ref)
+                future.add_done_callback(lambda f: self.ring.release(ref))
+                return future
+
+        return loop.run_in_executor(self.executor, process_request, op, params, encoding, shape, dtype, body)
+
+    def finish(self, key, future):
+        self.pending.pop(key, None)
+        # 待っている要求がなくなった場合でも例外を取り出しておく
+        if not future.cancelled() and future.exception() is not None:
+            logger.debug("request failed: %r", future.exception())
+
+
+async def serve(args):
+    import concurrent.futures
+    import frame_ring
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+    # ワーカープロセスを起動する前に作成する
+    ring = None
+    if args.ring_slots > 0:
+        ring = frame_ring.FrameRing(slots=args.ring_slots, slot_bytes=args.ring_slot_bytes)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                                      initargs=(args.config, args.pattern_dir))
+    service = GraspService(executor, max_pending=args.max_pending, max_inflight=args.max_inflight, ring=ring)
+    server = await asyncio.start_unix_server(service.handle_connection, path=args.socket)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    logger.info("listening on %s with %d workers", args.socket, args.workers)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        executor.shutdown(wait=True)
+        if ring is not None:
+            ring.close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        logger.info("stats %s", dict(service.stats))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="serve grasp and orientation estimation over a Unix socket")
+    parser.add_argument("--socket", default="/tmp/grasp_service.sock")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-pending", type=int, default=32, help="requests processed at once before 'busy'")
+    parser.add_argument("--max-inflight", type=int, default=8, help="unanswered requests per connection")
+    parser.add_argument("--ring-slots", type=int, default=16,
+                        help="shared-memory slots for raw frames (0: send frames to workers by pickling)")
+    parser.add_argument("--ring-slot-bytes", type=int, default=640 * 480 * 3, help="largest raw frame [byte]")
+    parser.add_argument("--config", help="parameter file written by tune_airplane.py")
+    parser.add_argument("--pattern-dir", help="template directory for orientation requests")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# pico_detect_airplane の expansion / contraction / trim を配列演算で置き換えたもの
+# 画素ごとのループではなく，積分画像を用いて窓内の白画素数を一括で求める
+#
+# 元の実装は roi = src[y-ksize:y+ksize+1, x-ksize:x+ksize+1] で窓を切り出すため，
+# y < ksize (x < ksize) では開始インデックスが負になり，末尾からのスライスとして解釈される．
+# 画像が窓より大きい場合，この窓は空になるので画素は変化しない．
+# legacy_border=True (デフォルト) ではこの挙動をそのまま再現し，
+# legacy_border=False では上端・左端も下端・右端と同様に画像内へクリップした窓を用いる．
+#
+# r_plane_mask は rs_detect_airplane の R平面のマスク作成 (閾値処理・収縮・膨張) をまとめたもの
+
+import cv2
+import numpy as np
+
+import frame_context
+
+
+# 各画素の窓の開始・終了インデックスを求める (Python のスライスの正規化と同じ規則)
+def _window_bounds(length, ksize, legacy_border=True):
+    idx = np.arange(length)
+    start = idx - ksize
+    if legacy_border:
+        # 負のインデックスは末尾からの位置として扱われる
+        start = np.where(start < 0, start + length, start)
+    start = np.clip(start, 0, length)
+    stop = np.minimum(idx + ksize + 1, length)
+    # stop <= start の場合は空の窓
+    stop = np.maximum(stop, start)
+
+    return start, stop
+
+
+# 各画素の窓内にある白画素の数と窓の画素数を求める
+# frame: 作業用バッファを取得する FrameContext (戻り値の配列も frame のバッファになる)
+def window_count(src, ksize, legacy_border=True, frame=frame_context.NULL_FRAME):
+    h, w = src.shape
+    nonzero = frame.buffer("window_nonzero", (h, w), np.uint8)
+    np.not_equal(src, 0, out=nonzero.view(np.bool_))
+    integral = cv2.integral(nonzero, sum=frame.buffer("window_integral", (h + 1, w + 1), np.int32),
+                            sdepth=cv2.CV_32S)
+
+    y0, y1 = _window_bounds(h, ksize, legacy_border)
+    x0, x1 = _window_bounds(w, ksize, legacy_border)
+
+    # count = I[y1, x1] - I[y0, x1] - I[y1, x0] + I[y0, x0]
+    # 行 → 列の順に取り出して，画像サイズの一時配列を作らないようにする
+    rows = frame.buffer("window_rows", (h, w + 1), np.int32)
+    count = frame.buffer("window_count", (h, w), np.int32)
+    corner = frame.buffer("window_corner", (h, w), np.int32)
+    np.take(integral, y1, axis=0, out=rows, mode="clip")
+    np.take(rows, x1, axis=1, out=count, mode="clip")
+    np.take(rows, x0, axis=1, out=corner, mode="clip")
+    np.subtract(count, corner, out=count)
+    np.take(integral, y0, axis=0, out=rows, mode="clip")
+    np.take(rows, x1, axis=1, out=corner, mode="clip")
+    np.subtract(count, corner, out=count)
+    np.take(rows, x0, axis=1, out=corner, mode="clip")
+    np.add(count, corner, out=count)
+
+    # 型変換を伴うと作業用の配列が確保されるため，先に int32 にしておく
+    size = np.multiply.outer((y1 - y0).astype(np.int32), (x1 - x0).astype(np.int32),
+                             out=frame.buffer("window_size", (h, w), np.int32))
+
+    return count, size
+
+
+# dst に src を書き込んで返す (dst が None の場合は新たに確保する)
+def _prepare_dst(src, dst):
+    if dst is None:
+        return src.copy()
+    if dst is not src:
+        np.copyto(dst, src)
+
+    return dst
+
+
+# 膨張処理
+# 近傍の白画素数が threshold を超える画素を白色に塗り替える
+def expansion(src, ksize=4, threshold=5, legacy_border=True, dst=None, frame=frame_context.NULL_FRAME):
+    count, _ = window_count(src, ksize, legacy_border, frame)
+    mask = np.greater(count, threshold, out=frame.buffer("window_mask", src.shape, np.bool_))
+
+    dst = _prepare_dst(src, dst)
+    np.copyto(dst, 255, where=mask)
+
+    return dst
+
+
+# 収縮処理
+# 近傍に黒画素が1つでもあれば，注目画素を黒色に塗り替える
+def contraction(src, ksize=11, legacy_border=True, dst=None, frame=frame_context.NULL_FRAME):
+    count, size = window_count(src, ksize, legacy_border, frame)
+    mask = np.less(count, size, out=frame.buffer("window_mask", src.shape, np.bool_))
+
+    dst = _prepare_dst(src, dst)
+    np.copyto(dst, 0, where=mask)
+
+    return dst
+
+
+# トリミング処理
+# 上下 trim_size_y, 左右 trim_size_x の画素を黒色にする
+# 元の実装と同じく，下端・右端は y > h - trim_size_y (x > w - trim_size_x) の範囲を塗りつぶす
+def trim(src, trim_size_x=15, trim_size_y=15, dst=None):
+    h, w = src.shape
+
+    dst = _prepare_dst(src, dst)
+
+    dst[:max(trim_size_y, 0)] = 0
+    dst[max(h - trim_size_y + 1, 0):] = 0
+    dst[:, :max(trim_size_x, 0)] = 0
+    dst[:, max(w - trim_size_x + 1, 0):] = 0
+
+    return dst
+
+
+_RECT_KERNELS = {}
+
+
+# 全要素が1の矩形カーネル (作成したものは使い回す)
+def rect_kernel(ksize):
+    kernel = _RECT_KERNELS.get(ksize)
+    if kernel is None:
+        kernel = np.ones((ksize, ksize), np.uint8)
+        _RECT_KERNELS[ksize] = kernel
+
+    return kernel
+
+
+# R平面を取り出し，閾値以下の画素を白 (255) にした2値画像を作る
+# cv2.split で3平面を作る代わりにR平面だけを取り出し，反転した2値化を1回で行う．
+# dst, plane: 結果を書き込む配列 (画像と同じ大きさの uint8．Noneの場合は新たに確保する)
+# 戻り値: (2値画像, R平面)
+def r_plane_threshold(image_bgr, threshold_r=40, dst=None, plane=None):
+    plane = cv2.extractChannel(image_bgr, 2, dst=plane)
+    _, dst = cv2.threshold(plane, threshold_r, 255, cv2.THRESH_BINARY_INV, dst=dst)
+
+    return dst, plane
+
+
+# ksize x ksize の矩形カーネルで1回収縮し，iterations 回膨張する
+# ksize が奇数の場合，ksize x ksize の矩形カーネルで iterations 回膨張した結果は，
+# 1辺 (ksize - 1) * iterations + 1 の矩形カーネルで1回膨張した結果と一致する．
+# ksize が偶数の場合はカーネルの中心 (アンカー) が半画素ずれ，そのずれが膨張のたびに積み重なるため一致しない．
+# この場合は元の実装どおり ksize x ksize のカーネルで iterations 回膨張する．
+# dst に src を渡すとその場で処理する
+def open_mask(src, ksize=5, iterations=6, dst=None):
+    dst = cv2.erode(src, rect_kernel(ksize), dst=dst)
+    if iterations <= 0:
+        return dst
+    if ksize % 2 == 1:
+        cv2.dilate(dst, rect_kernel((ksize - 1) * iterations + 1), dst=dst)
+    else:
+        cv2.dilate(dst, rect_kernel(ksize), dst=dst, iterations=iterations)
+
+    return dst
+
+
+# R平面の閾値処理と収縮・膨張を行い，物体領域のマスクを作る
+# dst, plane: 結果を書き込む配列 (画像と同じ大きさの uint8．Noneの場合は新たに確保する)
+# 戻り値: (マスク, R平面)
+def r_plane_mask(image_bgr, threshold_r=40, ksize=5, iterations=6, dst=None, plane=None):
+    dst, plane = r_plane_threshold(image_bgr, threshold_r, dst=dst, plane=plane)
+
+    # 収縮・膨張は dst 上でそのまま行う
+    open_mask(dst, ksize, iterations, dst=dst)
+
+    return dst, plane
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+#==================================================
+
+## @file pattern_bank.py
+## @brief 向き推定のテンプレート画像をメモリ上に保持するクラス
+
+#==================================================
+
+
+import os
+
+import cv2
+
+
+# 従来のテンプレート画像の保存場所
+DEFAULT_PATTERN_DIR = "/home/hma/ros_ws/hma/hma_ws/src/robot_pkgs/tasks/hma_hsr_wrs_pkg/script/src/task1/pattern"
+
+# 場所とファイル名の対応 (床: yuka, 机: tukue)
+PLACE_NAMES = {"floor": "yuka", "table": "tukue"}
+# 物体IDとファイル名の対応 (それ以外はmarker)
+OBJECT_NAMES = {26: "fork", 27: "spoon"}
+MARKER_NAME = "marker"
+SIDES = ("right", "left")
+
+
+class PatternBank:
+
+    #==================================================
+
+    ## @fn __init__
+    ## @param root_dir テンプレート画像のディレクトリ ({root_dir}/{side}/{物体名}_{場所名}.jpg)
+    ## @param preload Trueの場合はすべてのテンプレートを起動時に読み込む
+
+    #==================================================
+    def __init__(self, root_dir=DEFAULT_PATTERN_DIR, preload=False):
+        self.root_dir = root_dir
+        self.templates = {}
+        if preload:
+            self.preload()
+
+
+    #==================================================
+
+    ## @fn key
+    ## @brief (place, obj_id, side)をキャッシュのキーに変換
+    ## @return (場所, 物体名, 左右)
+
+    #==================================================
+    def key(self, place, obj_id, side):
+        if place not in PLACE_NAMES:
+            raise ValueError("unknown place: {}".format(place))
+        if side not in SIDES:
+            raise ValueError("unknown side: {}".format(side))
+
+        return place, OBJECT_NAMES.get(obj_id, MARKER_NAME), side
+
+
+    #==================================================
+
+    ## @fn path
+    ## @brief テンプレート画像のパスを返す
+
+    #==================================================
+    def path(self, place, obj_id, side):
+        return self.key_path(self.key(place, obj_id, side))
+
+
+    #==================================================
+
+    ## @fn key_path
+    ## @brief keyに対応するテンプレート画像のパスを返す
+
+    #==================================================
+    def key_path(self, key):
+        place, obj_name, side = key
+        file_name = obj_name + "_" + PLACE_NAMES[place] + ".jpg"
+
+        return os.path.join(self.root_dir, side, file_name)
+
+
+    #==================================================
+
+    ## @fn get
+    ## @brief テンプレート画像を返す (初回のみ読み込む)
+    ## @return template cv2型のカラー画像
+
+    #==================================================
+    def get(self, place, obj_id, side):
+        return self.load(self.key(place, obj_id, side))
+
+
+    #==================================================
+
+    ## @fn load
+    ## @brief keyで指定したテンプレート画像を返す (初回のみ読み込む)
+    ## @param key (場所, 物体名, 左右)
+
+    #==================================================
+    def load(self, key):
+        template = self.templates.get(key)
+        if template is None:
+            template_image_path = self.key_path(key)
+            template = cv2.imread(template_image_path)
+            if template is None:
+                raise IOError("cannot read template: {}".format(template_image_path))
+            self.templates[key] = template
+
+        return template
+
+
+    #==================================================
+
+    ## @fn preload
+    ## @brief すべての場所・物体・左右のテンプレートを読み込む
+
+    #==================================================
+    def preload(self):
+        for place in PLACE_NAMES:
+            for obj_id in list(OBJECT_NAMES) + [None]:
+                for side in SIDES:
+                    self.get(place, obj_id, side)
+
+
+    #==================================================
+
+    ## @fn reload
+    ## @brief 保持しているテンプレートを破棄して読み込み直す
+    ## @param root_dir 指定した場合はテンプレートのディレクトリを変更する
+
+    #==================================================
+    def reload(self, root_dir=None):
+        if root_dir is not None:
+            self.root_dir = root_dir
+
+        loaded = list(self.templates)
+        self.templates = {}
+        for key in loaded:
+            self.load(key)
@@ -1,247 +1,111 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# pico のカメラ用の把持点推定
+# 処理の本体は airplane_estimator にあり，ここでは "edge-morphology" のマスクを用いる推定器を呼び出す
+
+# 起動を速くするため，モジュールの読み込み時には cv2 と numpy 以外の重いライブラリを読み込まない
+# (matplotlib などの表示用のライブラリは，使う場合に __main__ の中で読み込む)
+
 import cv2
-import numpy as np
-import math
-import traceback
+
+import airplane_estimator
+import frame_context
+import morphology
 
 # from IPython.display import Image
-import matplotlib.pyplot as plt
 
 # import roslib
 # GP_AIRPLANE_TEMP_PATH = roslib.packages.get_pkg_dir("hma_hsr_wrs_pkg") + "/io/airplane"
 
 
-# 膨張処理
-def expansion(src, ksize=4):
-    h, w = src.shape
-    dst = src.copy()
-
-    for y in range(0, h):
-        for x in range(0, w):
-            # 近傍に白い画素が2つ以上あれば、注目画素を白色に塗り替える
-            roi = src[y-ksize:y+ksize+1, x-ksize:x+ksize+1]
-            if np.count_nonzero(roi) > 5:
-                dst[y][x] = 255
-
-    return dst
-
-# 収縮処理
-def contraction(src, ksize=11):
-    h, w = src.shape
-    dst = src.copy()
-
-    for y in range(0, h):
-        for x in range(0, w):
-            # 近傍に黒い画素が1つでもあれば、注目画素を黒色に塗り替える
-            roi = src[y-ksize:y+ksize+1, x-ksize:x+ksize+1]
-            if roi.size - np.count_nonzero(roi) > 0:
-                dst[y][x] = 0
-
-    return dst
-
-# トリミング処理
-def trim(src, trim_size_x=15, trim_size_y=15):
-
-    h, w = src.shape
-    dst = src.copy()
-
-    for y in range(0, h):
-        for x in range(0, w):
-            if y < trim_size_y or y > h - trim_size_y:
-                dst[y][x] = 0
-            if x < trim_size_x or x > w - trim_size_x:
-                dst[y][x] = 0
-
-    return dst
+_estimator = airplane_estimator.create_estimator("pico")
 
-def estimate_grasppose_airplane(image_gray, image_edge):
-    retval, image_bw = cv2.threshold(image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+# 前処理 (preprocess) の既定の設定
+#   expansion_ksize, expansion_threshold: 膨張の窓の大きさと，白にする近傍の白画素数 (この値を超えたら白)
+#   contraction_ksize: 収縮の窓の大きさ
+PREPROCESS_PARAMS = dict(expansion_ksize=4, expansion_threshold=5, contraction_ksize=11)
+_preprocess_params = dict(PREPROCESS_PARAMS)
 
-    # 輪郭の検出
-    contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    frontback_flag = "front"
 
-    # 裏向きは膨張と収縮のパラメータを変更する
-    if len(contours) <= 2:
-        print("Retry edge")
+# 設定ファイル (tune_airplane.py の出力) の "pico" の設定で推定器と前処理を作り直す
+def load_config(path):
+    global _estimator, _preprocess_params
+    config = airplane_estimator.load_config(path, "pico")
+    _estimator = airplane_estimator.create_estimator("pico", **config.get("mask", {}))
+    _preprocess_params = dict(PREPROCESS_PARAMS, **config.get("preprocess", {}))
 
-        image_con = image_edge.copy()
-        image_con = cv2.cvtColor(image_con, cv2.COLOR_BGR2GRAY)
 
-        image_con = expansion(image_con, ksize = 5)
-        image_con = contraction(image_con, ksize = 11)
-        image_con = trim(image_con)
-
-        image_gray = image_con.copy()
-        retval, image_bw = cv2.threshold(image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        # これでも正常に領域が取れない場合は、unknownと判定する
-
-    if len(contours) <=2 or len(contours) >=9: # unknown判定
-        print("Cannot recognize edge. It is not airplane.")
-        return (999, 999), 999, frontback_flag
-
-    # 最大の領域と二番目の領域を推定
-    max_id, second_id = compare_area(contours)
-    max_area = cv2.contourArea(contours[max_id])
-    second_area = cv2.contourArea(contours[second_id])
-
-    if second_area >= 800:
-        frontback_flag = "back"
-        print("This airplane is backward!!!!")
-        tmp = max_id
-        max_id = second_id
-        second_id = tmp
-        max_area = cv2.contourArea(contours[max_id])
-        second_area = cv2.contourArea(contours[second_id])
-
-    if max_id == 999: # areasizeがあまりに離れている場合はunknown判定する
-        print("Area size default. It is unknown.")
-        return (999, 999), 999, frontback_flag
-
-    # 各領域の重心を求めて、その角度を算出
-    pt1 = get_center(contours, max_id)
-    pt2 = get_center(contours, second_id)
-
-    print("tail_areasize", max_area, "head_areasize", second_area, "tail_position", pt1, "head_position", pt2)
-
-    # yの差分がマイナスのときは処理を変える
-    # 角度は右向きが0度で時計回り
-    if (pt2[1] - pt1[1]) >= 0:
-        angle = math.atan2(pt2[1] - pt1[1], pt2[0] - pt1[0])
-    else:
-        angle = math.atan2(pt1[1] - pt2[1], pt2[0] - pt1[0])
-        angle = -angle
-    angle_deg = angle * 60
-
-
-    pt = get_point(image_gray, angle_deg, frontback_flag, contours[max_id])
-
-    return pt, angle_deg, frontback_flag
-
-def get_center(contours, id):
-    maxCont = contours[id]
-    mu = cv2.moments(maxCont)
-    x, y = int(mu["m10"] / mu["m00"]), int(mu["m01"] / mu["m00"])
-
-    return x, y
-
-def get_point(image, angle_deg, frontback_flag, contours):
-    angle_rad = (angle_deg / 180.0) * np.pi
-
-    height = image.shape[0]
-    width = image.shape[1]
-
-    #回転のパラメータ
-    center = (int(width/2), int(height/2))
-    scale = 1.0
-
-    # 変換行列を作成
-    trans = cv2.getRotationMatrix2D(center, angle_deg , scale)
-
-    #アフィン変換
-    new_image_gray = cv2.warpAffine(image, trans, (width,height))
-
-    # 輪郭の検出
-    retval, image_bw = cv2.threshold(new_image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-    contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    max_id, second_id = compare_area(contours)
-
-    # 後ろ向きの際はidを入れ替える
-    if frontback_flag == "back":
-        max_id = second_id
-
-    # エッジ領域から右端を抽出
-    pt = get_rightedge(new_image_gray, contours[max_id], frontback_flag)
-
-    # アフィン変換前の画素と対応付ける
-    pt_trans = Correspondence(image, pt, trans)
-
-#     # debug用
-#     cv2.circle(new_image_gray, (pt[0], pt[1]), 3, (255, 0, 0), thickness=-1)
-#     print("回転後")
-#     plt.imshow(new_image_gray)
-#     plt.show()
-
-    return pt_trans
-
-def get_rightedge(image, contours, frontback_flag):
-
-    image_gray = image.copy()
-
-    if frontback_flag == "front":
-        max_x = 0
-        pt = (0, 0)
-        for i in range(len(contours)):
-            x = contours[i][0][0]
-            y = contours[i][0][1]
-            if max_x < x:
-                max_x = x
-                pt = (x - 8, y - 10)
-
-    elif frontback_flag == "back":
-        max_x = 0
-        pt = (0, 0)
-        for i in range(len(contours)):
-            x = contours[i][0][0]
-            y = contours[i][0][1]
-            if max_x < x:
-                max_x = x
-                pt = (x - 8, y - 10)
-
-    return pt
-
-def compare_area(contours):
-    # 輪郭の面積比較
-    max_area = 0
-    second_area = 0
-    max_id = 0
-    second_id = 0
-
-    # 面積が最大の領域と2番めの領域を算出
-    for num in range(len(contours)):
-        if cv2.contourArea(contours[num]) < 3000: # 全体を領域と認識してしまうため、閾値以上の面積を持つ領域は無視する
-            if max_area < cv2.contourArea(contours[num]):
-                second_area = max_area
-                second_id = max_id
-                max_area = cv2.contourArea(contours[num])
-                max_id = num
-
-            elif second_area < cv2.contourArea(contours[num]):
-                second_area = cv2.contourArea(contours[num])
-                second_id = num
-
-            if second_area >= max_area:
-                second_area = 0
-                max_area = 0
+# 膨張処理
+# 画素ごとのループは遅いため，積分画像を用いた morphology の実装を利用する
+# dst を渡すと結果をその配列に書き込み，frame を渡すと作業用の配列を使い回す
+def expansion(src, ksize=4, dst=None, frame=frame_context.NULL_FRAME):
+    return morphology.expansion(src, ksize=ksize, dst=dst, frame=frame)
 
-        # else: # 全体の領域があまりにも違う場合はunknown判定にする
-        #     all_area = cv2.contourArea(contours[num])
-        #     print("all_area", all_area)
-        #     if 35000 > all_area > 40000:
-        #         print("area size default. It is unknown.")
-        #         return 999, 999
-
-    return max_id, second_id
+# 収縮処理
+def contraction(src, ksize=11, dst=None, frame=frame_context.NULL_FRAME):
+    return morphology.contraction(src, ksize=ksize, dst=dst, frame=frame)
 
+# トリミング処理
+def trim(src, trim_size_x=15, trim_size_y=15, dst=None):
+    return morphology.trim(src, trim_size_x=trim_size_x, trim_size_y=trim_size_y, dst=dst)
+
+# エッジ検出したカラー画像を膨張・収縮・トリミングしたグレー画像にする (estimate_grasppose_airplane の入力)
+# params: PREPROCESS_PARAMS のキーで設定を上書きする (指定しない場合は load_config で読み込んだ設定)
+def preprocess(image_bgr, frame=frame_context.NULL_FRAME, **params):
+    params = dict(_preprocess_params, **params)
+
+    shape = image_bgr.shape[:2]
+    image_gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY, dst=frame.buffer("pre_gray", shape))
+    image_gray = morphology.expansion(image_gray, ksize=params["expansion_ksize"],
+                                      threshold=params["expansion_threshold"],
+                                      dst=frame.buffer("pre_expansion", shape), frame=frame)
+    image_gray = morphology.contraction(image_gray, ksize=params["contraction_ksize"],
+                                        dst=frame.buffer("pre_contraction", shape), frame=frame)
+
+    return morphology.trim(image_gray, dst=image_gray)
+
+# timer: profiling.StageTimer を渡すと各段階の処理時間を記録する
+# point_mode: 把持点の求め方 (get_point を参照)
+# details: 辞書を渡すと輪郭の数・尾と頭の面積・2つの領域を囲む矩形 (x, y, w, h) を書き込む
+# frame: frame_context.FrameContext を渡すと画像サイズの作業用配列をフレーム間で使い回す
+def estimate_grasppose_airplane(image_gray, image_edge, timer=None, point_mode="warp", details=None, frame=None):
+    return _estimator.estimate(image_gray, image_edge, timer=timer, point_mode=point_mode, details=details,
+                               frame=frame)
+
+# 推定結果を airplane_estimator.GraspResult (状態と診断用の値を含む) で返す
+def estimate_grasppose_airplane_result(image_gray, image_edge, timer=None, point_mode="warp", frame=None):
+    return _estimator.estimate_result(image_gray, image_edge, timer=timer, point_mode=point_mode, frame=frame)
+
+# 小数の精度で推定する (AirplaneEstimator.estimate_precise を参照)
+# 戻り値: airplane_estimator.PreciseGrasp．推定できない場合は None
+# result.to_tuple() は従来と同じ型に変換するだけで，値は estimate_grasppose_airplane の結果とは異なる
+def estimate_grasppose_airplane_precise(image_gray, image_edge, timer=None, frame=None):
+    return _estimator.estimate_precise(image_gray, image_edge, timer=timer, frame=frame)
+
+# 1枚の画像に写っている複数のairplaneの把持点を推定する
+# 戻り値: (把持点, 角度, 表裏) のリスト (AirplaneEstimator.estimate_all を参照)
+def estimate_grasppose_airplanes(image_gray, image_edge, timer=None, frame=None, max_distance=3.0, min_ratio=0.2):
+    return _estimator.estimate_all(image_gray, image_edge, timer=timer, frame=frame, max_distance=max_distance,
+                                   min_ratio=min_ratio)
+
+get_center = airplane_estimator.get_center
+get_rightedge = airplane_estimator.get_rightedge
+
+# point_mode:
+#   "warp"   画像全体を回転し，輪郭を抽出し直して右端を求める (従来の方法)
+#   "points" contours (選択済みの領域の輪郭) の点だけを回転して右端を求める
+def get_point(image, angle_deg, frontback_flag, contours, timer=None, point_mode="warp", frame=None):
+    return _estimator.get_point(image, angle_deg, frontback_flag, contours, timer=timer, point_mode=point_mode,
+                                frame=frame)
+
+# 面積が3000以上の領域は無視する
+def compare_area(contours, stats=None):
+    return _estimator.compare_area(contours, stats)
+
+# 許容範囲は backprojection.PICO_WINDOW
 def Correspondence(image, pt, trans):
-
-    for h in range(image.shape[0]):
-        for w in range(image.shape[1]):
-            # 各画素をアフィン変換し、変換後の座標を得る
-            tmp_pt = (w, h, 1)
-            check = np.dot(trans, tmp_pt)
-            check = (int(check[0]), int(check[1]))
-
-            # 変換後の座標がパターン認識の座標と等しい（近い）ければ、そこが対応付けられた変換前の座標
-            if pt[0]-2 < check[0] <= pt[0] and pt[1] <= check[1] < pt[1]+2:
-                corr_pt = (tmp_pt[0], tmp_pt[1])
-                if check == pt: # 同一の座標を見つけたらそこで終了
-                    return corr_pt
-
-    return corr_pt
+    return _estimator.correspondence(image, pt, trans)
 
 if __name__ == '__main__':
 
@@ -270,6 +134,7 @@ if __name__ == '__main__':
         # 確認と表示用
         image_result = cv2.circle(image_edge, (grasp_pos[0], grasp_pos[1]), 3, (255, 0, 0), thickness=-1)
         print("grasp_position", grasp_pos, "angle", angle)
+        # import matplotlib.pyplot as plt
         # plt.imshow(image_result)
         # plt.show()
         cv2.imshow("image_result", image_result)
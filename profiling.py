@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 把持点推定の各処理段階の処理時間とメモリ確保量を計測する
+#
+# 推定関数に timer=StageTimer() を渡すと，各段階の処理時間[s]を記録する．
+# memory=True の場合は tracemalloc を用いて各段階で新たに確保したメモリのピーク[byte]も記録する．
+# timer を渡さない場合は何もしない NULL_TIMER が使われるため，計測のコストはほぼかからない．
+#
+# 集計: python profiling.py result.jsonl
+#   batch_grasp.py --profile の出力から，段階ごとの処理時間のパーセンタイルを表示する
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTimer:
+    # 計測を行わないタイマー
+    enabled = False
+
+    def __init__(self):
+        self._stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+
+NULL_TIMER = NullTimer()
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        if self.timer.memory:
+            tracemalloc.reset_peak()
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        alloc = None
+        if self.timer.memory:
+            alloc = tracemalloc.get_traced_memory()[1] - self.memory_start
+        self.timer.add(self.name, elapsed, alloc)
+        return False
+
+
+class StageTimer:
+    enabled = True
+
+    # sink: flush時に各段階の計測結果 (辞書) を受け取る関数
+    # memory: Trueの場合は tracemalloc でメモリ確保量も計測する
+    def __init__(self, sink=None, memory=False):
+        self.sink = sink
+        self.memory = memory
+        self.stages = {}
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    # 同じ名前の段階が複数回実行された場合は合計する
+    def add(self, name, elapsed, alloc=None):
+        record = self.stages.get(name)
+        if record is None:
+            record = {"time": 0.0, "calls": 0}
+            if alloc is not None:
+                record["alloc"] = 0
+            self.stages[name] = record
+        record["time"] += elapsed
+        record["calls"] += 1
+        if alloc is not None:
+            record["alloc"] = max(record["alloc"], alloc)
+
+    # 1フレーム分の計測結果を返してリセットする (sinkがあれば渡す)
+    def flush(self):
+        stages, self.stages = self.stages, {}
+        if self.sink is not None:
+            self.sink(stages)
+
+        return stages
+
+
+# 複数フレームの計測結果から段階ごとのパーセンタイルを求める
+# records: StageTimer.flush() の結果のリスト
+def summarize(records, percentiles=(50, 90, 99)):
+    times = {}
+    allocs = {}
+    for stages in records:
+        for name, record in stages.items():
+            times.setdefault(name, []).append(record["time"])
+            if "alloc" in record:
+                allocs.setdefault(name, []).append(record["alloc"])
+
+    summary = {}
+    for name, values in times.items():
+        values = np.array(values) * 1000.0
+        row = {"count": len(values), "mean_ms": float(values.mean())}
+        for p in percentiles:
+            row["p{}_ms".format(p)] = float(np.percentile(values, p))
+        if name in allocs:
+            row["max_alloc"] = int(max(allocs[name]))
+        summary[name] = row
+
+    return summary
+
+
+def print_summary(summary, out=sys.stdout):
+    columns = None
+    for name, row in sorted(summary.items(), key=lambda item: -item[1]["mean_ms"]):
+        if columns is None:
+            columns = list(row)
+            out.write("{:20s}".format("stage") + "".join("{:>12s}".format(c) for c in columns) + "\n")
+        values = []
+        for c in columns:
+            v = row.get(c, "")
+            values.append("{:>12.3f}".format(v) if isinstance(v, float) else "{:>12}".format(v))
+        out.write("{:20s}".format(name) + "".join(values) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="aggregate per-stage timings of batch_grasp.py --profile")
+    parser.add_argument("records", nargs="+", help="JSON lines files written by batch_grasp.py --profile")
+    args = parser.parse_args(argv)
+
+    records = []
+    for path in args.records:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if "stages" in record:
+                    records.append(record["stages"])
+
+    if not records:
+        print("no stage records found")
+        return
+    print_summary(summarize(records))
+
+
+if __name__ == "__main__":
+    main()
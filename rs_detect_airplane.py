@@ -1,207 +1,118 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-# %% import
+# RealSense 用の把持点推定
+# 処理の本体は airplane_estimator にあり，ここでは "R-plane" のマスクを用いる推定器を呼び出す
 
-import cv2
-import numpy as np
-import math
-import traceback
+# %% import
 
-import matplotlib.pyplot as plt
+# 起動を速くするため，モジュールの読み込み時には cv2 と numpy 以外の重いライブラリを読み込まない
+# (matplotlib などの表示用のライブラリは，使う場合に __main__ の中で読み込む)
 
-# %% compare_area
-# 領域すべてを比較し，1番大きい領域と2番目に大きい領域のidを返す
-
-def compare_area(contours):
-    # 輪郭の面積比較
-    max_area = 0
-    second_area = 0
-    max_id = 0
-    second_id = 0
-
-    # 面積が最大の領域と2番めの領域を算出
-    for num in range(len(contours)):
-        if cv2.contourArea(contours[num]) < 30000: # 全体を領域と認識してしまうため、閾値以上の面積を持つ領域は無視する
-            if max_area < cv2.contourArea(contours[num]):
-                second_area = max_area
-                second_id = max_id
-                max_area = cv2.contourArea(contours[num])
-                max_id = num
-
-            elif second_area < cv2.contourArea(contours[num]):
-                second_area = cv2.contourArea(contours[num])
-                second_id = num
-
-            if second_area >= max_area:
-                second_area = 0
-                max_area = 0
-
-        # else: # 全体の領域があまりにも違う場合はunknown判定にする
-        #     all_area = cv2.contourArea(contours[num])
-        #     print("all_area", all_area)
-        #     if 35000 > all_area > 40000:
-        #         print("area size default. It is unknown.")
-        #         return 999, 999
-
-    return max_id, second_id
+import cv2
 
-# %% get point
-def get_point(image, angle_deg, frontback_flag, contours):
-    angle_rad = (angle_deg / 180.0) * np.pi
+import airplane_estimator
+import depth_grasp
 
-    height = image.shape[0]
-    width = image.shape[1]
+_estimator = airplane_estimator.create_estimator("rs")
 
-    #回転のパラメータ
-    center = (int(width/2), int(height/2))
-    scale = 1.0
 
-    # 変換行列を作成
-    trans = cv2.getRotationMatrix2D(center, angle_deg , scale)
+# 設定ファイル (tune_airplane.py の出力) の "rs" の設定で推定器を作り直す
+def load_config(path):
+    global _estimator
+    config = airplane_estimator.load_config(path, "rs")
+    _estimator = airplane_estimator.create_estimator("rs", **config.get("mask", {}))
 
-    #アフィン変換
-    new_image_gray = cv2.warpAffine(image, trans, (width,height))
 
-    # 輪郭の検出
-    retval, image_bw = cv2.threshold(new_image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-    contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    max_id, second_id = compare_area(contours)
+# threshold_r が None または設定と同じ場合は設定どおりの推定器を，
+# 異なる場合は閾値だけを変えた推定器を返す
+def _select_estimator(threshold_r):
+    estimator = _estimator
+    if threshold_r is None or threshold_r == estimator.mask.threshold_r:
+        return estimator
 
-    # 後ろ向きの際はidを入れ替える
-    if frontback_flag == "back":
-        max_id = second_id
+    mask = estimator.mask
+    return airplane_estimator.create_estimator("rs", threshold_r=threshold_r, ksize=mask.ksize,
+                                               iterations=mask.iterations)
 
-    # エッジ領域から右端を抽出
-    pt = get_rightedge(new_image_gray, contours[max_id], frontback_flag)
+# 推定に使う推定器 (airplane_estimator.AirplaneEstimator) を返す (threshold_r は _select_estimator と同じ)
+def get_estimator(threshold_r=None):
+    return _select_estimator(threshold_r)
 
-    # アフィン変換前の画素と対応付ける
-    pt_trans = Correspondence(image, pt, trans)
+# %% compare_area
+# 領域すべてを比較し，1番大きい領域と2番目に大きい領域のidを返す (面積が30000以上の領域は無視する)
 
-#     # debug用
-#     cv2.circle(new_image_gray, (pt[0], pt[1]), 3, (255, 0, 0), thickness=-1)
-#     print("回転後")
-#     plt.imshow(new_image_gray)
-#     plt.show()
+def compare_area(contours, stats=None):
+    return _estimator.compare_area(contours, stats)
 
-    return pt_trans
+# %% get point
+# point_mode:
+#   "warp"   画像全体を回転し，輪郭を抽出し直して右端を求める (従来の方法．従来と同じ結果を返すために残している)
+#            回転後の画像の最大の領域を使うため，把持点が物体の外 (画像の端など) になることが多い
+#   "points" contours (選択済みの領域の輪郭) の点だけを回転して右端を求める
+# 2つの方法の把持点は一致しない (imgs/airplanes では差の中央値が約210px．bench_point_mode.py で比べる)
+def get_point(image, angle_deg, frontback_flag, contours, timer=None, point_mode="warp", frame=None):
+    return _estimator.get_point(image, angle_deg, frontback_flag, contours, timer=timer, point_mode=point_mode,
+                                frame=frame)
+
+get_center = airplane_estimator.get_center
+get_rightedge = airplane_estimator.get_rightedge
+
+# 許容範囲は backprojection.RS_WINDOW
+def Correspondence(image, pt, trans):
+    return _estimator.correspondence(image, pt, trans)
 
-def get_center(contours, id):
-    maxCont = contours[id]
-    mu = cv2.moments(maxCont)
-    x, y = int(mu["m10"] / mu["m00"]), int(mu["m01"] / mu["m00"])
 
-    return x, y
+# %% detect airplane
 
-def get_rightedge(image, contours, frontback_flag):
+# timer: profiling.StageTimer を渡すと各段階の処理時間を記録する
+# point_mode: 把持点の求め方 (get_point を参照)
+# details: 辞書を渡すと輪郭の数・尾と頭の面積・2つの領域を囲む矩形 (x, y, w, h) を書き込む
+# frame: frame_context.FrameContext を渡すと画像サイズの作業用配列をフレーム間で使い回す
+# threshold_r: R平面の閾値 (None の場合は設定ファイルの値．読み込んでいない場合は40)
+def estimate_grasppose_airplane(image_bgr, threshold_r=None, timer=None, point_mode="warp", details=None, frame=None):
+    estimator = _select_estimator(threshold_r)
 
-    image_gray = image.copy()
+    return estimator.estimate(image_bgr, timer=timer, point_mode=point_mode, details=details, frame=frame)
 
-    if frontback_flag == "front":
-        max_x = 0
-        pt = (0, 0)
-        for i in range(len(contours)):
-            x = contours[i][0][0]
-            y = contours[i][0][1]
-            if max_x < x:
-                max_x = x
-                pt = (x - 8, y - 10)
 
-    elif frontback_flag == "back":
-        max_x = 0
-        pt = (0, 0)
-        for i in range(len(contours)):
-            x = contours[i][0][0]
-            y = contours[i][0][1]
-            if max_x < x:
-                max_x = x
-                pt = (x - 8, y - 10)
+# 推定結果を airplane_estimator.GraspResult (状態と診断用の値を含む) で返す
+def estimate_grasppose_airplane_result(image_bgr, threshold_r=None, timer=None, point_mode="warp", frame=None):
+    estimator = _select_estimator(threshold_r)
 
-    return pt
+    return estimator.estimate_result(image_bgr, timer=timer, point_mode=point_mode, frame=frame)
 
-def Correspondence(image, pt, trans):
+# 位置合わせ済みの深度画像も用いて，3次元の把持点まで求める
+# depth: カラー画像と同じ大きさの深度画像 (uint16 または float[m])
+# intrinsics: depth_grasp.CameraIntrinsics
+# depth_radius: 把持点の周囲の深度の中央値を求める窓の半径[px]
+# point_mode: 既定は "points"．"warp" (従来の方法) の把持点は物体の外 (画像の端など) になることが多く，
+#             そこで得た深度は airplane の深度ではないため，3次元の把持点には使わないこと
+# 戻り値: GraspResult (point_3d に (x, y, z)[m]，深度が得られない場合は None)
+def estimate_grasppose_airplane_3d(image_bgr, depth, intrinsics, threshold_r=None, timer=None, point_mode="points",
+                                   frame=None, depth_radius=3):
+    if depth.shape[:2] != image_bgr.shape[:2]:
+        raise ValueError("depth {} is not aligned with image {}".format(depth.shape[:2], image_bgr.shape[:2]))
 
-    for h in range(image.shape[0]):
-        for w in range(image.shape[1]):
-            # 各画素をアフィン変換し、変換後の座標を得る
-            tmp_pt = (w, h, 1)
-            check = np.dot(trans, tmp_pt)
-            check = (int(check[0]), int(check[1]))
+    result = estimate_grasppose_airplane_result(image_bgr, threshold_r=threshold_r, timer=timer,
+                                                point_mode=point_mode, frame=frame)
 
-            # 変換後の座標がパターン認識の座標と等しい（近い）ければ、そこが対応付けられた変換前の座標
-            if pt[0]-20 < check[0] <= pt[0]+20 and pt[1]-20 <= check[1] < pt[1]+20:
-                corr_pt = (tmp_pt[0], tmp_pt[1])
-                if check == pt: # 同一の座標を見つけたらそこで終了
-                    return corr_pt
+    return depth_grasp.attach_depth(result, depth, intrinsics, radius=depth_radius)
 
-    return corr_pt
+# 小数の精度で推定する (AirplaneEstimator.estimate_precise を参照)
+# 戻り値: airplane_estimator.PreciseGrasp．推定できない場合は None
+# result.to_tuple() は従来と同じ型に変換するだけで，値は estimate_grasppose_airplane の結果とは異なる
+def estimate_grasppose_airplane_precise(image_bgr, threshold_r=None, timer=None, frame=None):
+    estimator = _select_estimator(threshold_r)
 
+    return estimator.estimate_precise(image_bgr, timer=timer, frame=frame)
 
-# %% detect airplane
+# 1枚の画像に写っている複数のairplaneの把持点を推定する
+# 戻り値: (把持点, 角度, 表裏) のリスト (AirplaneEstimator.estimate_all を参照)
+def estimate_grasppose_airplanes(image_bgr, threshold_r=None, timer=None, frame=None, max_distance=3.0, min_ratio=0.2):
+    estimator = _select_estimator(threshold_r)
 
-def estimate_grasppose_airplane(image_bgr, threshold_r=40):
-    # write_path = "C:/Users/fryuz/prog/hma/imgs/airplanes/temp"
-    # 色領域の抜き出し（R平面を用いる）
-    image_b, _, image_r = cv2.split(image_bgr)
-    _, r_binary = cv2.threshold(image_r, threshold_r, 255, cv2.THRESH_BINARY)
-    r_binary = cv2.bitwise_not(r_binary)
-
-    kernel = np.ones((5, 5), np.uint8)
-    erosion = cv2.erode(r_binary, kernel, iterations=1)
-    image_mask = cv2.dilate(erosion, kernel, iterations=6)
-
-    # 輪郭の検出
-    contours, hierarchy = cv2.findContours(image_mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    frontback_flag = "front"
-
-    # # 裏向きは膨張と収縮のパラメータを変更する
-    # if len(contours) <= 2:
-    #     print("Retry edge")
-    #
-    #     image_con = image_edge.copy()
-    #     image_con = cv2.cvtColor(image_con, cv2.COLOR_BGR2GRAY)
-    #
-    #     image_con = expansion(image_con, ksize = 5)
-    #     image_con = contraction(image_con, ksize = 11)
-    #     image_con = trim(image_con)
-    #
-    #     image_gray = image_con.copy()
-    #     retval, image_bw = cv2.threshold(image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-    #     contours, hierarchy = cv2.findContours(image_bw, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    #     # これでも正常に領域が取れない場合は、unknownと判定する
-
-    if len(contours) <2 or len(contours) >=9: # unknown判定
-        print("Cannot recognize edge. It is not airplane.")
-        return (999, 999), 999, frontback_flag
-
-    # 最大の領域と二番目の領域を推定
-    max_id, second_id = compare_area(contours)
-    # print(max_id, second_id)
-    max_area = cv2.contourArea(contours[max_id])
-    second_area = cv2.contourArea(contours[second_id])
-
-    # 各領域の重心を求めて、その角度を算出
-    pt1 = get_center(contours, max_id)
-    pt2 = get_center(contours, second_id)
-
-    # yの差分がマイナスのときは処理を変える
-    # 角度は右向きが0度で時計回り
-    if (pt2[1] - pt1[1]) >= 0:
-        angle = math.atan2(pt2[1] - pt1[1], pt2[0] - pt1[0])
-    else:
-        angle = math.atan2(pt1[1] - pt2[1], pt2[0] - pt1[0])
-        angle = -angle
-    angle_deg = angle * 60
-
-    pt = get_point(image_r, angle_deg, frontback_flag, contours[max_id])
-    # temp = cv2.cvtColor(image_mask, cv2.COLOR_GRAY2BGR)
-    # cv2.drawContours(temp, contours, -1, (255, 255, 0), 3)
-    # cv2.imwrite(write_path + "_mask_visualize.jpg", temp)
-
-    print("tail_areasize", max_area, "head_areasize", second_area, "tail_position", pt1, "head_position", pt2)
-    print("angle", angle_deg, "point", pt)
-
-    return pt, angle_deg, frontback_flag
+    return estimator.estimate_all(image_bgr, timer=timer, frame=frame, max_distance=max_distance, min_ratio=min_ratio)
 
 
 # %% do
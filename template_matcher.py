@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+#==================================================
+
+## @file template_matcher.py
+## @brief 複数のテンプレートを1回の画像FFTでまとめて照合するクラス
+
+#==================================================
+
+
+import cv2
+import numpy as np
+
+
+class MultiTemplateMatcher:
+
+    #==================================================
+
+    ## @fn __init__
+    ## @brief テンプレートを登録する
+    ## @param templates キーとcv2型の画像の辞書
+    ##
+    ## TM_CCOEFFの相関値は Σ T'(x', y') I(x + x', y + y') (T'は平均を引いたテンプレート)
+    ## と等しいため，画像のFFTを1回だけ計算し，各テンプレートとの積を逆変換して求める
+    ## テンプレートのFFTは画像のサイズごとに保持する
+
+    #==================================================
+    def __init__(self, templates):
+        self.templates = dict(templates)
+        self.template_ffts = {}
+
+
+    #==================================================
+
+    ## @fn set_template
+    ## @brief テンプレートを登録または置き換える (置き換えた場合はFFTのキャッシュを破棄)
+
+    #==================================================
+    def set_template(self, key, template):
+        if self.templates.get(key) is template:
+            return
+
+        self.templates[key] = template
+        for cache_key in [k for k in self.template_ffts if k[0] == key]:
+            del self.template_ffts[cache_key]
+
+
+    #==================================================
+
+    ## @fn template_fft
+    ## @brief 平均を引いたテンプレートの共役FFTを返す (FFTのサイズごとにキャッシュ)
+
+    #==================================================
+    def template_fft(self, key, fft_shape):
+        cache_key = (key, fft_shape)
+        spectrum = self.template_ffts.get(cache_key)
+        if spectrum is None:
+            template = self.templates[key].astype(np.float64)
+            if template.ndim == 2:
+                template = template[:, :, np.newaxis]
+            template = template - template.mean(axis=(0, 1))
+            spectrum = np.conj(np.fft.rfft2(template, s=fft_shape, axes=(0, 1)))
+            self.template_ffts[cache_key] = spectrum
+
+        return spectrum
+
+
+    #==================================================
+
+    ## @fn match
+    ## @brief 登録したすべてのテンプレートとの照合結果を返す
+    ## @param img cv2型の画像
+    ## @param keys 照合するテンプレートのキー (Noneの場合はすべて)
+    ## @return table キーと(最大値, 最大値の座標)の辞書
+    ##               cv2.matchTemplate(TM_CCOEFF) + cv2.minMaxLocの max_val, max_loc に相当
+
+    #==================================================
+    def match(self, img, keys=None):
+        if keys is None:
+            keys = list(self.templates)
+
+        height, width = img.shape[:2]
+        fft_shape = (cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width))
+
+        image = img.astype(np.float64)
+        if image.ndim == 2:
+            image = image[:, :, np.newaxis]
+        image_fft = np.fft.rfft2(image, s=fft_shape, axes=(0, 1))
+
+        table = {}
+        for key in keys:
+            t_height, t_width = self.templates[key].shape[:2]
+            if t_height > height or t_width > width:
+                raise ValueError("template {} is larger than the image".format(key))
+
+            spectrum = (image_fft * self.template_fft(key, fft_shape)).sum(axis=2)
+            res = np.fft.irfft2(spectrum, s=fft_shape)[:height - t_height + 1, :width - t_width + 1]
+            y, x = np.unravel_index(np.argmax(res), res.shape)
+            table[key] = (float(res[y, x]), (int(x), int(y)))
+
+        return table
+
+
+#==================================================
+
+## @fn build_pyramid
+## @brief cv2.pyrDownで縮小した画像のリストを返す
+## @return pyramid [原画像, 1/2, 1/4, ...] (長さ levels + 1)
+
+#==================================================
+def build_pyramid(img, levels):
+    pyramid = [img]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+
+    return pyramid
+
+
+class PyramidTemplateMatcher:
+
+    #==================================================
+
+    ## @fn __init__
+    ## @brief 縮小画像で照合してから，原画像ではピーク周辺だけを照合する
+    ## @param levels 縮小の段数
+    ## @param peaks 原画像で探索する縮小画像上のピークの数
+    ## @param min_template_size 縮小後のテンプレートの最小サイズ (これより小さくなる場合は段数を減らす)
+
+    #==================================================
+    def __init__(self, levels=2, peaks=3, min_template_size=8):
+        self.levels = levels
+        self.peaks = peaks
+        self.min_template_size = min_template_size
+        self.templates = {}
+        self.template_pyramids = {}
+
+
+    #==================================================
+
+    ## @fn set_template
+    ## @brief テンプレートを登録または置き換える
+
+    #==================================================
+    def set_template(self, key, template):
+        if self.templates.get(key) is template:
+            return
+
+        self.templates[key] = template
+        self.template_pyramids[key] = build_pyramid(template, self.levels)
+
+
+    #==================================================
+
+    ## @fn usable_level
+    ## @brief 画像とテンプレートの大きさから使用できる縮小の段数を求める
+
+    #==================================================
+    def usable_level(self, img_pyramid, key):
+        template_pyramid = self.template_pyramids[key]
+        level = min(self.levels, len(img_pyramid) - 1)
+        while level > 0:
+            t_height, t_width = template_pyramid[level].shape[:2]
+            height, width = img_pyramid[level].shape[:2]
+            if min(t_height, t_width) >= self.min_template_size and t_height <= height and t_width <= width:
+                break
+            level -= 1
+
+        return level
+
+
+    #==================================================
+
+    ## @fn coarse_match
+    ## @brief 縮小画像でテンプレートを照合し，上位のピークを返す
+    ## @param img_pyramid build_pyramidで作成した画像のリスト
+    ## @return level 使用した縮小の段数
+    ## @return peaks [(相関値, (x, y))] 相関値の降順
+
+    #==================================================
+    def coarse_match(self, img_pyramid, key):
+        level = self.usable_level(img_pyramid, key)
+        template = self.template_pyramids[key][level]
+        res = cv2.matchTemplate(img_pyramid[level], template, cv2.TM_CCOEFF)
+
+        # 最大値を取り出し，その周辺を抑制することを繰り返してピークを求める
+        suppress_h = max(template.shape[0] // 2, 1)
+        suppress_w = max(template.shape[1] // 2, 1)
+        peaks = []
+        for _ in range(self.peaks):
+            _, max_val, _, max_loc = cv2.minMaxLoc(res)
+            if peaks and max_val == -np.inf:
+                break
+            peaks.append((max_val, max_loc))
+            x, y = max_loc
+            res[max(y - suppress_h, 0):y + suppress_h + 1, max(x - suppress_w, 0):x + suppress_w + 1] = -np.inf
+
+        return level, peaks
+
+
+    #==================================================
+
+    ## @fn refine
+    ## @brief 縮小画像上のピークの周辺だけを原画像で照合する
+    ## @return max_val, max_loc cv2.minMaxLocの結果に相当
+
+    #==================================================
+    def refine(self, img, key, level, peaks):
+        template = self.templates[key]
+        t_height, t_width = template.shape[:2]
+        height, width = img.shape[:2]
+        scale = 2 ** level
+        radius = scale + 1
+
+        best_val, best_loc = -np.inf, (0, 0)
+        for _, (x, y) in peaks:
+            x0 = min(max(x * scale - radius, 0), width - t_width)
+            y0 = min(max(y * scale - radius, 0), height - t_height)
+            x1 = min(x * scale + radius + t_width, width)
+            y1 = min(y * scale + radius + t_height, height)
+
+            res = cv2.matchTemplate(img[y0:y1, x0:x1], template, cv2.TM_CCOEFF)
+            _, max_val, _, max_loc = cv2.minMaxLoc(res)
+            if max_val > best_val:
+                best_val, best_loc = max_val, (max_loc[0] + x0, max_loc[1] + y0)
+
+        return best_val, best_loc
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# ラベル付きのフレームを用いて，airplaneの把持点推定のパラメータ (R平面の閾値・膨張収縮の窓の大きさなど) を探索する
+#
+# 使い方:
+#   python tune_airplane.py --sensor rs -o airplane_config.json
+#   python tune_airplane.py --sensor pico --grid preprocess.expansion_threshold=4,5,6 --min-accuracy 0.95
+#   python batch_grasp.py imgs/airplanes --config airplane_config.json   # 探索した設定で推定する
+#
+# ラベル (--labels) は bench_airplane.py の golden と同じ形式 {センサー: {フレーム名: {"pt", "angle", "flag"}}} で，
+# フレームは --frames のディレクトリから読み込む (既定は golden.json と，rs は imgs/airplanes，pico は imgs/airplanes/pico)．
+# 正解の判定は bench_airplane.py と同じ (把持点のずれ・角度の差が許容範囲内で，表裏が一致)．
+#
+# 1. 探索 (並列): 格子の各点で全フレームを推定し，正解率を求める．
+#    マスクの前半 (rs: R平面の閾値処理，pico: 前処理の膨張) は CACHED_KEYS の値の組ごとに
+#    1フレームにつき1回だけ計算し，残りのパラメータの組み合わせで使い回す．
+#    ワーカープロセスへはこの組を単位として割り当てる．
+# 2. 計測 (逐次): 正解率が --min-accuracy 以上の設定について，キャッシュを使わない通常の推定の
+#    処理時間を計測し，p50 が最も小さい設定を選ぶ (並列に実行している間の計測は他のプロセスの影響を受けるため)．
+# 3. 選んだ設定を -o の設定ファイルに書き込む (ファイル内の他のセンサーの設定はそのまま残す)．
+#    設定ファイルは rs_detect_airplane.load_config / pico_detect_airplane.load_config で読み込める．
+#    条件を満たす設定がない場合は書き込まずに終了コード1で終わる．
+#
+# ラベルがすべて推定失敗の値 ((999, 999), 999) の場合は，検出に失敗する設定ほど正解になってしまうため探索しない．
+# rs では探索の前に，格子の (閾値, ksize, iterations) の各組のマスクが元の rs_detect_airplane の処理
+# (bench_morphology.legacy_r_plane_mask) と画素単位で一致することを先頭のフレームで確かめ，異なる場合は探索しない
+# (morphology.open_mask は偶数の ksize では膨張を1回にまとめずに繰り返す．偶数の ksize もこの確認で扱える)．
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import airplane_estimator
+import bench_airplane
+import bench_morphology
+import frame_context
+import morphology
+import pico_detect_airplane
+
+
+# センサーごとのフレームのディレクトリ (bench_airplane.py と同じ)
+FRAMES_DIRS = {sensor: os.path.dirname(pattern) for sensor, pattern in bench_airplane.FRAME_PATTERNS.items()}
+
+# 探索する格子 ("段階.引数名": 値のリスト)
+#   mask: マスクの段階 (airplane_estimator.RPlaneMask / EdgeMorphologyMask) の引数
+#   preprocess: pico の前処理 (pico_detect_airplane.preprocess) の引数
+GRIDS = {
+    "rs": {
+        "mask.threshold_r": [30, 35, 40, 45, 50],
+        "mask.ksize": [3, 5, 7],
+        "mask.iterations": [4, 5, 6, 7, 8],
+    },
+    "pico": {
+        "preprocess.expansion_ksize": [3, 4, 5],
+        "preprocess.expansion_threshold": [4, 5, 6],
+        "preprocess.contraction_ksize": [9, 11, 13],
+        "mask.expansion_ksize": [5],
+        "mask.contraction_ksize": [11],
+    },
+}
+
+# マスクの前半としてキャッシュする引数
+CACHED_KEYS = {
+    "rs": ("mask.threshold_r",),
+    "pico": ("preprocess.expansion_ksize", "preprocess.expansion_threshold"),
+}
+
+
+# 1フレーム分の計算結果を key ごとに保持する (フレームが変わったら捨てる)
+class FrameCache:
+
+    def __init__(self):
+        self.image = None
+        self.results = {}
+
+    def get(self, image, key, compute):
+        if image is not self.image:
+            self.image = image
+            self.results = {}
+        result = self.results.get(key)
+        if result is None:
+            result = compute()
+            self.results[key] = result
+
+        return result
+
+
+# R平面の2値化の結果を FrameCache から取り出し，収縮・膨張だけを行う RPlaneMask
+class CachedRPlaneMask(airplane_estimator.RPlaneMask):
+
+    def __init__(self, cache, **params):
+        super().__init__(**params)
+        self.cache = cache
+
+    def __call__(self, image, image_edge, timer, frame):
+        image_bw, image_r = self.cache.get(image, ("r_plane", self.threshold_r),
+                                           lambda: morphology.r_plane_threshold(image, self.threshold_r))
+        image_mask = morphology.open_mask(image_bw, self.ksize, self.iterations,
+                                          dst=frame.buffer("r_mask", image_bw.shape))
+        contours, hierarchy = cv2.findContours(image_mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        return contours, image_r
+
+
+# "段階.引数名" の辞書を {段階: {引数名: 値}} に変換する
+def nest(flat):
+    config = {}
+    for key, value in flat.items():
+        section, name = key.split(".", 1)
+        config.setdefault(section, {})[name] = value
+
+    return config
+
+
+# 格子の全ての点を CACHED_KEYS の値の組ごとにまとめる
+# 戻り値: [(キャッシュする値の組, [設定 ("段階.引数名" の辞書), ...]), ...]
+def group_grid(sensor, grid):
+    keys = sorted(grid)
+    groups = {}
+    for values in itertools.product(*(grid[key] for key in keys)):
+        flat = dict(zip(keys, values))
+        cached = tuple(flat[key] for key in CACHED_KEYS[sensor])
+        groups.setdefault(cached, []).append(flat)
+
+    return sorted(groups.items())
+
+
+# キャッシュを使う推定関数 (探索用) を作る
+def cached_estimator(sensor, flat, cache, point_mode):
+    config = nest(flat)
+    if sensor == "rs":
+        params = dict(airplane_estimator.SENSOR_PARAMS["rs"])
+        params["mask"] = CachedRPlaneMask(cache, **config["mask"])
+        estimator = airplane_estimator.AirplaneEstimator(**params)
+
+        def estimate(image_bgr, frame):
+            return estimator.estimate_result(image_bgr, point_mode=point_mode, frame=frame)
+
+        return estimate
+
+    estimator = airplane_estimator.create_estimator("pico", **config["mask"])
+    pre = config["preprocess"]
+
+    def expand(image_bgr):
+        image_gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+        return morphology.expansion(image_gray, ksize=pre["expansion_ksize"], threshold=pre["expansion_threshold"])
+
+    def estimate(image_bgr, frame):
+        image_expanded = cache.get(image_bgr, ("expansion", pre["expansion_ksize"], pre["expansion_threshold"]),
+                                   lambda: expand(image_bgr))
+        image_gray = morphology.contraction(image_expanded, ksize=pre["contraction_ksize"],
+                                            dst=frame.like("pre_contraction", image_expanded), frame=frame)
+        image_gray = morphology.trim(image_gray, dst=image_gray)
+        return estimator.estimate_result(image_gray, image_bgr, point_mode=point_mode, frame=frame)
+
+    return estimate
+
+
+# キャッシュを使わない通常の推定関数 (処理時間の計測用) を作る
+def plain_estimator(sensor, flat, point_mode):
+    config = nest(flat)
+    estimator = airplane_estimator.create_estimator(sensor, **config["mask"])
+    if sensor == "rs":
+        def estimate(image_bgr, frame):
+            return estimator.estimate_result(image_bgr, point_mode=point_mode, frame=frame)
+    else:
+        def estimate(image_bgr, frame):
+            image_gray = pico_detect_airplane.preprocess(image_bgr, frame=frame, **config["preprocess"])
+            return estimator.estimate_result(image_gray, image_bgr, point_mode=point_mode, frame=frame)
+
+    return estimate
+
+
+# ワーカープロセスごとに1回だけフレームを読み込む
+_frames = None
+
+
+def init_worker(frames):
+    global _frames
+    _frames = frames
+
+
+# キャッシュする値の組1つ分の設定をすべて評価する (ワーカープロセスで実行される)
+# 戻り値: [(設定, 正解したフレーム数, 失敗したフレーム名のリスト), ...]
+def evaluate_group(task):
+    sensor, configs, point_mode, max_shift, max_angle_diff = task
+    cache = FrameCache()
+    frame = frame_context.FrameContext()
+    estimators = [cached_estimator(sensor, flat, cache, point_mode) for flat in configs]
+    failures = [[] for _ in configs]
+
+    # フレームを外側のループにして，キャッシュした結果を全ての設定で使い回す
+    for name, image, expected in _frames:
+        for estimate, failed in zip(estimators, failures):
+            try:
+                actual = bench_airplane.to_record(estimate(image, frame))
+            except Exception:
+                failed.append(name)
+                continue
+            if bench_airplane.match_result(actual, expected, max_shift, max_angle_diff):
+                failed.append(name)
+
+    return [(flat, len(_frames) - len(failed), failed) for flat, failed in zip(configs, failures)]
+
+
+# 1つの設定の処理時間の p50[ms] を計測する
+def measure_latency(estimate, frames, repeat):
+    frame = frame_context.FrameContext()
+    for name, image, expected in frames:
+        estimate(image, frame)
+
+    times = []
+    for _ in range(repeat):
+        for name, image, expected in frames:
+            start = time.perf_counter()
+            estimate(image, frame)
+            times.append(time.perf_counter() - start)
+
+    return float(np.percentile(np.array(times) * 1000.0, 50))
+
+
+# 格子の各マスクが元の rs の処理と一致することを image で確かめ，異なる組のリストを返す
+def check_masks(sensor, grid, image):
+    if sensor != "rs":
+        return []
+    mismatches = []
+    for threshold_r, ksize, iterations in itertools.product(grid["mask.threshold_r"], grid["mask.ksize"],
+                                                            grid["mask.iterations"]):
+        image_bw, _ = morphology.r_plane_threshold(image, threshold_r)
+        actual = morphology.open_mask(image_bw, ksize, iterations)
+        expected = bench_morphology.legacy_r_plane_mask(image, threshold_r, ksize, iterations)
+        if not np.array_equal(actual, expected):
+            mismatches.append("mask.threshold_r={} mask.ksize={} mask.iterations={}".format(
+                threshold_r, ksize, iterations))
+
+    return mismatches
+
+
+# "段階.引数名=値,値,..." を解析する
+def parse_grid_option(text):
+    key, _, values = text.partition("=")
+    if "." not in key or not values:
+        raise argparse.ArgumentTypeError("expected section.name=v1,v2,...: {!r}".format(text))
+
+    return key, [int(value) for value in values.split(",")]
+
+
+def load_frames(frames_dir, labels):
+    frames = []
+    for name in sorted(labels):
+        image = cv2.imread(os.path.join(frames_dir, name))
+        if image is None:
+            print("skip {}: cannot read image".format(name), file=sys.stderr)
+            continue
+        frames.append((name, image, labels[name]))
+
+    return frames
+
+
+def format_config(flat):
+    return " ".join("{}={}".format(key, flat[key]) for key in sorted(flat))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="tune airplane estimation parameters on labelled frames")
+    parser.add_argument("--sensor", choices=sorted(GRIDS), default="rs")
+    parser.add_argument("--frames", help="directory of the labelled frames (default: the sensor's frames)")
+    parser.add_argument("--labels", default=bench_airplane.GOLDEN_PATH, help="labels in the golden.json format")
+    parser.add_argument("--grid", type=parse_grid_option, action="append", default=[],
+                        help="override grid values, e.g. mask.threshold_r=35,40,45")
+    parser.add_argument("--point-mode", choices=("warp", "points"), default="warp")
+    parser.add_argument("--min-accuracy", type=float, default=1.0, help="required fraction of correct frames")
+    parser.add_argument("--max-shift", type=float, default=2.0, help="allowed grasp point shift [px]")
+    parser.add_argument("--max-angle-diff", type=float, default=1.0,
+                        help="allowed error of the legacy angle value (atan2 [rad] x 60, not degrees)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed passes per accepted configuration")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-o", "--output", default="airplane_config.json")
+    args = parser.parse_args(argv)
+
+    labels = (bench_airplane.load_json(args.labels) or {}).get(args.sensor)
+    if not labels:
+        parser.error("no {} labels in {}".format(args.sensor, args.labels))
+    # 推定失敗のラベルしかなければ，検出できない設定が最良になってしまう
+    if all(tuple(label["pt"]) == airplane_estimator.UNKNOWN_POINT for label in labels.values()):
+        parser.error("every {} label in {} is the failure value {}; give labels of frames where the airplane "
+                     "is detected with --labels".format(args.sensor, args.labels, airplane_estimator.UNKNOWN_POINT))
+    frames_dir = args.frames or FRAMES_DIRS[args.sensor]
+    frames = load_frames(frames_dir, labels)
+    if not frames:
+        parser.error("no labelled frames found in {}".format(frames_dir))
+
+    grid = dict(GRIDS[args.sensor])
+    for key, values in args.grid:
+        if key not in grid:
+            parser.error("unknown {} parameter {} (choose from {})".format(args.sensor, key, ", ".join(sorted(grid))))
+        grid[key] = values
+    mismatches = check_masks(args.sensor, grid, frames[0][1])
+    if mismatches:
+        parser.error("the mask differs from the original rs pipeline for: {}".format("; ".join(mismatches)))
+    groups = group_grid(args.sensor, grid)
+    tasks = [(args.sensor, configs, args.point_mode, args.max_shift, args.max_angle_diff) for _, configs in groups]
+
+    # 1. 探索
+    start = time.perf_counter()
+    if args.workers > 1:
+        with multiprocessing.Pool(min(args.workers, len(tasks)), initializer=init_worker,
+                                  initargs=(frames,)) as pool:
+            evaluated = [item for items in pool.imap_unordered(evaluate_group, tasks) for item in items]
+    else:
+        init_worker(frames)
+        evaluated = [item for task in tasks for item in evaluate_group(task)]
+    print("{}: evaluated {} configurations on {} frames in {:.1f} s".format(
+        args.sensor, len(evaluated), len(frames), time.perf_counter() - start))
+
+    required = args.min_accuracy * len(frames)
+    accepted = [(flat, correct) for flat, correct, failed in evaluated if correct >= required]
+    if not accepted:
+        flat, correct, failed = max(evaluated, key=lambda item: item[1])
+        print("FAIL no configuration reaches accuracy {:.2f} (best {:.2f}: {}, failed {})".format(
+            args.min_accuracy, correct / len(frames), format_config(flat), ", ".join(failed)))
+        sys.exit(1)
+
+    # 2. 計測
+    timed = []
+    for flat, correct in accepted:
+        p50 = measure_latency(plain_estimator(args.sensor, flat, args.point_mode), frames, args.repeat)
+        timed.append((p50, -correct, format_config(flat), flat))
+    timed.sort(key=lambda item: item[:3])
+
+    print("{} of {} configurations reach accuracy {:.2f}; fastest:".format(
+        len(timed), len(evaluated), args.min_accuracy))
+    for p50, correct, text, flat in timed[:5]:
+        print("  p50 {:7.3f} ms  accuracy {:.2f}  {}".format(p50, -correct / len(frames), text))
+
+    # 3. 書き込み
+    p50, correct, text, flat = timed[0]
+    sensor_config = nest(flat)
+    sensor_config["tuning"] = {
+        "accuracy": -correct / len(frames),
+        "p50_ms": p50,
+        "frames": len(frames),
+        "labels": os.path.abspath(args.labels),
+        "point_mode": args.point_mode,
+    }
+    config = bench_airplane.load_json(args.output) or {}
+    config[args.sensor] = sensor_config
+    bench_airplane.save_json(args.output, config)
+    print("wrote {} config to {}".format(args.sensor, args.output))
+
+
+if __name__ == "__main__":
+    main()